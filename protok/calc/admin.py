@@ -1,43 +1,216 @@
-from django.contrib import admin
-
-from . import models
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db.models import CharField, Value
+from django.db.models.functions import Concat, Lower
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from . import changelist, models, pricelists, search, sizing
+from .forms import PriceListImportForm
+
+# Сколько ошибок импорта показывать на странице
+IMPORT_ERRORS_SHOWN = 50
+# До скольких найденных клиентов заказы ищутся по индексу client_id
+ORDER_SEARCH_CLIENTS = 5000
+# Сколько самых похожих записей каталога показывать при поиске
+PRODUCT_SEARCH_LIMIT = 1000
+# Наибольший символ Unicode: строки с префиксом меньше префикса с ним
+MAX_CHAR = '\U0010ffff'
+
+
+def _prefix_lookups(field, term):
+    """Условия поиска по началу строки в поле нижнего регистра с индексом
+
+    Строка приводится к нижнему регистру той же функцией базы, что и
+    поле. Начало ищется диапазоном: LIKE на SQLite не учитывает регистр
+    и поэтому не использует индекс.
+    """
+    prefix = Lower(Value(term, output_field=CharField()))
+    return {f'{field}__gte': prefix, f'{field}__lt': Concat(prefix, Value(MAX_CHAR))}
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без полного COUNT(*) и OFFSET для таблиц с миллионами строк"""
+    change_list_template = 'admin/calc/keyset_change_list.html'
+    paginator = changelist.EstimatedCountPaginator
+    show_full_result_count = False
+    # Счетчики фильтров - это COUNT(*) по всей таблице на каждое значение
+    show_facets = admin.ShowFacets.NEVER
+    list_per_page = 50
+
+    def get_changelist(self, request, **kwargs):
+        return changelist.KeysetChangeList
+
+
+class PriceListAdmin(LargeTableAdmin):
+    """Загрузка и выгрузка прайс-листов категории каталога"""
+    change_list_template = 'admin/calc/pricelist_change_list.html'
+    actions = ['export_price_list']
+
+    def get_urls(self):
+        name = f'{self.opts.app_label}_{self.opts.model_name}_import'
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name=name),
+        ] + super().get_urls()
+
+    @admin.action(description='Выгрузить прайс-лист (CSV)')
+    def export_price_list(self, request, queryset):
+        response = StreamingHttpResponse(pricelists.stream_csv(self.model, queryset),
+                                         content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{self.opts.model_name}.csv"'
+        return response
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = PriceListImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = pricelists.import_file(self.model, upload.file, upload.name)
+            except pricelists.PriceListError as error:
+                form.add_error('file', str(error))
+            else:
+                self.message_user(request, f'Загружено строк: {result.imported}, '
+                                           f'с ошибками: {len(result.errors)}')
+                for number, message in result.errors[:IMPORT_ERRORS_SHOWN]:
+                    self.message_user(request, f'Строка {number}: {message}', messages.ERROR)
+                return redirect(f'admin:{self.opts.app_label}_{self.opts.model_name}_changelist')
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Загрузка прайс-листа', opts=self.opts, form=form,
+            columns=pricelists.columns(self.model),
+        )
+        return TemplateResponse(request, 'admin/calc/pricelist_import.html', context)
+
+
+class ProductAdmin(PriceListAdmin):
+    """Категория каталога: поиск и сортировка по производителю и наименованию"""
+    # Поиск идет по триграммному индексу calc.search, а не по search_fields
+    search_fields = ('name', 'manufacturer')
+    search_help_text = 'Наименование или производитель, допускаются опечатки и латиница'
+    # Порядок по уникальному индексу (производитель, наименование)
+    ordering = pricelists.PRODUCT_KEY
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        found = search.products.search(term, models=[self.model], limit=PRODUCT_SEARCH_LIMIT)
+        return queryset.filter(pk__in=[match.entry.pk for match in found]), False
 
 
 @admin.register(models.Transformer)
-class AdminTransformer(admin.ModelAdmin):
+class AdminTransformer(ProductAdmin):
     list_display = ('name', 'manufacturer', 'power', 'transformer_type', 'price')
 
 
 @admin.register(models.HighVoltageDevice)
-class AdminHighVoltageDevice(admin.ModelAdmin):
+class AdminHighVoltageDevice(ProductAdmin):
     list_display = ('name', 'manufacturer', 'voltage', 'input_type', 'equipment_type', 'price')
 
 
 class SectionInline(admin.TabularInline):
     model = models.Section
+    autocomplete_fields = ('fider',)
 
 
 @admin.register(models.LowVoltageDevice)
-class AdminLowVoltageDevice(admin.ModelAdmin):
+class AdminLowVoltageDevice(ProductAdmin):
     inlines = [SectionInline]
     list_display = ('name', 'manufacturer', 'voltage', 'input_type', 'input_device')
 
 
+@admin.register(models.Section)
+class AdminSection(PriceListAdmin):
+    list_display = ('lv_device', 'fider', 'denomination', 'count')
+    list_select_related = ('lv_device', 'fider')
+    autocomplete_fields = ('lv_device', 'fider')
+
+
 @admin.register(models.Client)
-class AdminClient(admin.ModelAdmin):
-    list_display = ('full_name', 'email', 'phone_number')
+class AdminClient(LargeTableAdmin):
+    list_display = ('full_name', 'organization', 'email', 'phone_number')
+    search_fields = ('^organization', '^email')
+    search_help_text = 'Начало наименования организации или e-mail'
+    ordering = ('-pk',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск только по индексированным полям: organization_key и
+        # email_key (первое поле ключа контакта)
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        field = 'email_key' if '@' in term else 'organization_key'
+        return queryset.filter(**_prefix_lookups(field, term)), False
+
+
+class OrderSectionInline(admin.TabularInline):
+    model = models.OrderSection
+    fields = ('name', 'manufacturer', 'denomination', 'count', 'unit_price', 'price')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(models.Order)
-class AdminOrder(admin.ModelAdmin):
-    list_display = ('client', 'transformer', 'lv_device', 'hv_device', 'create_date', 'substation', 'count_price')
+class AdminOrder(LargeTableAdmin):
+    list_display = ('client', 'transformer', 'lv_device', 'hv_device', 'create_date', 'substation',
+                    'total_price', 'confirmed')
+    list_select_related = ('client', 'transformer', 'lv_device', 'hv_device', 'substation')
+    list_filter = ('confirmed',)
+    # Сортировка по связанным моделям и цене перебирала бы все заказы
+    sortable_by = ('create_date',)
+    search_fields = ('=id', '^client__organization')
+    search_help_text = 'Номер заказа или начало наименования организации'
+    autocomplete_fields = ('client', 'substation', 'transformer', 'hv_device', 'lv_device')
+    readonly_fields = ('substation_price', 'transformer_price', 'hv_device_price',
+                       'lv_device_price', 'sections_price', 'total_price', 'load_check',
+                       *models.SALES_DIMENSION_FIELDS)
+    inlines = [OrderSectionInline]
+
+    @admin.display(description='Проверка нагрузки')
+    def load_check(self, obj):
+        if obj.pk is None:
+            return '-'
+        return '; '.join(sizing.check_order(obj)) or 'Замечаний нет'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Заказов миллионы, поэтому номер ищется по первичному ключу, а
+        # заказы немногих найденных клиентов - по индексу client_id. Если
+        # клиентов много, подходящие заказы встречаются часто и страница
+        # быстрее набирается просмотром заказов по порядку
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        lookups = _prefix_lookups('organization_key', term)
+        clients = list(models.Client.objects.filter(**lookups).values_list(
+            'pk', flat=True
+        )[:ORDER_SEARCH_CLIENTS + 1])
+        if len(clients) <= ORDER_SEARCH_CLIENTS:
+            return queryset.filter(client__in=clients), False
+        return queryset.filter(**{f'client__{lookup}': value
+                                  for lookup, value in lookups.items()}), False
 
 
 @admin.register(models.Fiders)
-class AdminFider(admin.ModelAdmin):
-    list_display = ('amperage', 'price', 'documentation')
+class AdminFider(ProductAdmin):
+    list_display = ('name', 'manufacturer', 'amperage', 'price')
 
 
 @admin.register(models.ComlexTransformerSubstation)
-class AdminComlexTransformerSubstation(admin.ModelAdmin):
-    list_display = ('type_station', 'price', 'documentation')
+class AdminComlexTransformerSubstation(ProductAdmin):
+    list_display = ('name', 'manufacturer', 'type_station', 'price')
+
+
+@admin.register(models.OutgoingEmail)
+class AdminOutgoingEmail(LargeTableAdmin):
+    list_display = ('recipient', 'subject', 'status', 'attempts', 'next_attempt', 'sent')
+    list_filter = ('status',)
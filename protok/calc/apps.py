@@ -5,3 +5,6 @@ class CalcConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'calc'
     verbose_name = 'Калькулятор'
+
+    def ready(self):
+        from . import db, instrumentation, signals  # noqa: F401
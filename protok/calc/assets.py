@@ -0,0 +1,268 @@
+"""Сборка и отдача статических файлов
+
+Команда build_assets готовит статику к выкладке:
+
+* загружает Bootstrap в calc/static/calc/vendor (с проверкой SRI), чтобы
+  страницы не ходили на CDN;
+* делает из изображений IMAGES уменьшенные копии и варианты WebP в
+  ASSET_BUILD_ROOT, откуда их берет BuildFinder;
+* запускает collectstatic: AssetStorage дает файлам имена с хешем
+  содержимого;
+* кладет рядом с текстовыми файлами сжатые копии .gz и .br.
+
+Представление serve отдает собранные файлы из STATIC_ROOT: файлы с
+хешем в имени - с бессрочным кешированием, сжатую копию - если клиент
+ее принимает. Для WebP и уменьшенных копий нужен пакет Pillow, для
+brotli - пакет brotli.
+"""
+import base64
+import functools
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.finders import BaseFinder, FileSystemFinder
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Исходное изображение -> ширины уменьшенных копий; None - исходный размер
+# (только вариант WebP)
+IMAGES = {
+    'calc/fon_site.png': (None,),
+    'calc/вопрос.png': (300, 600),
+    'calc/image.jpg': (None, 600),
+    'calc/трансформатор.jpg': (None, 320),
+}
+
+# Файл в calc/static/calc/vendor -> (адрес на CDN, хеш SRI)
+VENDOR = {
+    'bootstrap.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+        'sha384-1BmE4kWBq78iYhFldvKuhfTAU6auU8tT94WrHftjDbrCEXSU1oBoqyl2QvZ6jIW3',
+    ),
+    'bootstrap.bundle.min.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+        'sha384-ka7Sk0Gln4gmtz2MlQnikT1wXgYsOg+OMhuP+IlRH9sENBO0LRn5q+8nbTov4+1p',
+    ),
+}
+VENDOR_DIR = Path(__file__).resolve().parent / 'static' / 'calc' / 'vendor'
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.ico'}
+# Файлы меньше этого размера не сжимаются
+COMPRESS_MIN_SIZE = 1024
+# Сжатая копия сохраняется, только если она меньше этой доли исходного файла
+COMPRESS_MAX_RATIO = 0.9
+# Кодировка Content-Encoding -> расширение сжатой копии, по предпочтению
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+SOURCE_MAP = re.compile(rb'\n?(/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S*)\s*$')
+
+
+class AssetsError(Exception):
+    """Статика не может быть собрана"""
+
+
+def build_root():
+    return Path(getattr(settings, 'ASSET_BUILD_ROOT', settings.BASE_DIR / 'build'))
+
+
+class AssetStorage(ManifestStaticFilesStorage):
+    """Имена файлов с хешем содержимого по манифесту collectstatic
+
+    Пока статика не собрана (разработка, тесты), отдаются исходные имена.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+
+class BuildFinder(FileSystemFinder):
+    """Находит файлы, созданные build_assets в ASSET_BUILD_ROOT"""
+
+    def __init__(self, app_names=None, *args, **kwargs):
+        root = str(build_root())
+        self.locations = [('', root)]
+        storage = FileSystemStorage(location=root)
+        storage.prefix = ''
+        self.storages = {root: storage}
+        BaseFinder.__init__(self, *args, **kwargs)
+
+    def check(self, **kwargs):
+        return []
+
+
+@functools.lru_cache(maxsize=None)
+def available(name):
+    """Есть ли статический файл name (например, собранный вариант изображения)"""
+    if settings.DEBUG:
+        return finders.find(name) is not None
+    return staticfiles_storage.exists(name)
+
+
+def vendor_path(name):
+    return f'calc/vendor/{name}'
+
+
+def fetch_vendor():
+    """Загружает файлы VENDOR с CDN и проверяет их хеши SRI"""
+    VENDOR_DIR.mkdir(parents=True, exist_ok=True)
+    for name, (url, integrity) in VENDOR.items():
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                content = response.read()
+        except OSError as error:
+            raise AssetsError(f'Не удалось загрузить {url}: {error}')
+        algorithm, expected = integrity.split('-', 1)
+        digest = base64.b64encode(hashlib.new(algorithm, content).digest()).decode()
+        if digest != expected:
+            raise AssetsError(f'{url}: хеш не совпадает с {integrity}')
+        # Карт исходников рядом нет, а collectstatic проверяет ссылки на них
+        (VENDOR_DIR / name).write_bytes(SOURCE_MAP.sub(b'\n', content))
+        yield name
+
+
+def variant_name(name, width, extension=None):
+    """Имя варианта изображения: calc/вопрос.300w.webp"""
+    base, original = os.path.splitext(name)
+    suffix = f'.{width}w' if width else ''
+    return f'{base}{suffix}{extension or original}'
+
+
+def build_images():
+    """Создает варианты изображений IMAGES в ASSET_BUILD_ROOT"""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise AssetsError('Для вариантов изображений установите пакет Pillow')
+    root = build_root()
+    for name, widths in IMAGES.items():
+        source = finders.find(name)
+        if source is None:
+            raise AssetsError(f'Изображение {name} не найдено')
+        with Image.open(source) as image:
+            image.load()
+            for width in widths:
+                if width is not None and width >= image.width:
+                    continue
+                if width is None:
+                    resized = image
+                else:
+                    height = round(image.height * width / image.width)
+                    resized = image.resize((width, height), Image.LANCZOS)
+                outputs = [('.webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 6})]
+                if width is not None:
+                    outputs.append((None, image.format, _save_options(image.format)))
+                for extension, image_format, options in outputs:
+                    path = root / variant_name(name, width, extension)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    resized.save(path, image_format, **options)
+                    yield str(path.relative_to(root))
+
+
+def _save_options(image_format):
+    if image_format == 'JPEG':
+        return {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+    return {'optimize': True}
+
+
+def precompress(root=None):
+    """Создает сжатые копии текстовых файлов STATIC_ROOT"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    root = Path(root or settings.STATIC_ROOT)
+    for path in sorted(root.rglob('*')):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE:
+            continue
+        content = path.read_bytes()
+        if len(content) < COMPRESS_MIN_SIZE:
+            continue
+        # mtime=0: копия не меняется от сборки к сборке
+        copies = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            copies.append(('.br', brotli.compress(content, quality=11)))
+        for suffix, compressed in copies:
+            if len(compressed) <= len(content) * COMPRESS_MAX_RATIO:
+                path.with_name(path.name + suffix).write_bytes(compressed)
+                yield str(path.relative_to(root)) + suffix
+
+
+def manifest_version():
+    """Хеш манифеста collectstatic; пустая строка, пока статика не собрана"""
+    return getattr(staticfiles_storage, 'manifest_hash', '')
+
+
+@functools.lru_cache(maxsize=1)
+def _hashed_names(manifest_hash):
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def serve(request, path):
+    """Отдает собранный статический файл из STATIC_ROOT"""
+    try:
+        fullpath = Path(safe_join(settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    if not fullpath.is_file():
+        raise Http404
+    content_type, _ = mimetypes.guess_type(fullpath.name)
+    accepted = _accepted_encodings(request)
+    chosen, content_encoding, compressed = fullpath, None, False
+    for encoding, suffix in PRECOMPRESSED:
+        candidate = fullpath.with_name(fullpath.name + suffix)
+        if candidate.is_file():
+            compressed = True
+            if encoding in accepted and content_encoding is None:
+                chosen, content_encoding = candidate, encoding
+    stat = chosen.stat()
+    hashed = path in _hashed_names(manifest_version())
+    if not hashed and not was_modified_since(request.headers.get('If-Modified-Since'),
+                                             stat.st_mtime):
+        return HttpResponseNotModified()
+    response = FileResponse(chosen.open('rb'), filename=fullpath.name,
+                            content_type=content_type or 'application/octet-stream')
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if content_encoding:
+        response['Content-Encoding'] = content_encoding
+    if compressed:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    # Файл с хешем в имени не меняется: новая версия получает новое имя
+    response['Cache-Control'] = IMMUTABLE if hashed else 'no-cache'
+    return response
@@ -0,0 +1,260 @@
+"""Сценарии нагрузочных замеров представлений calc
+
+Используются командами benchmark_views, benchmark_asgi и тестами
+бюджета запросов.
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.test.utils import setup_databases, teardown_databases
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import Client
+from django.test.client import encode_multipart
+from django.test.utils import CaptureQueriesContext
+
+from .forms import HighVoltageDeviceForm, TransformerForm
+from .models import HighVoltageDevice, Transformer
+
+# Максимум SQL-запросов на один запрос к представлению (с прогретым кешем).
+# Не должен зависеть от размера каталога и числа заказов.
+QUERY_BUDGETS = {
+    'index': 1,
+    'contacts': 0,
+    'quote': 6,
+    'get_contact': 6,
+    'results': 1,
+    'admin_orders': 5,
+}
+
+Scenario = namedtuple('Scenario', 'name method path data staff')
+
+
+def quote_params():
+    """Параметры расчета, для которых в каталоге есть комплектация"""
+    for hv_device in HighVoltageDevice.objects.order_by('pk'):
+        transformer = Transformer.objects.filter(voltage=hv_device.voltage).first()
+        if transformer is not None:
+            break
+    else:
+        return {}
+    params = {field: getattr(transformer, field) for field in TransformerForm.Meta.fields}
+    params.update((field, getattr(hv_device, field))
+                  for field in HighVoltageDeviceForm.Meta.fields)
+    return params
+
+
+def _order_form():
+    return {
+        'full_name': 'Иванов Иван Иванович', 'organization': 'ООО «Нагрузка»',
+        'email': 'benchmark@example.com', 'phone_number': '+79131234567',
+        'comment': 'Нагрузочный тест',
+        'documentation': SimpleUploadedFile('drawings.pdf', b'%PDF-1.4\n' + b'0' * 64 * 1024),
+    }
+
+
+def scenarios(order_pk):
+    params = quote_params()
+    return [
+        Scenario('index', 'get', '/', dict, False),
+        Scenario('contacts', 'get', '/contacts/', dict, False),
+        Scenario('quote', 'get', '/api/quote/', lambda: params, False),
+        Scenario('get_contact', 'post', '/get_contact/', _order_form, False),
+        Scenario('results', 'get', f'/results/{order_pk}/', dict, False),
+        Scenario('admin_orders', 'get', '/admin/calc/order/', dict, True),
+    ]
+
+
+@contextmanager
+def benchmark_database():
+    """Отдельная тестовая база на время замера
+
+    SQLite создается в файле, а не в памяти, чтобы потоки писали в нее
+    параллельно; реплики-зеркала (TEST MIRROR) указывают на нее же.
+    """
+    path = None
+    if connection.vendor == 'sqlite':
+        path = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        connection.settings_dict['TEST']['NAME'] = path
+    old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+def staff_user():
+    user, created = get_user_model().objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True, 'is_superuser': True}
+    )
+    return user
+
+
+def make_client(scenario):
+    client = Client()
+    if scenario.staff:
+        client.force_login(staff_user())
+    return client
+
+
+def request(client, scenario):
+    """Выполняет сценарий, возвращает (ответ, число SQL-запросов)"""
+    with CaptureQueriesContext(connection) as queries:
+        response = getattr(client, scenario.method)(scenario.path, scenario.data())
+    return response, len(queries)
+
+
+def run(scenario, requests=100, workers=4):
+    """Выполняет сценарий requests раз в workers потоках
+
+    Возвращает словарь с перцентилями задержки (мс), пропускной
+    способностью (запросов в секунду) и максимумом SQL-запросов.
+    """
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = make_client(scenario)
+        try:
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                started = time.perf_counter()
+                response, count = request(client, scenario)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    queries.append(count)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    return {
+        'p50': statistics.median(latencies) * 1000,
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'rps': len(latencies) / elapsed,
+        'queries': max(queries),
+        'errors': len(errors),
+    }
+
+
+# Нагрузочный замер под ASGI: приложение вызывается напрямую по протоколу
+# ASGI, медленные клиенты отдают тело запроса и читают ответ с задержками
+
+CSRF_TOKEN = 'benchmarkbenchmarkbenchmarkbench'
+
+
+def asgi_scenarios(order_pk):
+    """Пары (сценарий, тело запроса, заголовки) для run_asgi"""
+    boundary = 'BenchmarkBoundary'
+    form = dict(_order_form(), csrfmiddlewaretoken=CSRF_TOKEN)
+    body = encode_multipart(boundary, form)
+    return [
+        (Scenario('contacts', 'GET', '/contacts/', dict, False), b'', []),
+        (Scenario('results', 'GET', f'/results/{order_pk}/', dict, False), b'', []),
+        (Scenario('get_contact', 'POST', '/get_contact/', dict, False), body, [
+            (b'content-type', f'multipart/form-data; boundary={boundary}'.encode()),
+            (b'content-length', str(len(body)).encode()),
+            (b'cookie', f'csrftoken={CSRF_TOKEN}'.encode()),
+        ]),
+    ]
+
+
+async def asgi_request(application, scenario, body, headers, chunks=4, delay=0.05):
+    """Один медленный клиент: тело уходит chunks частями, ответ читается
+    с той же задержкой между частями. Возвращает (статус, секунды)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': scenario.method, 'scheme': 'http', 'path': scenario.path,
+        'raw_path': scenario.path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver')] + headers,
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    size = max(len(body) // chunks, 1)
+    parts = [body[start:start + size] for start in range(0, len(body), size)] or [b'']
+    finished = asyncio.Event()
+    status = []
+
+    async def receive():
+        if parts:
+            await asyncio.sleep(delay)
+            part = parts.pop(0)
+            return {'type': 'http.request', 'body': part, 'more_body': bool(parts)}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            await asyncio.sleep(delay)
+            if not message.get('more_body'):
+                finished.set()
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    finished.set()
+    return status[0] if status else 0, time.perf_counter() - started
+
+
+async def run_asgi(application, scenario, body, headers, clients=200, delay=0.05):
+    """Запускает clients медленных клиентов одновременно
+
+    Возвращает перцентили задержки (мс), пропускную способность, число
+    ошибок и наибольшее число потоков процесса за время замера.
+    """
+    peak_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def monitor():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    watcher = asyncio.ensure_future(monitor())
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        asgi_request(application, scenario, body, list(headers), delay=delay)
+        for _ in range(clients)
+    ))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await watcher
+
+    latencies = sorted(latency for _, latency in results)
+    percentile = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    return {
+        'p50': statistics.median(latencies) * 1000,
+        'p99': percentile(0.99),
+        'rps': len(latencies) / elapsed,
+        'elapsed': elapsed,
+        'errors': sum(1 for status, _ in results if status >= 400 or status == 0),
+        'threads': peak_threads,
+    }
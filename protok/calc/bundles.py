@@ -0,0 +1,132 @@
+"""Архив документации заказа
+
+Архив собирается потоково, без чтения файлов целиком в память, и
+параллельно сохраняется на диск. Имя сохраненного архива - хеш от
+хешей входящих в него файлов, поэтому повторная выдача того же набора
+документов сводится к отдаче готового файла.
+"""
+import hashlib
+import os
+import uuid
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Фиксированная дата делает архив воспроизводимым
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def bundle_root():
+    return Path(getattr(settings, 'DOCUMENTATION_BUNDLE_ROOT',
+                        settings.BASE_DIR / 'bundles'))
+
+
+def file_digest(document):
+    """SHA-256 содержимого файла с кешированием по имени, размеру и дате"""
+    storage = document.storage
+    try:
+        modified = storage.get_modified_time(document.name).timestamp()
+    except NotImplementedError:
+        modified = ''
+    key = f'calc:file-digest:{document.name}:{document.size}:{modified}'
+    key = 'calc:file-digest:' + hashlib.sha1(key.encode()).hexdigest()
+    digest = cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with storage.open(document.name, 'rb') as source:
+            for chunk in iter(lambda: source.read(64 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        cache.set(key, digest, None)
+    return digest
+
+
+def bundle_entries(order):
+    """Список (имя в архиве, файл, хеш) для документации заказа"""
+    entries = []
+    names = set()
+    for folder, document in order.documentation_files():
+        base, ext = os.path.splitext(os.path.basename(document.name))
+        arcname = f'{folder}/{base}{ext}'
+        suffix = 1
+        while arcname in names:
+            suffix += 1
+            arcname = f'{folder}/{base}_{suffix}{ext}'
+        names.add(arcname)
+        entries.append((arcname, document, file_digest(document)))
+    return entries
+
+
+def bundle_key(entries):
+    sha = hashlib.sha256()
+    for arcname, _, digest in entries:
+        sha.update(f'{arcname}\0{digest}\n'.encode())
+    return sha.hexdigest()
+
+
+def cached_bundle(key):
+    """Путь к сохраненному архиву или None"""
+    path = bundle_root() / f'{key}.zip'
+    return path if path.exists() else None
+
+
+class _ZipSink:
+    """Несмещаемый поток, в который пишет zipfile
+
+    Записанные данные забираются порциями методом take().
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_bundle(entries, key):
+    """Генератор байтов ZIP-архива
+
+    Архив одновременно пишется во временный файл, который после
+    успешного завершения атомарно переименовывается в key.zip.
+    """
+    root = bundle_root()
+    root.mkdir(parents=True, exist_ok=True)
+    temporary = root / f'.{key}.{uuid.uuid4().hex}.tmp'
+    sink = _ZipSink()
+    completed = False
+    try:
+        with open(temporary, 'wb') as copy:
+            def flush():
+                data = sink.take()
+                if data:
+                    copy.write(data)
+                    yield data
+
+            with zipfile.ZipFile(sink, 'w') as archive:
+                for arcname, document, _ in entries:
+                    info = zipfile.ZipInfo(arcname, ZIP_DATE_TIME)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    with archive.open(info, 'w', force_zip64=True) as target, \
+                            document.storage.open(document.name, 'rb') as source:
+                        for chunk in iter(lambda: source.read(64 * 1024), b''):
+                            target.write(chunk)
+                            yield from flush()
+                    yield from flush()
+            # Центральный каталог записывается при закрытии архива
+            yield from flush()
+        os.replace(temporary, root / f'{key}.zip')
+        completed = True
+    finally:
+        if not completed:
+            temporary.unlink(missing_ok=True)
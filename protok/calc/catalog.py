@@ -0,0 +1,54 @@
+"""Версия каталога оборудования
+
+Версия меняется при любом изменении моделей каталога и служит ключом
+для всего, что из каталога вычисляется: ETag расчетов цены, кешей
+схемы конфигуратора и загруженных массивов цен. Хранится в кеше
+Django, поэтому в продакшене кеш должен быть общим для всех процессов.
+
+Сигналы post_save/post_delete обновляют версию сами; код, меняющий
+каталог в обход сигналов (bulk_create, update), должен вызвать
+bump_catalog_version().
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import (
+    ComlexTransformerSubstation, Transformer, HighVoltageDevice,
+    LowVoltageDevice, Fiders, Section,
+)
+
+CATALOG_MODELS = (ComlexTransformerSubstation, Transformer, HighVoltageDevice,
+                  LowVoltageDevice, Fiders, Section)
+
+VERSION_KEY = 'calc:catalog-version'
+
+
+def catalog_version():
+    """Текущая версия каталога"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Версия из времени не совпадет с прежними даже после очистки кеша
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def acatalog_version():
+    """Текущая версия каталога для асинхронного кода
+
+    Обращение к кешу не блокирует цикл событий (кеш в базе данных из
+    асинхронного кода и вовсе недоступен синхронно).
+    """
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Объявляет все вычисленные по каталогу данные устаревшими"""
+    version = max(time.time_ns(), (cache.get(VERSION_KEY) or 0) + 1)
+    cache.set(VERSION_KEY, version, None)
+    return version
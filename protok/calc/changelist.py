@@ -0,0 +1,198 @@
+"""Списки админки для больших таблиц
+
+EstimatedCountPaginator не считает COUNT(*) по всей таблице: строки
+считаются только до COUNT_LIMIT, дальше берется оценка из статистики
+базы. KeysetChangeList листает список по ключу последней строки
+страницы (?after=<pk>, ?before=<pk>) вместо OFFSET, поэтому дальние
+страницы открываются так же быстро, как первая.
+"""
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# До скольких строк список считается точно
+COUNT_LIMIT = 10000
+
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+CURSOR_VARS = (AFTER_VAR, BEFORE_VAR)
+
+
+def estimated_count(model, using):
+    """Оценка числа строк таблицы по статистике базы или None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # -1: таблица еще не анализировалась
+            return int(row[0]) if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # Без ANALYZE статистики нет; максимальный ключ берется из
+            # индекса первичного ключа и отличается от числа строк только
+            # на число удаленных
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            cursor.execute(f'SELECT MAX({pk}) FROM {connection.ops.quote_name(table)}')
+            row = cursor.fetchone()
+            return row[0] if row and isinstance(row[0], int) else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор с ограниченным подсчетом строк
+
+    Для отфильтрованного списка больше COUNT_LIMIT строк оценки нет,
+    count равен COUNT_LIMIT + 1.
+    """
+    exact = True
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        bounded = queryset.order_by()[:COUNT_LIMIT + 1].count()
+        if bounded <= COUNT_LIMIT:
+            return bounded
+        self.exact = False
+        if not queryset.query.has_filters():
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None:
+                self.estimated = True
+                return max(estimate, bounded)
+        return bounded
+
+    def count_display(self):
+        if self.exact:
+            return str(self.count)
+        if self.estimated:
+            return f'около {self.count}'
+        return f'более {COUNT_LIMIT}'
+
+
+def keyset_condition(fields, values, forward, inclusive=False):
+    """Условие «строки после (до) строки со значениями values»
+
+    fields - пары (поле, по убыванию). Условие на первое поле дублируется
+    диапазоном, чтобы база начинала чтение индекса с нужного места.
+    """
+    condition = Q(**values) if inclusive else None
+    equal = {}
+    for name, descending in fields:
+        lookup = 'lt' if descending == forward else 'gt'
+        step = Q(**equal, **{f'{name}__{lookup}': values[name]})
+        condition = step if condition is None else condition | step
+        equal[name] = values[name]
+    first, descending = fields[0]
+    lookup = 'lte' if descending == forward else 'gte'
+    return Q(**{f'{first}__{lookup}': values[first]}) & condition
+
+
+class KeysetChangeList(ChangeList):
+    """Список админки с постраничным переходом по ключу
+
+    Применяется, если список упорядочен по непустым полям самой модели
+    (по умолчанию - по убыванию первичного ключа) и не редактируется на
+    месте; иначе работает обычная нумерация страниц.
+    """
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        for name in CURSOR_VARS:
+            params.pop(name, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Ссылки фильтров, сортировки и поиска ведут на первую страницу
+        new_params = {AFTER_VAR: None, BEFORE_VAR: None, **(new_params or {})}
+        return super().get_query_string(new_params, remove)
+
+    def _get_deterministic_ordering(self, ordering):
+        # Добавленный для однозначности первичный ключ сортируется в ту же
+        # сторону, что и предыдущее поле, иначе база не может читать
+        # составной индекс (поле, id) по порядку и сортирует всю таблицу
+        result = super()._get_deterministic_ordering(ordering)
+        if (len(result) > len(ordering) and len(ordering) > 0
+                and isinstance(ordering[-1], str) and not ordering[-1].startswith('-')):
+            result[-1] = 'pk'
+        return result
+
+    def _keyset_fields(self):
+        if self.list_editable or self.show_all:
+            return None
+        fields = []
+        for part in self.queryset.query.order_by:
+            if not isinstance(part, str):
+                return None
+            name = part.lstrip('-')
+            if name == 'pk':
+                name = self.lookup_opts.pk.name
+            try:
+                field = self.lookup_opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.null or field.is_relation:
+                return None
+            fields.append((field.attname, part.startswith('-')))
+        return fields or None
+
+    def _cursor(self, request, name, fields):
+        value = request.GET.get(name)
+        if not value:
+            return None
+        try:
+            pk = self.lookup_opts.pk.to_python(value)
+        except ValidationError:
+            return None
+        return self.root_queryset.filter(pk=pk).values(*(name for name, _ in fields)).first()
+
+    def get_results(self, request):
+        fields = self._keyset_fields()
+        if fields is None:
+            self.keyset = False
+            return super().get_results(request)
+        self.keyset = True
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        per_page = self.list_per_page
+        after = self._cursor(request, AFTER_VAR, fields)
+        before = self._cursor(request, BEFORE_VAR, fields) if after is None else None
+        queryset = self.queryset
+        if before is not None:
+            # Предыдущая страница: строки до курсора в обратном порядке,
+            # первая из них становится началом страницы
+            reverse = [('-' if not descending else '') + name for name, descending in fields]
+            previous = list(queryset.filter(
+                keyset_condition(fields, before, forward=False)
+            ).order_by(*reverse).values(*(name for name, _ in fields))[:per_page + 1])
+            self.has_previous = len(previous) > per_page
+            if previous:
+                queryset = queryset.filter(keyset_condition(fields, previous[:per_page][-1],
+                                                            forward=True, inclusive=True))
+        elif after is not None:
+            queryset = queryset.filter(keyset_condition(fields, after, forward=True))
+            self.has_previous = True
+        else:
+            self.has_previous = False
+        # Сначала ключи страницы без select_related: соединения с
+        # внешними таблицами делаются только для строк страницы, а не для
+        # всех подходящих строк до сортировки
+        keys = list(queryset.values_list('pk', flat=True)[:per_page + 1])
+        self.has_next = len(keys) > per_page
+        keys = keys[:per_page]
+        rows = self.queryset.order_by().filter(pk__in=keys).in_bulk() if keys else {}
+        self.result_list = [rows[pk] for pk in keys if pk in rows]
+        self.result_count = paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = self.has_next or self.has_previous
+        self.paginator = paginator
+        if self.result_list:
+            pk = self.lookup_opts.pk.attname
+            self.next_url = self.get_query_string({AFTER_VAR: getattr(self.result_list[-1], pk)})
+            self.previous_url = self.get_query_string({BEFORE_VAR: getattr(self.result_list[0], pk)})
+        self.first_url = self.get_query_string()
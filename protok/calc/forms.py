@@ -1,5 +1,8 @@
+from django import forms
+from django.db import transaction
 from django.forms import ModelForm
-from .models import Transformer, HighVoltageDevice, Client, Order
+from .models import Transformer, HighVoltageDevice, Client, Order, UploadSession
+from . import uploads
 
 
 class TransformerForm(ModelForm):
@@ -20,8 +23,41 @@ class ClientForm(ModelForm):
         model = Client
         fields = ['full_name', 'organization', 'email', 'phone_number']
 
+    def save(self, commit=True):
+        # Повторный заказ привязывается к уже известному клиенту
+        return Client.objects.resolve(**self.cleaned_data)
+
 
 class OrderForm(ModelForm):
+    # Файл, загруженный по частям через /uploads/, вместо поля documentation
+    upload = forms.ModelChoiceField(
+        queryset=UploadSession.objects.filter(completed=True),
+        required=False, widget=forms.HiddenInput
+    )
+
     class Meta:
         model = Order
         fields = ['comment', 'documentation']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['documentation'].required = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('documentation') and not cleaned_data.get('upload'):
+            if 'upload' not in self.errors:
+                self.add_error('documentation', 'Обязательное поле.')
+        return cleaned_data
+
+    def save(self, commit=True):
+        session = self.cleaned_data.get('upload')
+        # Загрузка привязывается в одной транзакции с заказом
+        with transaction.atomic(savepoint=False):
+            if session is not None and not self.cleaned_data.get('documentation'):
+                uploads.attach(session, self.instance.documentation)
+            return super().save(commit)
+
+
+class PriceListImportForm(forms.Form):
+    file = forms.FileField(label='Прайс-лист (CSV или XLSX)')
@@ -0,0 +1,262 @@
+"""Измерение производительности запросов
+
+InstrumentationMiddleware считает SQL-запросы и их время, время
+отрисовки шаблонов (через бэкенд InstrumentedDjangoTemplates) и
+объем и время загрузки файлов (TimingUploadHandler). Значения текущего
+запроса уходят в заголовок Server-Timing, а гистограммы по
+представлениям копятся в процессе и отдаются в текстовом формате
+Prometheus представлением calc.views.metrics. Гистограммы у каждого
+процесса свои, суммирует их Prometheus.
+"""
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (2 ** 16, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28)
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками"""
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def _labels(self, values, **extra):
+        pairs = list(zip(self.labels, values)) + list(extra.items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, [counts[:], total, count])
+                            for labels, (counts, total, count) in self._series.items())
+        for labels, (counts, total, count) in series:
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{self._labels(labels, le=bound)} {bucket}')
+            lines.append(f'{self.name}_bucket{self._labels(labels, le="+Inf")} {count}')
+            lines.append(f'{self.name}_sum{self._labels(labels)} {total}')
+            lines.append(f'{self.name}_count{self._labels(labels)} {count}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram(
+    'protok_request_duration_seconds', 'Время обработки запроса',
+    ('view', 'method'), DURATION_BUCKETS,
+)
+request_queries = Histogram(
+    'protok_request_sql_queries', 'Число SQL-запросов на запрос',
+    ('view',), QUERY_BUCKETS,
+)
+request_sql_duration = Histogram(
+    'protok_request_sql_seconds', 'Суммарное время SQL-запросов на запрос',
+    ('view',), DURATION_BUCKETS,
+)
+template_duration = Histogram(
+    'protok_template_render_seconds', 'Время отрисовки шаблона',
+    ('template',), DURATION_BUCKETS,
+)
+upload_duration = Histogram(
+    'protok_upload_seconds', 'Время приема загружаемого файла или его части',
+    (), DURATION_BUCKETS,
+)
+upload_size = Histogram(
+    'protok_upload_bytes', 'Размер загружаемого файла или его части',
+    (), SIZE_BUCKETS,
+)
+
+HISTOGRAMS = [request_duration, request_queries, request_sql_duration,
+              template_duration, upload_duration, upload_size]
+
+
+class RequestTimings:
+    """Измерения одного запроса"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.templates = []
+        self.uploads = []
+
+    def server_timing(self, total):
+        metrics = [f'sql;desc="{self.queries} queries";dur={self.sql * 1000:.1f}']
+        for name, elapsed in self.templates:
+            metrics.append(f'tpl;desc="{_escape(name)}";dur={elapsed * 1000:.1f}')
+        for size, elapsed in self.uploads:
+            metrics.append(f'upload;desc="{size} bytes";dur={elapsed * 1000:.1f}')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+_current = contextvars.ContextVar('calc_request_timings', default=None)
+
+
+def record_template(name, elapsed):
+    template_duration.observe(elapsed, name)
+    timings = _current.get()
+    if timings is not None:
+        timings.templates.append((name, elapsed))
+
+
+def record_upload(size, elapsed):
+    upload_duration.observe(elapsed)
+    upload_size.observe(size)
+    timings = _current.get()
+    if timings is not None:
+        timings.uploads.append((size, elapsed))
+
+
+def expose():
+    """Все гистограммы процесса в текстовом формате Prometheus"""
+    return '\n'.join(histogram.expose() for histogram in HISTOGRAMS) + '\n'
+
+
+class InstrumentationMiddleware:
+    """Измеряет запрос и добавляет заголовок Server-Timing
+
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать запросы к базе
+    остальных middleware (сессии, аутентификация). Поддерживает и
+    синхронный, и асинхронный (ASGI) режим.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, started)
+
+    @staticmethod
+    def _finish(request, response, timings, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match is not None else '<unresolved>'
+        request_duration.observe(elapsed, view, request.method)
+        request_queries.observe(timings.queries, view)
+        request_sql_duration.observe(timings.sql, view)
+        response['Server-Timing'] = timings.server_timing(elapsed)
+        return response
+
+
+def _record_sql(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.sql += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Обертка ставится на само соединение: в асинхронных представлениях
+    # ORM работает в другом потоке, а измерения запроса доходят туда
+    # через contextvars
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+class InstrumentedTemplate(django_backend.Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            record_template(self.origin.template_name or '<string>',
+                            time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(django_backend.DjangoTemplates):
+    """Бэкенд DjangoTemplates, измеряющий время отрисовки шаблонов"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+class TimingUploadHandler(FileUploadHandler):
+    """Измеряет объем и время приема файлов multipart-формы
+
+    Данные не сохраняет, а передает следующим обработчикам, поэтому
+    должен стоять первым в FILE_UPLOAD_HANDLERS.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.started = time.perf_counter()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        record_upload(self.size, time.perf_counter() - self.started)
+        return None
@@ -0,0 +1,54 @@
+import asyncio
+import shutil
+import tempfile
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+
+from calc import benchmark, seeding
+from calc.models import Order
+
+
+class Command(BaseCommand):
+    help = ('Замер асинхронных представлений под ASGI в одном процессе: '
+            'сотни одновременных медленных клиентов на отдельной тестовой базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=300,
+                            help='Одновременных клиентов на сценарий')
+        parser.add_argument('--delay', type=float, default=0.05,
+                            help='Задержка клиента между частями запроса и ответа, с')
+
+    def handle(self, *args, clients, delay, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with benchmark.benchmark_database(), \
+                    override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'],
+                                      DEBUG=False):
+                seeding.seed(20, 100)
+                order_pk = Order.objects.order_by('-pk').values_list('pk', flat=True)[0]
+                # Соединение основного потока больше не нужно, запросы к базе
+                # выполняются в потоках asgiref
+                connections.close_all()
+                asyncio.run(self.run(order_pk, clients, delay))
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    async def run(self, order_pk, clients, delay):
+        application = get_asgi_application()
+        self.stdout.write(f'Клиентов: {clients}, задержка клиента: {delay * 1000:.0f} мс '
+                          f'на каждую из частей запроса и ответа')
+        self.stdout.write(f'{"сценарий":<14}{"время, с":>10}{"p50, мс":>10}{"p99, мс":>10}'
+                          f'{"запр/с":>10}{"потоков":>9}{"ошибок":>8}')
+        for scenario, body, headers in benchmark.asgi_scenarios(order_pk):
+            # Прогрев
+            await benchmark.asgi_request(application, scenario, body, list(headers), delay=0)
+            stats = await benchmark.run_asgi(application, scenario, body, headers,
+                                             clients=clients, delay=delay)
+            self.stdout.write(
+                f'{scenario.name:<14}{stats["elapsed"]:>10.2f}{stats["p50"]:>10.1f}'
+                f'{stats["p99"]:>10.1f}{stats["rps"]:>10.1f}{stats["threads"]:>9}'
+                f'{stats["errors"]:>8}'
+            )
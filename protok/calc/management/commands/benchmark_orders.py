@@ -0,0 +1,92 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections, transaction
+
+from calc.models import Client, Order, Transformer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест параллельного оформления заказов: считает '
+            'ошибки "database is locked" при одновременной записи и чтении. '
+            'Запускайте на отдельной копии базы (PROTOK_SQLITE_PATH).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8,
+                            help='Потоков, оформляющих заказы')
+        parser.add_argument('--readers', type=int, default=8,
+                            help='Потоков, читающих каталог')
+        parser.add_argument('--seconds', type=float, default=10,
+                            help='Длительность теста')
+        parser.add_argument('--keep', action='store_true',
+                            help='Не удалять созданные заказы')
+
+    def handle(self, *args, writers, readers, seconds, keep, **options):
+        deadline = time.monotonic() + seconds
+        lock = threading.Lock()
+        stats = {'orders': 0, 'reads': 0, 'locked': 0, 'latency': [], 'clients': []}
+
+        def submit_orders():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    # Как при оформлении заказа: сначала чтение, затем запись
+                    with transaction.atomic():
+                        transformer = Transformer.objects.order_by('?').first()
+                        client = Client.objects.create(
+                            full_name='Нагрузочный тест', organization='benchmark',
+                            email='benchmark@example.com', phone_number='+79131234567',
+                        )
+                        Order.objects.create(client=client, transformer=transformer,
+                                             documentation='orders/benchmark.pdf')
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    with lock:
+                        stats['locked'] += 1
+                    continue
+                with lock:
+                    stats['orders'] += 1
+                    stats['clients'].append(client.pk)
+                    stats['latency'].append(time.perf_counter() - started)
+
+        def read_catalog():
+            while time.monotonic() < deadline:
+                try:
+                    list(Transformer.objects.order_by('power')[:50])
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    with lock:
+                        stats['locked'] += 1
+                    continue
+                with lock:
+                    stats['reads'] += 1
+
+        def run(target):
+            try:
+                target()
+            finally:
+                connections.close_all()
+
+        threads = ([threading.Thread(target=run, args=(submit_orders,)) for _ in range(writers)]
+                   + [threading.Thread(target=run, args=(read_catalog,)) for _ in range(readers)])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        close_old_connections()
+
+        latency = sorted(stats['latency']) or [0]
+        self.stdout.write(f'Заказов оформлено: {stats["orders"]} '
+                          f'({stats["orders"] / seconds:.1f}/с)')
+        self.stdout.write(f'Чтений каталога: {stats["reads"]} '
+                          f'({stats["reads"] / seconds:.1f}/с)')
+        self.stdout.write(f'Задержка оформления, мс: '
+                          f'p50={statistics.median(latency) * 1000:.1f} '
+                          f'p99={latency[int(len(latency) * 0.99)] * 1000:.1f}')
+        self.stdout.write(f'Ошибок "database is locked": {stats["locked"]}')
+        if not keep:
+            Client.objects.filter(pk__in=stats['clients']).delete()
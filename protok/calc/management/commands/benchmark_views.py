@@ -0,0 +1,59 @@
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from calc import benchmark, seeding
+from calc.models import Order
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер представлений calc на отдельной тестовой базе: '
+            'перцентили задержки, запросов в секунду и число SQL-запросов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=['100:1000', '1000:10000'],
+                            help='Размеры данных в виде товаров_на_категорию:заказов')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на сценарий')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Параллельных клиентов')
+
+    def handle(self, *args, sizes, requests, workers, **options):
+        over_budget = []
+        for size in sizes:
+            products, orders = (int(value) for value in size.split(':'))
+            self.stdout.write(f'\nКаталог: {products} на категорию, заказов: {orders}')
+            over_budget += self.run_size(products, orders, requests, workers)
+        if over_budget:
+            raise CommandError('Превышен бюджет запросов: ' + ', '.join(over_budget))
+
+    def run_size(self, products, orders, requests, workers):
+        media_root = tempfile.mkdtemp()
+        over_budget = []
+        try:
+            with benchmark.benchmark_database(), \
+                    override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'],
+                                      DEBUG=False):
+                seeding.seed(products, orders)
+                order_pk = Order.objects.order_by('-pk').values_list('pk', flat=True)[0]
+                self.stdout.write(f'{"сценарий":<14}{"p50, мс":>10}{"p95, мс":>10}'
+                                  f'{"p99, мс":>10}{"запр/с":>10}{"SQL":>6}{"бюджет":>8}')
+                for scenario in benchmark.scenarios(order_pk):
+                    # Прогрев кешей
+                    benchmark.request(benchmark.make_client(scenario), scenario)
+                    stats = benchmark.run(scenario, requests, workers)
+                    budget = benchmark.QUERY_BUDGETS[scenario.name]
+                    self.stdout.write(
+                        f'{scenario.name:<14}{stats["p50"]:>10.1f}{stats["p95"]:>10.1f}'
+                        f'{stats["p99"]:>10.1f}{stats["rps"]:>10.1f}{stats["queries"]:>6}'
+                        f'{budget:>8}'
+                    )
+                    if stats['errors']:
+                        self.stderr.write(f'{scenario.name}: ошибок {stats["errors"]}')
+                    if stats['queries'] > budget:
+                        over_budget.append(f'{scenario.name} ({stats["queries"]} > {budget})')
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        return over_budget
@@ -0,0 +1,27 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from calc import assets
+
+
+class Command(BaseCommand):
+    help = ('Собирает статику для выкладки: варианты изображений (WebP и '
+            'уменьшенные копии), collectstatic с хешами в именах, сжатые копии .gz/.br')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', action='store_true',
+                            help='Заново загрузить Bootstrap в calc/static/calc/vendor')
+
+    def handle(self, *args, vendor, verbosity, **options):
+        try:
+            if vendor:
+                for name in assets.fetch_vendor():
+                    self.stdout.write(f'Загружен {assets.vendor_path(name)}')
+            images = list(assets.build_images())
+        except assets.AssetsError as error:
+            raise CommandError(error)
+        self.stdout.write(f'Вариантов изображений: {len(images)}')
+        call_command('collectstatic', interactive=False, verbosity=max(verbosity - 1, 0))
+        compressed = list(assets.precompress())
+        self.stdout.write(f'Сжатых копий: {len(compressed)}')
+        assets.available.cache_clear()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from calc import pricelists
+
+
+class Command(BaseCommand):
+    help = 'Выгружает категорию каталога в прайс-лист CSV или XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('category', choices=sorted(pricelists.CATALOG))
+        parser.add_argument('path', help='Файл .csv или .xlsx')
+
+    def handle(self, *args, category, path, **options):
+        try:
+            pricelists.write_file(pricelists.CATALOG[category], path)
+        except (OSError, pricelists.PriceListError) as error:
+            raise CommandError(error)
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from calc import seeding
+from calc.models import Client, Order
+
+# Как часто сообщать о ходе создания заказов
+PROGRESS_STEP = 1000000
+
+
+class Command(BaseCommand):
+    help = ('Заполняет пустую базу синтетическими данными для замеров под нагрузкой: '
+            'каталог с секциями, клиентов и заказы со снимком цен. Данные '
+            'определяются --seed. Запускайте на отдельной базе (PROTOK_SQLITE_PATH).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000,
+                            help='Единиц каждой категории каталога')
+        parser.add_argument('--orders', type=int, default=100000, help='Заказов')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--days', type=int, default=730,
+                            help='За сколько дней до сегодняшнего распределить заказы')
+        parser.add_argument('--confirmed', type=float, default=0.6,
+                            help='Доля подтвержденных заказов')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Записей в одном bulk_create')
+
+    def handle(self, *args, products, orders, seed, days, confirmed, batch_size, **options):
+        if products < 0 or orders < 0 or days < 0 or batch_size <= 0:
+            raise CommandError('Размеры должны быть неотрицательными, --batch-size - больше нуля')
+        if orders and not products:
+            raise CommandError('Для заказов нужен каталог (--products)')
+        if not 0 <= confirmed <= 1:
+            raise CommandError('--confirmed - доля от 0 до 1')
+        models = [model for _, model, _ in seeding.CATALOG_COLUMNS] + [Client, Order]
+        if any(model.objects.exists() for model in models):
+            raise CommandError('База уже содержит данные; укажите пустую базу')
+        started = time.monotonic()
+        reported = 0
+        # При DEBUG соединение хранит тексты последних запросов, а запросы
+        # bulk_create длинные
+        with override_settings(DEBUG=False):
+            for name, count in seeding.generate(products, orders, seed, days, confirmed,
+                                                batch_size):
+                if (name == Order._meta.verbose_name_plural and count < orders
+                        and count - reported < PROGRESS_STEP):
+                    continue
+                reported = count
+                self.stdout.write(f'{name}: {count} ({time.monotonic() - started:.0f} с)')
+        self.stdout.write(f'Сводка продаж пересобрана ({time.monotonic() - started:.0f} с)')
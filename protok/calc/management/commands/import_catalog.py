@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calc import pricelists
+
+
+class Command(BaseCommand):
+    help = ('Загружает прайс-лист CSV или XLSX в каталог: новые товары '
+            'создаются, существующие (производитель + наименование) обновляются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('category', choices=sorted(pricelists.CATALOG))
+        parser.add_argument('path', help='Файл .csv или .xlsx')
+        parser.add_argument('--batch-size', type=int, default=pricelists.BATCH_SIZE,
+                            help='Строк в одной транзакции')
+
+    def handle(self, *args, category, path, batch_size, **options):
+        started = time.perf_counter()
+        try:
+            with open(path, 'rb') as file:
+                result = pricelists.import_file(pricelists.CATALOG[category], file, path,
+                                                batch_size)
+        except (OSError, pricelists.PriceListError) as error:
+            raise CommandError(error)
+        for number, message in result.errors:
+            self.stderr.write(f'Строка {number}: {message}')
+        self.stdout.write(f'Загружено строк: {result.imported}, с ошибками: '
+                          f'{len(result.errors)} ({time.perf_counter() - started:.1f} с)')
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from calc import uploads
+
+
+class Command(BaseCommand):
+    help = 'Удаляет незавершенные загрузки файлов по частям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help='Удалять загрузки старше указанного числа часов')
+
+    def handle(self, *args, hours, **options):
+        count = uploads.purge_stale(timedelta(hours=hours))
+        self.stdout.write(f'Удалено загрузок: {count}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from calc import reports
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает сводку продаж по всем подтвержденным заказам, например '
+            'после массового изменения заказов в обход сигналов')
+
+    def handle(self, *args, **options):
+        rows = reports.rebuild()
+        self.stdout.write(f'Строк сводки: {rows}')
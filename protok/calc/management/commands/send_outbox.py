@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from calc import outbox
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди исходящих'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Количество писем на одно SMTP-соединение')
+        parser.add_argument('--loop', action='store_true',
+                            help='Работать непрерывно, опрашивая очередь')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Пауза между опросами пустой очереди, с')
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            try:
+                sent, failed = outbox.drain(batch_size)
+            except Exception as error:
+                if not loop:
+                    raise
+                # Например, база недоступна: письма вернутся в очередь по
+                # истечении аренды, а команда продолжит опрос
+                self.stderr.write(f'Ошибка отправки: {type(error).__name__}: {error}')
+                time.sleep(interval)
+                continue
+            if sent or failed:
+                self.stdout.write(f'Отправлено: {sent}, ошибок: {failed}')
+                continue
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,174 @@
+"""Подбор оборудования каталога по параметрам конфигуратора
+
+Индекс строится один раз на процесс и далее поддерживается
+инкрементально сигналами post_save/post_delete (см. calc.signals),
+поэтому поиск не обращается к базе данных. Изменения, прошедшие мимо
+сигналов (другие процессы, bulk_create), обнаруживаются по версии
+каталога: индекс с устаревшей версией перестраивается целиком.
+"""
+from bisect import bisect_left, insort
+from threading import RLock
+
+from .catalog import catalog_version
+from .models import Transformer, HighVoltageDevice
+
+
+class ProductIndex:
+    """Многоключевой индекс по модели каталога
+
+    Записи группируются по кортежу значений key_fields. Внутри группы
+    они отсортированы по (range_field, price, pk), что позволяет
+    находить точное и ближайшее значение range_field бинарным поиском.
+    """
+
+    def __init__(self, model, key_fields, range_field=None):
+        self.model = model
+        self.key_fields = tuple(key_fields)
+        self.range_field = range_field
+        self._lock = RLock()
+        self._buckets = None
+        self._rows = {}
+        self._version = None
+
+    @property
+    def fields(self):
+        if self.range_field is None:
+            return self.key_fields
+        return self.key_fields + (self.range_field,)
+
+    def _entry(self, values):
+        key = tuple(values[name] for name in self.key_fields)
+        value = values[self.range_field] if self.range_field else 0
+        return key, (value, values['price'], values['pk'])
+
+    def _build(self, version):
+        buckets = {}
+        rows = {}
+        queryset = self.model.objects.values('pk', 'price', *self.fields)
+        for values in queryset.iterator():
+            key, entry = self._entry(values)
+            buckets.setdefault(key, []).append(entry)
+            rows[entry[2]] = (key, entry)
+        for entries in buckets.values():
+            entries.sort()
+        self._buckets = buckets
+        self._rows = rows
+        self._version = version
+
+    def _ensure(self):
+        version = catalog_version()
+        if self._buckets is None or self._version != version:
+            with self._lock:
+                if self._buckets is None or self._version != version:
+                    self._build(version)
+        return self._buckets
+
+    def _key(self, params):
+        try:
+            return tuple(params[name] for name in self.key_fields)
+        except KeyError as error:
+            raise ValueError(f'Не задан параметр {error.args[0]}') from None
+
+    def _advance(self, previous_version, version):
+        """Переводит индекс на новую версию, если он видел предыдущую"""
+        if self._buckets is None:
+            return False
+        if self._version != previous_version:
+            self.invalidate()
+            return False
+        self._version = version
+        return True
+
+    def advance(self, previous_version, version):
+        """Переводит индекс на новую версию после изменения другой модели"""
+        with self._lock:
+            self._advance(previous_version, version)
+
+    def update(self, instance, previous_version, version):
+        """Добавляет или обновляет запись об экземпляре модели
+
+        previous_version и version - версии каталога до и после
+        изменения; если индекс пропустил промежуточные изменения, он
+        сбрасывается и будет перестроен при следующем запросе.
+        """
+        with self._lock:
+            if not self._advance(previous_version, version):
+                return
+            self._discard(instance.pk)
+            values = {name: getattr(instance, name) for name in self.fields}
+            values.update(pk=instance.pk, price=instance.price)
+            key, entry = self._entry(values)
+            insort(self._buckets.setdefault(key, []), entry)
+            self._rows[instance.pk] = (key, entry)
+
+    def remove(self, pk, previous_version, version):
+        """Удаляет запись об экземпляре модели"""
+        with self._lock:
+            if self._advance(previous_version, version):
+                self._discard(pk)
+
+    def _discard(self, pk):
+        row = self._rows.pop(pk, None)
+        if row is None:
+            return
+        key, entry = row
+        entries = self._buckets[key]
+        entries.pop(bisect_left(entries, entry))
+        if not entries:
+            del self._buckets[key]
+
+    def invalidate(self):
+        """Сбрасывает индекс; он будет перестроен при следующем запросе"""
+        with self._lock:
+            self._buckets = None
+            self._rows = {}
+            self._version = None
+
+    def match(self, **params):
+        """Возвращает pk подходящих записей, начиная с самой дешевой"""
+        entries = self._ensure().get(self._key(params), ())
+        if self.range_field is None:
+            return [entry[2] for entry in entries]
+        value = params[self.range_field]
+        start = bisect_left(entries, (value,))
+        result = []
+        for entry in entries[start:]:
+            if entry[0] != value:
+                break
+            result.append(entry[2])
+        return result
+
+    def nearest(self, **params):
+        """Возвращает (значение, pk) для ближайшего значения range_field
+
+        Ищется наименьшее значение не меньше заданного, среди записей с
+        этим значением выбирается самая дешевая. Если подходящих записей
+        нет, возвращается None.
+        """
+        entries = self._ensure().get(self._key(params), ())
+        start = bisect_left(entries, (params[self.range_field],))
+        if start == len(entries):
+            return None
+        value, _, pk = entries[start]
+        return value, pk
+
+
+transformers = ProductIndex(
+    Transformer,
+    # Напряжение в ключе: трансформатор совместим только с устройством
+    # ВН того же напряжения
+    key_fields=('transformer_type', 'connection_scheme', 'voltage'),
+    range_field='power',
+)
+
+hv_devices = ProductIndex(
+    HighVoltageDevice,
+    key_fields=('input_type', 'voltage', 'arrester', 'equipment_type',
+                'connection_type'),
+)
+
+INDEXES = {
+    Transformer: transformers,
+    HighVoltageDevice: hv_devices,
+}
+
@@ -0,0 +1,193 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import phonenumber_field.modelfields
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Client',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=254, verbose_name='ФИО')),
+                ('organization', models.CharField(max_length=254, verbose_name='Наименование организации')),
+                ('email', models.EmailField(max_length=254, verbose_name='E-mail')),
+                ('phone_number', phonenumber_field.modelfields.PhoneNumberField(max_length=128, region=None, verbose_name='Номер телефона')),
+            ],
+            options={
+                'verbose_name': 'Клиент',
+                'verbose_name_plural': 'Клиенты',
+            },
+        ),
+        migrations.CreateModel(
+            name='ComlexTransformerSubstation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Наименование')),
+                ('manufacturer', models.CharField(max_length=200, verbose_name='Производитель')),
+                ('price', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Стоимость')),
+                ('type_station', models.CharField(choices=[('Киосковая тупиковая', 'КТП/Т'), ('Киосковая проходная', 'КТП/П'), ("Тупиковая утепленная типа 'сэндвич'", 'КТП/TC'), ("Проходная утепленная типа 'сэндвич'", 'КТП/ПС')], default='Киосковая тупиковая', max_length=124, verbose_name='Тип подстанции')),
+                ('documentation', models.FileField(upload_to='documentation/substations', verbose_name='Дополнительные файлы')),
+            ],
+            options={
+                'verbose_name': 'Комплексная трансформаторная подстанция',
+                'verbose_name_plural': 'Комплексные трансформаторные подстанции',
+            },
+        ),
+        migrations.CreateModel(
+            name='Fiders',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Наименование')),
+                ('manufacturer', models.CharField(max_length=200, verbose_name='Производитель')),
+                ('price', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Стоимость')),
+                ('amperage', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Сила тока, A')),
+                ('documentation', models.FileField(upload_to='documentation/fiders', verbose_name='Дополнительные файлы')),
+            ],
+            options={
+                'verbose_name': 'Фидер',
+                'verbose_name_plural': 'Фидеры',
+            },
+        ),
+        migrations.CreateModel(
+            name='HighVoltageDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Наименование')),
+                ('manufacturer', models.CharField(max_length=200, verbose_name='Производитель')),
+                ('price', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Стоимость')),
+                ('input_type', models.IntegerField(choices=[(0, 'Воздух'), (1, 'Кабель')], default=1, verbose_name='Ввод')),
+                ('voltage', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Номинальное напряжение на стороне ВН')),
+                ('arrester', models.IntegerField(choices=[(0, 'РВО'), (1, 'ОПН'), (2, 'Нет')], default=2, verbose_name='Тип разрядника')),
+                ('equipment_type', models.IntegerField(choices=[(0, 'ВНА'), (1, 'РВЗ'), (2, 'РЛНД'), (3, 'Нет')], default=0, verbose_name='Тип оборудования РУНВ')),
+                ('registration', models.BooleanField(default=True, verbose_name='Наличие учета по стороне ВН')),
+                ('connection_type', models.IntegerField(choices=[(0, 'Кабель'), (1, 'Шина')], default=0, verbose_name='Тип соединения РУНВ-Трансформатор')),
+                ('documentation', models.FileField(upload_to='documentation/hv_devices', verbose_name='Конструкторская документация')),
+            ],
+            options={
+                'verbose_name': 'Устройство ВН',
+                'verbose_name_plural': 'Устройства ВН',
+            },
+        ),
+        migrations.CreateModel(
+            name='LowVoltageDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Наименование')),
+                ('manufacturer', models.CharField(max_length=200, verbose_name='Производитель')),
+                ('price', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Стоимость')),
+                ('input_type', models.IntegerField(choices=[(0, 'Воздух'), (1, 'Кабель')], default=1, verbose_name='Ввод')),
+                ('arrester', models.IntegerField(choices=[(0, 'РВН'), (1, 'ОПН'), (2, 'Нет')], default=2, verbose_name='Тип разрядника')),
+                ('voltage', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Номинальное напряжение на стороне НН')),
+                ('input_device', models.IntegerField(choices=[(0, 'Разъединитель'), (1, 'Автоматический выключатель'), (2, 'Разъединитель + Автоматический выключатель')], default=0, verbose_name='Вводное устройство')),
+                ('input_denomination', models.IntegerField(default=100, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Номинал вводного устройства')),
+                ('registration', models.BooleanField(default=True, verbose_name='Наличие учета по стороне ВН')),
+                ('connection_type', models.IntegerField(choices=[(0, 'Кабель'), (1, 'Шина')], default=0, verbose_name='Тип соединения Трансформатор-РУНН')),
+                ('documentation', models.FileField(upload_to='documentation/ll_devices', verbose_name='Конструкторская документация')),
+            ],
+            options={
+                'verbose_name': 'Устройство НН',
+                'verbose_name_plural': 'Устройства НН',
+            },
+        ),
+        migrations.CreateModel(
+            name='Transformer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Наименование')),
+                ('manufacturer', models.CharField(max_length=200, verbose_name='Производитель')),
+                ('price', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Стоимость')),
+                ('transformer_type', models.CharField(choices=[('ТМ', 'Масляный'), ('ТМГ', 'Масляный герметичный'), ('Сухой', 'Dry')], default='Сухой', max_length=5, verbose_name='Тип трансформатора')),
+                ('connection_scheme', models.CharField(choices=[('Д/У', 'Треугольник/Звезда'), ('У/У', 'Звезда/Звезда')], default='У/У', max_length=10, verbose_name='Схема соединения обмоток')),
+                ('power', models.IntegerField(validators=[django.core.validators.MinValueValidator(20), django.core.validators.MaxValueValidator(630)], verbose_name='Мощность трансформатора')),
+                ('voltage', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Напряжение трансформатора')),
+                ('documentation', models.FileField(upload_to='documentation/transformers', verbose_name='Конструкторская документация')),
+                ('count', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Количество трансформаторов')),
+            ],
+            options={
+                'verbose_name': 'Силовой трансформатор',
+                'verbose_name_plural': 'Силовые трансформаторы',
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=254, verbose_name='Имя файла')),
+                ('size', models.BigIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Размер файла')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256 файла')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Загружено байт')),
+                ('completed', models.BooleanField(default=False, verbose_name='Загрузка завершена')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Загрузка файла',
+                'verbose_name_plural': 'Загрузки файлов',
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment', models.TextField(blank=True, max_length=1024, null=True, verbose_name='Дополнительные требования')),
+                ('create_date', models.DateField(auto_now_add=True, verbose_name='Дата')),
+                ('documentation', models.FileField(upload_to='orders/', verbose_name='Дополнительные файлы')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='calc.client')),
+                ('hv_device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calc.highvoltagedevice')),
+                ('lv_device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calc.lowvoltagedevice')),
+                ('substation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calc.comlextransformersubstation')),
+                ('transformer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calc.transformer')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+            },
+        ),
+        migrations.CreateModel(
+            name='Section',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('denomination', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Номинальный ток')),
+                ('count', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Количество линий')),
+                ('fider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calc.fiders')),
+                ('lv_device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='calc.lowvoltagedevice')),
+            ],
+            options={
+                'verbose_name': 'Секция',
+                'verbose_name_plural': 'Секции',
+            },
+        ),
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=254, verbose_name='Тема')),
+                ('body', models.TextField(verbose_name='Текст письма')),
+                ('recipient', models.EmailField(max_length=254, verbose_name='Получатель')),
+                ('attach_documentation', models.BooleanField(default=True, verbose_name='Приложить документацию заказа')),
+                ('status', models.IntegerField(choices=[(0, 'В очереди'), (1, 'Отправлено'), (2, 'Ошибка')], default=0, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток отправки')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='calc.order')),
+            ],
+            options={
+                'verbose_name': 'Исходящее письмо',
+                'verbose_name_plural': 'Исходящие письма',
+                'indexes': [models.Index(fields=['status', 'next_attempt'], name='calc_outbox_pending_idx')],
+            },
+        ),
+    ]
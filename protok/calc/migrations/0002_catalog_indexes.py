@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['email'], name='calc_client_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='highvoltagedevice',
+            index=models.Index(fields=['voltage', 'equipment_type', 'input_type', 'price'], name='calc_hv_device_match_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lowvoltagedevice',
+            index=models.Index(fields=['voltage', 'input_device', 'input_denomination'], name='calc_lv_device_match_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['create_date', 'id'], name='calc_order_create_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transformer',
+            index=models.Index(fields=['transformer_type', 'connection_scheme', 'power', 'price'], name='calc_transformer_match_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:39
+
+from django.db import migrations, models
+from django.db.models import CASCADE, Count, Min
+
+CATALOG_MODELS = ('ComlexTransformerSubstation', 'Fiders', 'HighVoltageDevice',
+                  'LowVoltageDevice', 'Transformer')
+
+
+def merge_duplicate_products(apps, schema_editor):
+    """Ссылки на повторяющиеся товары переносятся на первую запись
+
+    Записи, принадлежащие товару (секции устройства НН), удаляются вместе
+    с повторами: у первой записи они уже есть.
+    """
+    for name in CATALOG_MODELS:
+        model = apps.get_model('calc', name)
+        relations = [relation for relation in model._meta.related_objects
+                     if relation.one_to_many and relation.on_delete is not CASCADE]
+        groups = model.objects.values('manufacturer', 'name').annotate(
+            count=Count('pk'), first=Min('pk')
+        ).filter(count__gt=1).order_by()
+        for group in groups.iterator():
+            duplicates = model.objects.filter(
+                manufacturer=group['manufacturer'], name=group['name']
+            ).exclude(pk=group['first'])
+            for relation in relations:
+                field = relation.field.name
+                relation.related_model.objects.filter(**{f'{field}__in': duplicates}).update(
+                    **{field: group['first']}
+                )
+            duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0002_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_products, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='comlextransformersubstation',
+            constraint=models.UniqueConstraint(fields=('manufacturer', 'name'), name='calc_comlextransformersubstation_product_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='fiders',
+            constraint=models.UniqueConstraint(fields=('manufacturer', 'name'), name='calc_fiders_product_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='highvoltagedevice',
+            constraint=models.UniqueConstraint(fields=('manufacturer', 'name'), name='calc_highvoltagedevice_product_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='lowvoltagedevice',
+            constraint=models.UniqueConstraint(fields=('manufacturer', 'name'), name='calc_lowvoltagedevice_product_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='transformer',
+            constraint=models.UniqueConstraint(fields=('manufacturer', 'name'), name='calc_transformer_product_key'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+COMPONENTS = ('substation', 'transformer', 'hv_device', 'lv_device')
+
+
+def take_price_snapshot(apps, schema_editor):
+    """Снимок цен существующих заказов по текущему каталогу"""
+    Order = apps.get_model('calc', 'Order')
+    Section = apps.get_model('calc', 'Section')
+    OrderSection = apps.get_model('calc', 'OrderSection')
+    orders = Order.objects.select_related(*COMPONENTS).order_by('pk')
+    # Секции каталога читаются одним запросом, а не отдельно для каждого заказа
+    sections = {}
+    for section in Section.objects.select_related('fider').order_by('pk').iterator():
+        sections.setdefault(section.lv_device_id, []).append(section)
+    batch = []
+    lines = []
+    for order in orders.iterator(chunk_size=500):
+        for component in COMPONENTS:
+            product = getattr(order, component)
+            setattr(order, f'{component}_price', product.price if product else 0)
+        order.sections_price = 0
+        if order.lv_device_id is not None:
+            for section in sections.get(order.lv_device_id, ()):
+                unit_price = section.fider.price if section.fider else 0
+                lines.append(OrderSection(
+                    order=order, fider=section.fider,
+                    name=section.fider.name if section.fider else '',
+                    denomination=section.denomination, count=section.count,
+                    unit_price=unit_price, price=section.count * unit_price,
+                ))
+                order.sections_price += section.count * unit_price
+        order.total_price = order.sections_price + sum(
+            getattr(order, f'{component}_price') for component in COMPONENTS
+        )
+        batch.append(order)
+        if len(batch) >= 500:
+            Order.objects.bulk_update(batch, [f'{component}_price' for component in COMPONENTS]
+                                      + ['sections_price', 'total_price'])
+            OrderSection.objects.bulk_create(lines)
+            batch, lines = [], []
+    Order.objects.bulk_update(batch, [f'{component}_price' for component in COMPONENTS]
+                              + ['sections_price', 'total_price'])
+    OrderSection.objects.bulk_create(lines)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0003_product_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='confirmed',
+            field=models.BooleanField(default=False, verbose_name='Подтвержден'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='hv_device_price',
+            field=models.FloatField(default=0, verbose_name='Стоимость устройства ВН'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='lv_device_price',
+            field=models.FloatField(default=0, verbose_name='Стоимость устройства НН'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='sections_price',
+            field=models.FloatField(default=0, verbose_name='Стоимость секций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='substation_price',
+            field=models.FloatField(default=0, verbose_name='Стоимость КТП'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.FloatField(default=0, verbose_name='Стоимость'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='transformer_price',
+            field=models.FloatField(default=0, verbose_name='Стоимость трансформатора'),
+        ),
+        migrations.CreateModel(
+            name='OrderSection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=200, verbose_name='Фидер')),
+                ('denomination', models.IntegerField(verbose_name='Номинальный ток')),
+                ('count', models.IntegerField(verbose_name='Количество линий')),
+                ('unit_price', models.FloatField(default=0, verbose_name='Стоимость линии')),
+                ('price', models.FloatField(default=0, verbose_name='Стоимость')),
+                ('fider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calc.fiders')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='calc.order')),
+            ],
+            options={
+                'verbose_name': 'Секция заказа',
+                'verbose_name_plural': 'Секции заказа',
+            },
+        ),
+        migrations.RunPython(take_price_snapshot, migrations.RunPython.noop),
+    ]
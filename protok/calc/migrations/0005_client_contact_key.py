@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:22
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0004_order_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='client',
+            name='calc_client_email_idx',
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='email_key',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(django.db.models.functions.text.Trim('email')), output_field=models.CharField(max_length=254)),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['client', 'create_date', 'id'], name='calc_order_client_date_idx'),
+        ),
+    ]
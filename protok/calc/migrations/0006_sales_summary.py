@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0005_client_contact_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Всего'), ('power', 'Мощность трансформатора'), ('type_station', 'Тип подстанции'), ('manufacturer', 'Производитель')], max_length=20, verbose_name='Разрез')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('key', models.CharField(blank=True, max_length=200, verbose_name='Значение')),
+                ('volume', models.BigIntegerField(default=0, verbose_name='Объем')),
+                ('revenue', models.FloatField(default=0, verbose_name='Выручка')),
+            ],
+            options={
+                'verbose_name': 'Сводка продаж',
+                'verbose_name_plural': 'Сводки продаж',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'month', 'key'), name='calc_sales_summary_key')],
+            },
+        ),
+    ]
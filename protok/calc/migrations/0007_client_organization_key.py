@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:54
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0006_sales_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='organization_key',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.functions.text.Lower('organization'), output_field=models.CharField(max_length=254)),
+        ),
+    ]
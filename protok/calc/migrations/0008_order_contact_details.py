@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+
+
+def copy_client_details(apps, schema_editor):
+    """Существующие заказы получают текущие данные своих клиентов"""
+    Client = apps.get_model('calc', 'Client')
+    Order = apps.get_model('calc', 'Order')
+    clients = Client.objects.filter(pk=OuterRef('client'))
+    Order.objects.update(full_name=Subquery(clients.values('full_name')[:1]),
+                         organization=Subquery(clients.values('organization')[:1]))
+
+
+def merge_duplicate_clients(apps, schema_editor):
+    """Заказы повторяющихся клиентов переносятся на первую запись
+
+    Выполняется после copy_client_details: заказы сохраняют данные
+    клиента, от имени которого были оформлены.
+    """
+    Client = apps.get_model('calc', 'Client')
+    Order = apps.get_model('calc', 'Order')
+    groups = Client.objects.values('email_key', 'phone_number').annotate(
+        count=Count('pk'), first=Min('pk')
+    ).filter(count__gt=1).order_by()
+    for group in groups.iterator():
+        duplicates = Client.objects.filter(
+            email_key=group['email_key'], phone_number=group['phone_number']
+        ).exclude(pk=group['first'])
+        Order.objects.filter(client__in=duplicates).update(client=group['first'])
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0007_client_organization_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='full_name',
+            field=models.CharField(blank=True, max_length=254, verbose_name='ФИО заказчика'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='organization',
+            field=models.CharField(blank=True, max_length=254, verbose_name='Наименование организации заказчика'),
+        ),
+        migrations.RunPython(copy_client_details, migrations.RunPython.noop),
+        migrations.RunPython(merge_duplicate_clients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='client',
+            constraint=models.UniqueConstraint(fields=('email_key', 'phone_number'), name='calc_client_contact_key'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+COMPONENTS = {
+    'substation': 'ComlexTransformerSubstation',
+    'transformer': 'Transformer',
+    'hv_device': 'HighVoltageDevice',
+    'lv_device': 'LowVoltageDevice',
+}
+
+
+def take_dimensions(apps, schema_editor):
+    """Разрезы уже подтвержденных заказов по текущему каталогу"""
+    Order = apps.get_model('calc', 'Order')
+    OrderSection = apps.get_model('calc', 'OrderSection')
+
+    def value(model, component, field):
+        model = apps.get_model('calc', model)
+        return Subquery(model.objects.filter(pk=OuterRef(component)).values(field)[:1])
+
+    confirmed = Order.objects.filter(confirmed=True)
+    OrderSection.objects.filter(order__in=confirmed).update(
+        manufacturer=value('Fiders', 'fider', 'manufacturer')
+    )
+    confirmed.update(
+        transformer_power=value('Transformer', 'transformer', 'power'),
+        type_station=value('ComlexTransformerSubstation', 'substation', 'type_station'),
+        **{f'{component}_manufacturer': value(model, component, 'manufacturer')
+           for component, model in COMPONENTS.items()},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calc', '0008_order_contact_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='hv_device_manufacturer',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='Производитель устройства ВН'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='lv_device_manufacturer',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='Производитель устройства НН'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='substation_manufacturer',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='Производитель КТП'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='transformer_manufacturer',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='Производитель трансформатора'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='transformer_power',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Мощность трансформатора'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='type_station',
+            field=models.CharField(blank=True, max_length=124, null=True, verbose_name='Тип подстанции'),
+        ),
+        migrations.AddField(
+            model_name='ordersection',
+            name='manufacturer',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='Производитель фидера'),
+        ),
+        migrations.RunPython(take_dimensions, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+import uuid
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Lower, Trim
 from django.core.validators import MinValueValidator
 from django.core.validators import MaxValueValidator
+from django.utils import timezone
 
 from phonenumber_field.modelfields import PhoneNumberField
 
@@ -45,6 +50,11 @@ class Product(models.Model):
 
     class Meta:
         abstract = True
+        constraints = [
+            # Ключ строки прайс-листа при импорте (calc.pricelists)
+            models.UniqueConstraint(fields=['manufacturer', 'name'],
+                                    name='%(app_label)s_%(class)s_product_key'),
+        ]
 
     name = models.CharField(verbose_name='Наименование', max_length=200)
     manufacturer = models.CharField(verbose_name='Производитель', max_length=200)
@@ -61,9 +71,16 @@ class Product(models.Model):
 class Transformer(Product):
     """Модель трансформатора"""
 
-    class Meta:
+    class Meta(Product.Meta):
         verbose_name = "Силовой трансформатор"
         verbose_name_plural = "Силовые трансформаторы"
+        indexes = [
+            # Подбор: равенство по типу и схеме, диапазон по мощности;
+            # цена в конце индекса позволяет выбрать самый дешевый
+            # вариант без чтения таблицы
+            models.Index(fields=['transformer_type', 'connection_scheme', 'power', 'price'],
+                         name='calc_transformer_match_idx'),
+        ]
 
     class TransformerTypes(models.TextChoices):
         """Типы трансформаторов"""
@@ -108,9 +125,13 @@ class Transformer(Product):
 class HighVoltageDevice(Product):
     """Модель устройства высокого напряжения"""
 
-    class Meta:
+    class Meta(Product.Meta):
         verbose_name = "Устройство ВН"
         verbose_name_plural = "Устройства ВН"
+        indexes = [
+            models.Index(fields=['voltage', 'equipment_type', 'input_type', 'price'],
+                         name='calc_hv_device_match_idx'),
+        ]
 
     class EquipmentTypes(models.IntegerChoices):
         INPUT_AUTOGAS = 0, 'ВНА'
@@ -161,9 +182,13 @@ class HighVoltageDevice(Product):
 class LowVoltageDevice(Product):
     """Модель устройства низкого напряжения"""
 
-    class Meta:
+    class Meta(Product.Meta):
         verbose_name = "Устройство НН"
         verbose_name_plural = "Устройства НН"
+        indexes = [
+            models.Index(fields=['voltage', 'input_device', 'input_denomination'],
+                         name='calc_lv_device_match_idx'),
+        ]
 
     class InputDeviceTypes(models.IntegerChoices):
         DISCONNECTOR = 0, 'Разъединитель'
@@ -216,7 +241,7 @@ class LowVoltageDevice(Product):
 
 
 class ComlexTransformerSubstation(Product):
-    class Meta:
+    class Meta(Product.Meta):
         verbose_name = "Комплексная трансформаторная подстанция"
         verbose_name_plural = "Комплексные трансформаторные подстанции"
 
@@ -237,7 +262,7 @@ class ComlexTransformerSubstation(Product):
 
 
 class Fiders(Product):
-    class Meta:
+    class Meta(Product.Meta):
         verbose_name = "Фидер"
         verbose_name_plural = "Фидеры"
 
@@ -280,31 +305,223 @@ class Section(models.Model):
 
     @property
     def price(self):
+        if self.fider is None:
+            return 0
         return self.count * self.fider.price
 
 
+def sections_price(lv_device):
+    """Выражение суммарной стоимости линий секций устройства НН
+
+    lv_device - ссылка на устройство НН (обычно OuterRef). Секции без
+    фидера не учитываются, при отсутствии секций результат равен 0.
+    """
+    sections = Section.objects.filter(
+        lv_device=lv_device
+    ).order_by().values('lv_device').annotate(
+        total=Sum(F('count') * F('fider__price'),
+                  output_field=models.FloatField())
+    ).values('total')
+    return Coalesce(Subquery(sections), Value(0.0, output_field=models.FloatField()))
+
+
+def _email_key(email):
+    return Lower(Trim(email))
+
+
+class ClientQuerySet(models.QuerySet):
+
+    def resolve(self, email, phone_number, **details):
+        """Клиент с тем же e-mail (без учета регистра) и телефоном
+
+        Если такого клиента нет, он создается. У найденного клиента
+        заполняются только пустые поля: заказ оформляют без входа, и
+        указанные в нем ФИО и организация сохраняются в самом заказе
+        (Order.full_name, Order.organization).
+        """
+        lookup = {'email_key': _email_key(Value(email, output_field=models.CharField())),
+                  'phone_number': phone_number}
+        client = self.filter(**lookup).first()
+        if client is None:
+            try:
+                with transaction.atomic():
+                    return self.create(email=email, phone_number=phone_number, **details)
+            except IntegrityError:
+                # Того же клиента одновременно создал другой запрос
+                client = self.get(**lookup)
+        changed = [name for name, value in details.items() if value and not getattr(client, name)]
+        if changed:
+            for name in changed:
+                setattr(client, name, details[name])
+            client.save(update_fields=changed)
+        return client
+
+
 class Client(models.Model):
-    """Модель клиента"""
+    """Модель клиента
+
+    Клиент определяется e-mail без учета регистра и пробелов по краям
+    (email_key) и телефоном в формате E.164, поэтому повторный заказ
+    того же клиента не создает новую запись.
+    """
 
     class Meta:
         verbose_name = "Клиент"
         verbose_name_plural = "Клиенты"
+        constraints = [
+            models.UniqueConstraint(fields=['email_key', 'phone_number'],
+                                    name='calc_client_contact_key'),
+        ]
 
     full_name = models.CharField(verbose_name='ФИО', max_length=254)
     organization = models.CharField(verbose_name='Наименование организации', max_length=254)
     email = models.EmailField(verbose_name='E-mail', max_length=254)
+    email_key = models.GeneratedField(
+        expression=_email_key('email'), output_field=models.CharField(max_length=254),
+        db_persist=True,
+    )
     phone_number = PhoneNumberField(verbose_name='Номер телефона')
+    # Поиск заказов по началу наименования организации (calc.admin)
+    organization_key = models.GeneratedField(
+        expression=Lower('organization'), output_field=models.CharField(max_length=254),
+        db_persist=True, db_index=True,
+    )
+
+    objects = ClientQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.organization}'
 
 
+# Компонент заказа -> модель каталога
+ORDER_COMPONENTS = {
+    'substation': ComlexTransformerSubstation,
+    'transformer': Transformer,
+    'hv_device': HighVoltageDevice,
+    'lv_device': LowVoltageDevice,
+}
+
+# Разрезы сводки продаж (calc.reports), которые запоминаются в заказе
+# при подтверждении
+SALES_DIMENSION_FIELDS = ('transformer_power', 'type_station') + tuple(
+    f'{component}_manufacturer' for component in ORDER_COMPONENTS
+)
+
+# Пересчет снимка цен обрабатывает заказы пачками такого размера
+REFRESH_BATCH_SIZE = 500
+
+
+def _product_value(model, component, field):
+    return Subquery(model.objects.filter(pk=OuterRef(component)).values(field)[:1])
+
+
+def _zero():
+    return Value(0.0, output_field=models.FloatField())
+
+
+def _total_price(sections=None, **prices):
+    """Выражение полной стоимости заказа из сохраненных цен
+
+    prices переопределяет цену компонента (component=значение),
+    sections - сумму по секциям.
+    """
+    total = sections if sections is not None else F('sections_price')
+    for component in ORDER_COMPONENTS:
+        price = prices.get(component)
+        total = total + (F(f'{component}_price') if price is None
+                         else Value(price, output_field=models.FloatField()))
+    return total
+
+
+def _lines_price():
+    lines = OrderSection.objects.filter(
+        order=OuterRef('pk')
+    ).order_by().values('order').annotate(total=Sum('price')).values('total')
+    return Coalesce(Subquery(lines), _zero())
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def open(self):
+        """Неподтвержденные заказы, цены которых следуют за каталогом"""
+        return self.filter(confirmed=False)
+
+    def set_component_price(self, component, price):
+        """Записывает новую цену компонента одним UPDATE
+
+        Заказы, где цена уже совпадает, не затрагиваются.
+        """
+        return self.exclude(**{f'{component}_price': price}).update(**{
+            f'{component}_price': price,
+            'total_price': _total_price(**{component: price}),
+        })
+
+    def take_dimensions(self):
+        """Запоминает разрезы сводки продаж по текущему каталогу
+
+        Вклад подтвержденного заказа в сводку считается по этим значениям,
+        поэтому не меняется при изменении и удалении оборудования.
+        """
+        OrderSection.objects.filter(order__in=self).update(
+            manufacturer=_product_value(Fiders, 'fider', 'manufacturer')
+        )
+        return self.update(
+            transformer_power=_product_value(Transformer, 'transformer', 'power'),
+            type_station=_product_value(ComlexTransformerSubstation, 'substation',
+                                        'type_station'),
+            **{f'{component}_manufacturer': _product_value(model, component, 'manufacturer')
+               for component, model in ORDER_COMPONENTS.items()},
+        )
+
+    def refresh_sections_price(self):
+        """Пересчитывает сумму по строкам секций и полную стоимость"""
+        lines = _lines_price()
+        return self.update(sections_price=lines, total_price=_total_price(sections=lines))
+
+    def refresh_prices(self):
+        """Снимает цены компонентов и секций из текущего каталога
+
+        Строки секций заказов создаются заново по секциям устройства НН.
+        """
+        pks = list(self.values_list('pk', flat=True))
+        for start in range(0, len(pks), REFRESH_BATCH_SIZE):
+            orders = Order.objects.filter(pk__in=pks[start:start + REFRESH_BATCH_SIZE])
+            orders.update(**{
+                f'{component}_price': Coalesce(_product_value(model, component, 'price'), _zero())
+                for component, model in ORDER_COMPONENTS.items()
+            })
+            OrderSection.objects.filter(order__in=orders).delete()
+            lv_devices = dict(orders.filter(lv_device__isnull=False).values_list('pk', 'lv_device'))
+            sections = {}
+            for section in Section.objects.filter(
+                lv_device__in=set(lv_devices.values())
+            ).select_related('fider').order_by('pk'):
+                sections.setdefault(section.lv_device_id, []).append(section)
+            OrderSection.objects.bulk_create(
+                OrderSection.from_section(order, section)
+                for order, lv_device in lv_devices.items()
+                for section in sections.get(lv_device, ())
+            )
+            orders.refresh_sections_price()
+
+
 class Order(models.Model):
-    """Модель заказа"""
+    """Модель заказа
+
+    Цены компонентов и секций сохраняются в заказе. Пока заказ не
+    подтвержден, они обновляются при изменении каталога (calc.signals),
+    после подтверждения остаются неизменными.
+    """
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        indexes = [
+            models.Index(fields=['create_date', 'id'], name='calc_order_create_date_idx'),
+            # История заказов клиента (calc.views.client_orders)
+            models.Index(fields=['client', 'create_date', 'id'],
+                         name='calc_order_client_date_idx'),
+        ]
 
     transformer = models.ForeignKey(
         to=Transformer, on_delete=models.SET_NULL,
@@ -325,6 +542,12 @@ class Order(models.Model):
 
     # Информация о клиенте
     client = models.ForeignKey(to=Client, on_delete=models.CASCADE)
+    # Данные, указанные при оформлении; у заказов, созданных без формы,
+    # пусты, и вместо них показываются данные клиента
+    full_name = models.CharField(verbose_name='ФИО заказчика', max_length=254, blank=True)
+    organization = models.CharField(
+        verbose_name='Наименование организации заказчика', max_length=254, blank=True
+    )
     comment = models.TextField(
         verbose_name='Дополнительные требования', max_length=1024,
         null=True, blank=True
@@ -335,23 +558,228 @@ class Order(models.Model):
         upload_to='orders/',
     )
 
+    # Снимок цен
+    confirmed = models.BooleanField(verbose_name='Подтвержден', default=False)
+    substation_price = models.FloatField(verbose_name='Стоимость КТП', default=0)
+    transformer_price = models.FloatField(verbose_name='Стоимость трансформатора', default=0)
+    hv_device_price = models.FloatField(verbose_name='Стоимость устройства ВН', default=0)
+    lv_device_price = models.FloatField(verbose_name='Стоимость устройства НН', default=0)
+    sections_price = models.FloatField(verbose_name='Стоимость секций', default=0)
+    total_price = models.FloatField(verbose_name='Стоимость', default=0)
+
+    # Разрезы сводки продаж на момент подтверждения; пусто - компонента
+    # в заказе не было (SALES_DIMENSION_FIELDS)
+    transformer_power = models.IntegerField(
+        verbose_name='Мощность трансформатора', null=True, blank=True
+    )
+    type_station = models.CharField(
+        verbose_name='Тип подстанции', max_length=124, null=True, blank=True
+    )
+    substation_manufacturer = models.CharField(
+        verbose_name='Производитель КТП', max_length=200, null=True, blank=True
+    )
+    transformer_manufacturer = models.CharField(
+        verbose_name='Производитель трансформатора', max_length=200, null=True, blank=True
+    )
+    hv_device_manufacturer = models.CharField(
+        verbose_name='Производитель устройства ВН', max_length=200, null=True, blank=True
+    )
+    lv_device_manufacturer = models.CharField(
+        verbose_name='Производитель устройства НН', max_length=200, null=True, blank=True
+    )
+
+    objects = OrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = instance._price_state()
+        return instance
+
+    def _price_state(self):
+        # Атрибуты читаются из __dict__, чтобы не загружать отложенные поля
+        return (self.__dict__.get('confirmed'),) + tuple(
+            self.__dict__.get(f'{component}_id') for component in ORDER_COMPONENTS
+        )
+
+    def save(self, *args, **kwargs):
+        state = self._price_state()
+        loaded = getattr(self, '_loaded_state', (False,) + (None,) * len(ORDER_COMPONENTS))
+        if self.confirmed and loaded[0] is not True and (self._state.adding
+                                                         or state[1:] != loaded[1:]):
+            # Новый заказ или заказ со сменой компонентов сохраняется
+            # открытым и подтверждается вторым сохранением: снимок цен
+            # успевает обновиться, и в сводку продаж (calc.signals) заказ
+            # входит уже с ним
+            with transaction.atomic(using=kwargs.get('using')):
+                self.confirmed = False
+                self.save(*args, **kwargs)
+                self.confirmed = True
+                self.save(using=kwargs.get('using'), update_fields=['confirmed'])
+            return
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            # Разрезы сводки запоминаются до того, как сигналы (calc.signals)
+            # посчитают вклад подтвержденного заказа. Компоненты в базе уже
+            # те же, что в заказе: заказ со сменой компонентов
+            # подтверждается вторым сохранением (см. выше)
+            if self.confirmed and loaded[0] is not True and Order.objects.filter(
+                pk=self.pk, confirmed=False
+            ).take_dimensions():
+                self.refresh_from_db(fields=SALES_DIMENSION_FIELDS)
+            super().save(*args, **kwargs)
+        # Снимок берется при создании заказа с компонентами, а затем
+        # обновляется, только если у открытого заказа сменились компоненты
+        # или с заказа снято подтверждение
+        if not self.confirmed and state != loaded:
+            Order.objects.filter(pk=self.pk).refresh_prices()
+            self.refresh_from_db(fields=[f'{component}_price' for component in ORDER_COMPONENTS]
+                                 + ['sections_price', 'total_price'])
+        self._loaded_state = state
+
     @property
     def count_price(self):
-        substation_price = self.substation.price
-        transformer_price = self.transformer.price
-        hv_device_price = self.hv_device.price
-        lv_device_price = self.lv_device.price
-        all_section = self.lv_device.section_set.all()
-        section_price = sum(item.price for item in all_section)
-        return (substation_price + transformer_price +
-                hv_device_price + lv_device_price + section_price)
+        return self.total_price
+
+    def documentation_files(self):
+        """Пары (раздел, файл) документации по компонентам заказа"""
+        components = [('substation', self.substation),
+                      ('transformer', self.transformer),
+                      ('hv_device', self.hv_device),
+                      ('lv_device', self.lv_device)]
+        documentation = [(name, item.documentation) for name, item in components
+                         if item is not None]
+        if self.lv_device is not None:
+            all_section = self.lv_device.section_set.select_related('fider')
+            documentation += [('fiders', item.fider.documentation)
+                              for item in all_section if item.fider is not None]
+        return [(name, item) for name, item in documentation if item]
 
     def documentation_assembling(self):
-        substation_documentation = self.substation.documentation
-        transformer_documentation = self.transformer.documentation
-        hv_device_documentation = self.hv_device.documentation
-        lv_device_documentation = self.lv_device.documentation
-        all_section = self.lv_device.section_set.all()
-        section_documentation = [item.fider.documentation for item in all_section]
-        return [substation_documentation, transformer_documentation,
-                hv_device_documentation, lv_device_documentation] + section_documentation
+        return [item for _, item in self.documentation_files()]
+
+
+class OrderSection(models.Model):
+    """Строка секции НН в снимке цен заказа"""
+
+    class Meta:
+        verbose_name = "Секция заказа"
+        verbose_name_plural = "Секции заказа"
+
+    order = models.ForeignKey(
+        to=Order, on_delete=models.CASCADE, related_name='sections'
+    )
+    fider = models.ForeignKey(
+        to=Fiders, on_delete=models.SET_NULL,
+        null=True, blank=True
+    )
+    name = models.CharField(verbose_name='Фидер', max_length=200, blank=True)
+    # Запоминается при подтверждении заказа, как и разрезы в Order
+    manufacturer = models.CharField(
+        verbose_name='Производитель фидера', max_length=200, null=True, blank=True
+    )
+    denomination = models.IntegerField(verbose_name='Номинальный ток')
+    count = models.IntegerField(verbose_name="Количество линий")
+    unit_price = models.FloatField(verbose_name='Стоимость линии', default=0)
+    price = models.FloatField(verbose_name='Стоимость', default=0)
+
+    @classmethod
+    def from_section(cls, order_id, section):
+        fider = section.fider
+        unit_price = fider.price if fider is not None else 0
+        return cls(order_id=order_id, fider=fider, name=fider.name if fider else '',
+                   denomination=section.denomination, count=section.count,
+                   unit_price=unit_price, price=section.count * unit_price)
+
+
+class SalesSummary(models.Model):
+    """Продажи (подтвержденные заказы) за месяц в одном из разрезов
+
+    Поддерживается calc.reports при сохранении и удалении заказов,
+    перестраивается командой rebuild_sales_summary.
+    """
+
+    class Meta:
+        verbose_name = "Сводка продаж"
+        verbose_name_plural = "Сводки продаж"
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'month', 'key'],
+                                    name='calc_sales_summary_key'),
+        ]
+
+    class Dimensions(models.TextChoices):
+        TOTAL = 'total', 'Всего'
+        POWER = 'power', 'Мощность трансформатора'
+        TYPE_STATION = 'type_station', 'Тип подстанции'
+        MANUFACTURER = 'manufacturer', 'Производитель'
+
+    dimension = models.CharField(verbose_name='Разрез', choices=Dimensions.choices, max_length=20)
+    month = models.DateField(verbose_name='Месяц')
+    # Значение разреза: мощность, тип подстанции или производитель;
+    # пусто, если компонента в заказе нет
+    key = models.CharField(verbose_name='Значение', max_length=200, blank=True)
+    # Число заказов, для производителя - число поставленных единиц
+    volume = models.BigIntegerField(verbose_name='Объем', default=0)
+    revenue = models.FloatField(verbose_name='Выручка', default=0)
+
+
+class OutgoingEmail(models.Model):
+    """Письмо в очереди на отправку"""
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'],
+                         name='calc_outbox_pending_idx'),
+        ]
+
+    class Statuses(models.IntegerChoices):
+        PENDING = 0, 'В очереди'
+        SENT = 1, 'Отправлено'
+        FAILED = 2, 'Ошибка'
+
+    order = models.ForeignKey(
+        to=Order, on_delete=models.CASCADE,
+        null=True, blank=True
+    )
+    subject = models.CharField(verbose_name='Тема', max_length=254)
+    body = models.TextField(verbose_name='Текст письма')
+    recipient = models.EmailField(verbose_name='Получатель', max_length=254)
+    attach_documentation = models.BooleanField(
+        verbose_name='Приложить документацию заказа', default=True
+    )
+    status = models.IntegerField(
+        verbose_name='Статус', choices=Statuses.choices,
+        default=Statuses.PENDING
+    )
+    attempts = models.IntegerField(verbose_name='Попыток отправки', default=0)
+    next_attempt = models.DateTimeField(
+        verbose_name='Следующая попытка', default=timezone.now
+    )
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+    created = models.DateTimeField(verbose_name='Создано', auto_now_add=True)
+    sent = models.DateTimeField(verbose_name='Отправлено', null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.subject} <{self.recipient}>'
+
+
+class UploadSession(models.Model):
+    """Сессия загрузки файла по частям"""
+
+    class Meta:
+        verbose_name = "Загрузка файла"
+        verbose_name_plural = "Загрузки файлов"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(verbose_name='Имя файла', max_length=254)
+    size = models.BigIntegerField(
+        verbose_name='Размер файла', validators=[MinValueValidator(1)]
+    )
+    sha256 = models.CharField(verbose_name='SHA-256 файла', max_length=64, blank=True)
+    offset = models.BigIntegerField(verbose_name='Загружено байт', default=0)
+    completed = models.BooleanField(verbose_name='Загрузка завершена', default=False)
+    created = models.DateTimeField(verbose_name='Создано', auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.filename}'
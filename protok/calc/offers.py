@@ -0,0 +1,234 @@
+"""Коммерческое предложение по заказу в PDF
+
+PDF рисуется в фоновом пуле потоков, запрос только проверяет наличие
+готового файла. Файл хранится под именем <номер заказа>/<хеш>.pdf, где
+хеш считается по содержимому предложения (снимок цен заказа,
+документация компонентов, данные клиента), поэтому предложение
+перерисовывается только после изменения этих данных.
+
+Ошибка отрисовки записывается в журнал, а ошибка отрисовки по запросу
+еще и запоминается на OFFER_RETRY_SECONDS: до этого запрос той же
+версии предложения получает страницу ошибки, а не ставит отрисовку
+заново.
+
+Для отрисовки нужны пакет reportlab и шрифт TrueType с кириллицей
+(настройка OFFER_FONT).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Order
+from .quotes import COMPONENT_TITLES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+_executor = None
+_pending = {}
+# Номер заказа -> (хеш предложения, время ошибки)
+_failures = {}
+_lock = threading.Lock()
+
+
+def offer_root():
+    return Path(getattr(settings, 'OFFER_ROOT', settings.BASE_DIR / 'offers'))
+
+
+def offer_content(order):
+    """Данные предложения по сохраненному в заказе снимку цен"""
+    items = []
+    for category, title in COMPONENT_TITLES.items():
+        product = getattr(order, category)
+        if product is None:
+            continue
+        items.append({'title': title, 'name': product.name,
+                      'manufacturer': product.manufacturer,
+                      'price': getattr(order, f'{category}_price'),
+                      'documentation': product.documentation.name})
+    for line in order.sections.select_related('fider').order_by('pk'):
+        fider = line.fider
+        items.append({
+            'title': f'Секция {line.denomination} А × {line.count}',
+            'name': line.name,
+            'manufacturer': fider.manufacturer if fider else '',
+            'price': line.price,
+            'documentation': fider.documentation.name if fider else '',
+        })
+    client = order.client
+    return {
+        'order': order.pk,
+        'date': order.create_date.isoformat(),
+        'client': {'full_name': order.full_name or client.full_name,
+                   'organization': order.organization or client.organization,
+                   'email': client.email, 'phone_number': str(client.phone_number)},
+        'items': items,
+        'total': order.total_price,
+    }
+
+
+def offer_key(content):
+    data = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def offer_path(order_pk, key):
+    return offer_root() / str(order_pk) / f'{key}.pdf'
+
+
+def stored_offer(order_pk, key):
+    """Путь к готовому PDF или None"""
+    path = offer_path(order_pk, key)
+    return path if path.exists() else None
+
+
+def render_offer(content):
+    """PDF предложения в виде байтов"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    font = 'OfferFont'
+    if font not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(font, getattr(settings, 'OFFER_FONT', DEFAULT_FONT)))
+    styles = getSampleStyleSheet()
+    for style in styles.byName.values():
+        style.fontName = font
+
+    def text(value, style='Normal'):
+        # Paragraph разбирает разметку, данные клиента экранируются
+        return Paragraph(escape(str(value)), styles[style])
+
+    client = content['client']
+    story = [
+        text(f'Коммерческое предложение по заказу № {content["order"]}', 'Title'),
+        text(f'от {content["date"]}'),
+        Spacer(0, 6 * mm),
+        text(f'Заказчик: {client["organization"]}'),
+        text(f'Контактное лицо: {client["full_name"]}'),
+        text(f'E-mail: {client["email"]}, телефон: {client["phone_number"]}'),
+        Spacer(0, 6 * mm),
+    ]
+    rows = [['Позиция', 'Наименование', 'Производитель', 'Стоимость, руб.']]
+    for item in content['items']:
+        rows.append([text(item['title']), text(item['name']), text(item['manufacturer']),
+                     f'{item["price"]:,.2f}'.replace(',', ' ')])
+    rows.append(['', '', 'Итого', f'{content["total"]:,.2f}'.replace(',', ' ')])
+    table = Table(rows, colWidths=[40 * mm, 60 * mm, 40 * mm, 35 * mm], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font),
+        ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    story.append(table)
+
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4, title=f'Заказ № {content["order"]}').build(story)
+    return buffer.getvalue()
+
+
+def store_offer(order_pk, key, content):
+    """Рисует и атомарно сохраняет PDF, удаляя устаревшие версии"""
+    path = offer_path(order_pk, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{key}.{uuid.uuid4().hex}.tmp')
+    try:
+        temporary.write_bytes(render_offer(content))
+        os.replace(temporary, path)
+    finally:
+        temporary.unlink(missing_ok=True)
+    for old in path.parent.glob('*.pdf'):
+        if old != path:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def _submit(order_pk, key, task, *args):
+    """Ставит задачу в пул, не более одной на заказ одновременно"""
+    global _executor
+    with _lock:
+        future = _pending.get(order_pk)
+        if future is not None:
+            return future
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'OFFER_WORKERS', 2),
+                                           thread_name_prefix='calc-offers')
+        future = _pending[order_pk] = _executor.submit(task, *args)
+    future.add_done_callback(lambda done: _finish(order_pk, key, done))
+    return future
+
+
+def _finish(order_pk, key, future):
+    error = None if future.cancelled() else future.exception()
+    if error is not None:
+        logger.error('Коммерческое предложение по заказу %s не нарисовано', order_pk,
+                     exc_info=error)
+    with _lock:
+        if error is None:
+            _failures.pop(order_pk, None)
+        elif key is not None:
+            _failures[order_pk] = key, time.monotonic()
+        if _pending.get(order_pk) is future:
+            del _pending[order_pk]
+
+
+def failed(order_pk, key):
+    """Отрисовка этой версии предложения недавно завершилась ошибкой"""
+    retry = getattr(settings, 'OFFER_RETRY_SECONDS', 300)
+    with _lock:
+        failure = _failures.get(order_pk)
+        if failure is None:
+            return False
+        failed_key, when = failure
+        if time.monotonic() - when >= retry:
+            del _failures[order_pk]
+            return False
+        return failed_key == key
+
+
+def schedule(order_pk, key, content):
+    """Заказывает отрисовку по уже собранным данным"""
+    return _submit(order_pk, key, store_offer, order_pk, key, content)
+
+
+def _prepare(order_pk):
+    try:
+        order = Order.objects.select_related(
+            'client', 'substation', 'transformer', 'hv_device', 'lv_device'
+        ).filter(pk=order_pk).first()
+        if order is None:
+            return None
+        content = offer_content(order)
+        key = offer_key(content)
+        return stored_offer(order_pk, key) or store_offer(order_pk, key, content)
+    finally:
+        connections.close_all()
+
+
+def prepare(order_pk):
+    """Заказывает отрисовку предложения заранее, например после оформления заказа
+
+    OFFER_PREPARE = False отключает отрисовку заранее: предложение
+    рисуется при первом запросе.
+    """
+    if not getattr(settings, 'OFFER_PREPARE', True):
+        return None
+    return _submit(order_pk, None, _prepare, order_pk)
@@ -0,0 +1,140 @@
+"""Очередь исходящих писем
+
+Веб-запрос только добавляет строку OutgoingEmail, отправкой занимается
+команда send_outbox: она забирает письма пачками и отправляет их через
+одно SMTP-соединение, повторяя неудачные попытки с нарастающей паузой.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_order_email(order):
+    """Ставит в очередь письмо клиенту о принятом заказе"""
+    client = order.client
+    return OutgoingEmail.objects.create(
+        order=order,
+        subject=f'Заказ №{order.pk} принят',
+        body=(f'Здравствуйте, {order.full_name or client.full_name}!\n\n'
+              f'Ваш заказ №{order.pk} передан нашим специалистам. '
+              f'Документация по выбранному оборудованию приложена к письму.'),
+        recipient=client.email,
+    )
+
+
+def _claim(batch_size, now):
+    """Забирает пачку писем, откладывая их на время аренды
+
+    Пока письма отправляются, другие обработчики их не увидят; если
+    обработчик упадет, письма вернутся в очередь по истечении аренды.
+    """
+    lease = timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        queryset = OutgoingEmail.objects.filter(
+            status=OutgoingEmail.Statuses.PENDING, next_attempt__lte=now
+        ).order_by('next_attempt')
+        if db_connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        OutgoingEmail.objects.filter(pk__in=pks).update(next_attempt=now + lease)
+    return list(
+        OutgoingEmail.objects.filter(pk__in=pks)
+        .select_related('order__substation', 'order__transformer',
+                        'order__hv_device', 'order__lv_device')
+        .order_by('pk')
+    )
+
+
+def build_message(email, connection):
+    message = EmailMessage(
+        email.subject, email.body, settings.DEFAULT_FROM_EMAIL,
+        [email.recipient], connection=connection,
+    )
+    if email.attach_documentation and email.order is not None:
+        for document in email.order.documentation_assembling():
+            with document.open('rb'):
+                message.attach(os.path.basename(document.name), document.read())
+    return message
+
+
+def _retry_delay(attempts):
+    delay = _setting('OUTBOX_RETRY_DELAY', 60) * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, _setting('OUTBOX_MAX_RETRY_DELAY', 3600)))
+
+
+def _record_failure(email, error, max_attempts):
+    """Засчитывает неудачную попытку и откладывает письмо"""
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= max_attempts:
+        email.status = OutgoingEmail.Statuses.FAILED
+    else:
+        email.next_attempt = timezone.now() + _retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'status', 'next_attempt', 'last_error'])
+
+
+def _release(emails):
+    """Возвращает неотправленные письма в очередь, не дожидаясь конца аренды"""
+    OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+        next_attempt=timezone.now()
+    )
+
+
+def drain(batch_size=50, connection=None):
+    """Отправляет одну пачку писем из очереди
+
+    Возвращает пару (отправлено, ошибок). Письмо, не отправленное за
+    OUTBOX_MAX_ATTEMPTS попыток, помечается как ошибочное. Если SMTP-сервер
+    недоступен, попытка засчитывается всей пачке; если соединение не
+    удалось восстановить после ошибки, оставшиеся письма возвращаются в
+    очередь.
+    """
+    batch = _claim(batch_size, timezone.now())
+    if not batch:
+        return 0, 0
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 5)
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        for email in batch:
+            _record_failure(email, error, max_attempts)
+        return 0, len(batch)
+    sent = failed = 0
+    try:
+        for position, email in enumerate(batch):
+            try:
+                build_message(email, connection).send()
+            except Exception as error:
+                failed += 1
+                _record_failure(email, error, max_attempts)
+                # Соединение могло остаться в неопределенном состоянии
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception:
+                    _release(batch[position + 1:])
+                    break
+            else:
+                sent += 1
+                email.attempts += 1
+                email.status = OutgoingEmail.Statuses.SENT
+                email.sent = timezone.now()
+                email.last_error = ''
+                email.save(update_fields=['attempts', 'status', 'sent', 'last_error'])
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return sent, failed
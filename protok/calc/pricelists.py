@@ -0,0 +1,381 @@
+"""Импорт и выгрузка прайс-листов каталога в CSV и XLSX
+
+Файл читается потоково и обрабатывается пачками по BATCH_SIZE строк:
+строки проверяются валидаторами полей модели, пачка записывается одной
+транзакцией через bulk_create(update_conflicts=True). Товар
+определяется парой (производитель, наименование). Секции ссылаются на
+устройство НН и фидер по той же паре; секции каждого упомянутого в
+файле устройства НН заменяются целиком. Снимок цен открытых заказов,
+затронутых импортом, обновляется один раз после записи всех пачек.
+
+Прайс-лист без колонок, обязательных для нового товара (например, только
+производитель, наименование и цена), обновляет товары, уже имеющиеся в
+каталоге; остальные колонки этих товаров не меняются.
+
+Для XLSX нужен пакет openpyxl.
+"""
+import codecs
+import csv
+import io
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import FileField
+
+from .catalog import bump_catalog_version
+from .signals import sections_refresh_suspended
+from .models import (
+    ORDER_COMPONENTS, ComlexTransformerSubstation, Fiders, HighVoltageDevice,
+    LowVoltageDevice, Order, Section, Transformer,
+)
+
+BATCH_SIZE = 2000
+# Сколько проверенных значений одной колонки запоминать
+CLEAN_CACHE_SIZE = 10000
+
+CATALOG = {
+    'substations': ComlexTransformerSubstation,
+    'transformers': Transformer,
+    'hv_devices': HighVoltageDevice,
+    'lv_devices': LowVoltageDevice,
+    'fiders': Fiders,
+    'sections': Section,
+}
+
+PRODUCT_KEY = ('manufacturer', 'name')
+
+# Колонки прайс-листа секций -> путь для выгрузки
+SECTION_COLUMNS = {
+    'lv_device_manufacturer': 'lv_device__manufacturer',
+    'lv_device_name': 'lv_device__name',
+    'fider_manufacturer': 'fider__manufacturer',
+    'fider_name': 'fider__name',
+    'denomination': 'denomination',
+    'count': 'count',
+}
+
+ImportResult = namedtuple('ImportResult', 'imported errors')
+
+
+class PriceListError(Exception):
+    """Файл прайс-листа не может быть обработан целиком"""
+
+
+def columns(model):
+    if model is Section:
+        return list(SECTION_COLUMNS)
+    return [field.name for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def _required(model):
+    if model is Section:
+        return set(SECTION_COLUMNS) - {'fider_manufacturer', 'fider_name'}
+    # Документация прикладывается отдельно, прайс-лист ее обычно не содержит
+    return {
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and not field.has_default() and not field.null
+        and not isinstance(field, FileField)
+    }
+
+
+def _read_csv(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    sample = text.read(64 * 1024)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    header = next(reader, [])
+    return header, reader
+
+
+def _read_xlsx(file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise PriceListError('Для загрузки XLSX установите пакет openpyxl')
+    # read_only: строки читаются из архива по мере обхода
+    sheet = load_workbook(file, read_only=True, data_only=True).active
+    rows = sheet.iter_rows(values_only=True)
+    header = [str(value or '') for value in next(rows, ())]
+    return header, rows
+
+
+def read_rows(file, filename):
+    """Возвращает (колонки, итератор пар (номер строки, словарь))
+
+    file - двоичный файл, формат определяется по расширению filename.
+    """
+    reader = _read_xlsx if filename.lower().endswith('.xlsx') else _read_csv
+    header, rows = reader(file)
+    header = [name.strip() for name in header]
+    rows = (
+        (number, {name: value for name, value in zip(header, row) if name})
+        for number, row in enumerate(rows, start=2)
+        if any(value not in (None, '') for value in row)
+    )
+    return header, rows
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _products(model, keys):
+    """pk товаров model по парам (производитель, наименование)"""
+    names = {name for manufacturer, name in keys}
+    return {
+        (manufacturer, name): pk
+        for pk, manufacturer, name in model.objects.filter(
+            name__in=names
+        ).values_list('pk', 'manufacturer', 'name')
+        if (manufacturer, name) in keys
+    }
+
+
+def _refresh_orders(orders, keys):
+    """Обновляет снимок цен открытых заказов, найденных по ключам
+
+    orders(ключи) - запрос заказов по части ключей. Заказ, найденный по
+    нескольким частям, обновляется один раз.
+    """
+    pks = set()
+    for chunk in _batches(sorted(keys), BATCH_SIZE):
+        pks.update(orders(chunk).values_list('pk', flat=True))
+    for chunk in _batches(sorted(pks), BATCH_SIZE):
+        Order.objects.filter(pk__in=chunk).refresh_prices()
+
+
+def _error(number, error):
+    if hasattr(error, 'message_dict'):
+        messages = [f'{field}: {" ".join(errors)}'
+                    for field, errors in error.message_dict.items()]
+    else:
+        messages = error.messages
+    return number, '; '.join(messages)
+
+
+class _ProductBuilder:
+    def __init__(self, model, header):
+        self.model = model
+        # Без части обязательных колонок новые товары создать нельзя
+        self.update_only = bool(_required(model) - set(header))
+        self.fields = [model._meta.get_field(name) for name in columns(model)
+                       if name in header]
+        # Значения выбора принимаются и в виде подписей
+        self.labels = {
+            field.name: {str(label): value for value, label in field.flatchoices}
+            for field in self.fields if field.choices
+        }
+        # Результаты проверки по полям: в прайс-листе большинство колонок
+        # (производитель, тип, напряжение) повторяются от строки к строке
+        self.cleaned = {field.name: {} for field in self.fields}
+        self.saved = set()
+
+    def _clean(self, field, value):
+        cache = self.cleaned[field.name]
+        try:
+            result = cache[value]
+        except KeyError:
+            try:
+                result = field.clean(value, None)
+            except ValidationError as error:
+                result = error
+            if len(cache) < CLEAN_CACHE_SIZE:
+                cache[value] = result
+        if isinstance(result, ValidationError):
+            raise result
+        return result
+
+    def prepare(self, batch):
+        if self.update_only:
+            self.existing = _products(self.model, {
+                tuple(str(row.get(name) or '').strip() for name in PRODUCT_KEY)
+                for _, row in batch
+            })
+
+    def build(self, row):
+        values = {}
+        errors = {}
+        for field in self.fields:
+            value = row.get(field.name)
+            if value in (None, ''):
+                if field.has_default():
+                    continue
+                value = None
+            elif isinstance(value, str):
+                value = value.strip()
+                value = self.labels.get(field.name, {}).get(value, value)
+            try:
+                values[field.attname] = self._clean(field, value)
+            except ValidationError as error:
+                errors[field.name] = error.messages
+        if errors:
+            raise ValidationError(errors)
+        instance = self.model(**values)
+        if self.update_only:
+            instance.pk = self.existing.get(tuple(values[name] for name in PRODUCT_KEY))
+            if instance.pk is None:
+                raise ValidationError({'name': ['Товар не найден в каталоге, а для нового '
+                                                'товара в прайс-листе не хватает колонок']})
+        return instance
+
+    def save(self, instances):
+        # Повтор товара внутри пачки: остается последняя строка
+        unique = {tuple(getattr(item, name) for name in PRODUCT_KEY): item
+                  for item in instances}
+        update_fields = [field.name for field in self.fields if field.name not in PRODUCT_KEY]
+        if self.update_only:
+            if update_fields:
+                self.model.objects.bulk_update(unique.values(), update_fields)
+            self.saved.update(item.pk for item in unique.values())
+            return
+        self.model.objects.bulk_create(
+            unique.values(), update_conflicts=True, unique_fields=PRODUCT_KEY,
+            update_fields=update_fields,
+        )
+        # Одноименные товары других производителей не затрагиваются
+        self.saved.update(_products(self.model, set(unique)).values())
+
+    def _orders(self, products):
+        components = [component for component, model in ORDER_COMPONENTS.items()
+                      if model is self.model]
+        if components:
+            return Order.objects.open().filter(**{f'{components[0]}__in': products})
+        return Order.objects.open().filter(sections__fider__in=products)
+
+    def finish(self):
+        if self.model in ORDER_COMPONENTS.values() or self.model is Fiders:
+            _refresh_orders(self._orders, self.saved)
+
+
+class _SectionBuilder:
+    def __init__(self):
+        self.replaced = set()
+
+    def prepare(self, batch):
+        self.lv_devices = _products(LowVoltageDevice, {
+            (row.get('lv_device_manufacturer'), row.get('lv_device_name')) for _, row in batch
+        })
+        self.fiders = _products(Fiders, {
+            (row.get('fider_manufacturer'), row.get('fider_name')) for _, row in batch
+        })
+
+    def build(self, row):
+        key = (row.get('lv_device_manufacturer'), row.get('lv_device_name'))
+        lv_device = self.lv_devices.get(key)
+        if lv_device is None:
+            raise ValidationError({'lv_device': ['Устройство НН не найдено в каталоге']})
+        fider = None
+        if row.get('fider_name'):
+            fider = self.fiders.get((row.get('fider_manufacturer'), row.get('fider_name')))
+            if fider is None:
+                raise ValidationError({'fider': ['Фидер не найден в каталоге']})
+        instance = Section(lv_device_id=lv_device, fider_id=fider,
+                           denomination=row.get('denomination'), count=row.get('count'))
+        instance.clean_fields(exclude=['lv_device', 'fider'])
+        return instance
+
+    def save(self, instances):
+        replaced = {item.lv_device_id for item in instances} - self.replaced
+        with sections_refresh_suspended():
+            Section.objects.filter(lv_device__in=replaced).delete()
+        self.replaced |= replaced
+        Section.objects.bulk_create(instances)
+
+    def finish(self):
+        _refresh_orders(lambda lv_devices: Order.objects.open().filter(lv_device__in=lv_devices),
+                        self.replaced)
+
+
+def import_rows(model, header, rows, batch_size=BATCH_SIZE):
+    """Импортирует строки прайс-листа в каталог
+
+    Ошибочные строки пропускаются и возвращаются в ImportResult.errors
+    парами (номер строки, сообщение), остальные записываются.
+    """
+    missing = _required(model) - set(header)
+    if model is not Section:
+        # Колонки, без которых можно обновить имеющиеся товары
+        missing &= set(PRODUCT_KEY)
+    if missing:
+        raise PriceListError('Нет обязательных колонок: ' + ', '.join(sorted(missing)))
+    builder = _SectionBuilder() if model is Section else _ProductBuilder(model, header)
+    imported = 0
+    errors = []
+    try:
+        for batch in _batches(rows, batch_size):
+            builder.prepare(batch)
+            instances = []
+            for number, row in batch:
+                try:
+                    instances.append(builder.build(row))
+                except ValidationError as error:
+                    errors.append(_error(number, error))
+            if instances:
+                with transaction.atomic():
+                    builder.save(instances)
+                imported += len(instances)
+    finally:
+        # bulk_create не отправляет сигналы, кеши каталога и снимок цен
+        # заказов по записанным пачкам обновляются явно
+        if imported:
+            bump_catalog_version()
+            builder.finish()
+    return ImportResult(imported, errors)
+
+
+def import_file(model, file, filename, batch_size=BATCH_SIZE):
+    header, rows = read_rows(file, filename)
+    return import_rows(model, header, rows, batch_size)
+
+
+def export_rows(model, queryset=None):
+    """Строки прайс-листа, начиная с заголовка; совместимы с импортом"""
+    if queryset is None:
+        queryset = model.objects.all()
+    names = columns(model)
+    yield names
+    paths = [SECTION_COLUMNS[name] for name in names] if model is Section else names
+    yield from queryset.order_by('pk').values_list(*paths).iterator(chunk_size=BATCH_SIZE)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(model, queryset=None):
+    """Генератор CSV в UTF-8 для StreamingHttpResponse"""
+    writer = csv.writer(_Echo())
+    yield codecs.BOM_UTF8
+    for row in export_rows(model, queryset):
+        yield writer.writerow(row).encode()
+
+
+def write_file(model, path, queryset=None):
+    """Выгружает прайс-лист в файл CSV или XLSX (по расширению path)"""
+    rows = export_rows(model, queryset)
+    if str(path).lower().endswith('.xlsx'):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise PriceListError('Для выгрузки XLSX установите пакет openpyxl')
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+    else:
+        with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+            csv.writer(file).writerows(rows)
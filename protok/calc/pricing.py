@@ -0,0 +1,202 @@
+"""Подбор самых дешевых комплектаций КТП
+
+Каталог загружается в структурированные массивы NumPy (по одному на
+категорию оборудования), общие для процессов сервера (calc.snapshots);
+стоимость комплектаций считается broadcast-сложением, а лучшие варианты
+выбираются через argpartition.
+"""
+from collections import namedtuple
+
+import numpy as np
+from django.db import models
+from django.db.models import F, OuterRef
+
+from . import snapshots
+from .models import (
+    ComlexTransformerSubstation, Transformer, HighVoltageDevice,
+    LowVoltageDevice, sections_price,
+)
+
+
+# Категория -> (модель, поля, доступные для фильтрации)
+CATEGORIES = {
+    'substation': (ComlexTransformerSubstation, ('type_station',)),
+    'transformer': (Transformer, ('transformer_type', 'connection_scheme',
+                                  'power', 'voltage')),
+    'hv_device': (HighVoltageDevice, ('input_type', 'voltage', 'arrester',
+                                      'equipment_type', 'registration',
+                                      'connection_type')),
+    'lv_device': (LowVoltageDevice, ('input_type', 'arrester', 'voltage',
+                                     'input_device', 'input_denomination',
+                                     'registration', 'connection_type')),
+}
+
+Configuration = namedtuple(
+    'Configuration', 'total substation transformer hv_device lv_device'
+)
+
+
+def _dtype(model, fields):
+    columns = [('pk', np.int64), ('price', np.float64), ('total', np.float64)]
+    for name in fields:
+        field = model._meta.get_field(name)
+        if isinstance(field, models.BooleanField):
+            kind = np.bool_
+        elif isinstance(field, models.FloatField):
+            kind = np.float64
+        elif isinstance(field, models.IntegerField):
+            kind = np.int64
+        else:
+            kind = f'U{field.max_length}'
+        columns.append((name, kind))
+    return np.dtype(columns)
+
+
+def load_category(name):
+    """Загружает категорию каталога в структурированный массив
+
+    Для устройств НН поле total включает стоимость линий секций,
+    для остальных категорий совпадает с price.
+    """
+    model, fields = CATEGORIES[name]
+    if model is LowVoltageDevice:
+        total = F('price') + sections_price(OuterRef('pk'))
+    else:
+        total = F('price')
+    rows = model.objects.order_by().annotate(total_price=total).values_list(
+        'pk', 'price', 'total_price', *fields
+    )
+    return np.array(list(rows), dtype=_dtype(model, fields))
+
+
+def load_catalog():
+    """Загружает все категории каталога"""
+    return {name: load_category(name) for name in CATEGORIES}
+
+
+def current_catalog():
+    """Каталог текущей версии из общего снимка (calc.snapshots)"""
+    return snapshots.catalog.get('pricing', load_catalog)
+
+
+def _mask(array, requirements):
+    mask = np.ones(len(array), dtype=bool)
+    for lookup, value in requirements.items():
+        name, _, operator = lookup.partition('__')
+        if name not in array.dtype.names:
+            raise ValueError(f'Неизвестный параметр {lookup}')
+        column = array[name]
+        if operator in ('', 'exact'):
+            mask &= column == value
+        elif operator == 'in':
+            mask &= np.isin(column, list(value))
+        elif operator == 'gte':
+            mask &= column >= value
+        elif operator == 'gt':
+            mask &= column > value
+        elif operator == 'lte':
+            mask &= column <= value
+        elif operator == 'lt':
+            mask &= column < value
+        else:
+            raise ValueError(f'Неподдерживаемый оператор {lookup}')
+    return mask
+
+
+def _top_k(values, k):
+    """Индексы k наименьших конечных значений в порядке возрастания"""
+    k = min(k, values.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < values.size:
+        indexes = np.argpartition(values, k - 1)[:k]
+    else:
+        indexes = np.arange(values.size)
+    indexes = indexes[np.argsort(values[indexes], kind='stable')]
+    return indexes[np.isfinite(values[indexes])]
+
+
+def _cheapest_per_group(array, field, k):
+    """Оставляет не более k самых дешевых записей для каждого значения field
+
+    Для поиска k лучших комплектаций достаточно k самых дешевых
+    представителей каждого класса совместимости: любой более дорогой
+    вариант можно заменить одним из них.
+    """
+    ordered = array[np.lexsort((array['total'], array[field]))]
+    column = ordered[field]
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    sizes = np.diff(np.r_[starts, len(ordered)])
+    rank = np.arange(len(ordered)) - np.repeat(starts, sizes)
+    return ordered[rank < k]
+
+
+def cheapest_configurations(requirements=None, limit=10, catalog=None):
+    """Возвращает limit самых дешевых допустимых комплектаций КТП
+
+    requirements - словарь {категория: {поиск: значение}}, где поиск
+    записывается в стиле ORM: 'power__gte', 'voltage', 'input_type__in'.
+    Трансформатор и устройство ВН совместимы при равном напряжении.
+    Результат - список Configuration с pk оборудования, по возрастанию
+    стоимости.
+    """
+    if catalog is None:
+        catalog = current_catalog()
+    requirements = requirements or {}
+    unknown = set(requirements) - set(CATEGORIES)
+    if unknown:
+        raise ValueError(f'Неизвестная категория {unknown.pop()}')
+    items = {
+        name: array[_mask(array, requirements.get(name, {}))]
+        for name, array in catalog.items()
+    }
+    if limit <= 0 or any(len(array) == 0 for array in items.values()):
+        return []
+
+    transformers = _cheapest_per_group(items['transformer'], 'voltage', limit)
+    hv_devices = _cheapest_per_group(items['hv_device'], 'voltage', limit)
+    compatible = transformers['voltage'][:, None] == hv_devices['voltage'][None, :]
+    pairs = np.where(
+        compatible,
+        transformers['total'][:, None] + hv_devices['total'][None, :],
+        np.inf,
+    )
+    best_pairs = _top_k(pairs.ravel(), limit)
+    if not len(best_pairs):
+        return []
+
+    lv_devices = items['lv_device'][_top_k(items['lv_device']['total'], limit)]
+    substations = items['substation'][_top_k(items['substation']['total'], limit)]
+    totals = (pairs.ravel()[best_pairs][:, None, None]
+              + lv_devices['total'][None, :, None]
+              + substations['total'][None, None, :])
+    best = _top_k(totals.ravel(), limit)
+    pair, lv, substation = np.unravel_index(best, totals.shape)
+    transformer, hv = np.unravel_index(best_pairs[pair], pairs.shape)
+    return [
+        Configuration(float(total), int(substation_pk), int(transformer_pk), int(hv_device_pk),
+                      int(lv_device_pk))
+        for total, substation_pk, transformer_pk, hv_device_pk, lv_device_pk in zip(
+            totals.ravel()[best],
+            substations['pk'][substation],
+            transformers['pk'][transformer],
+            hv_devices['pk'][hv],
+            lv_devices['pk'][lv],
+        )
+    ]
+
+
+def resolve(configurations):
+    """Заменяет pk в комплектациях экземплярами моделей (4 запроса)"""
+    objects = {}
+    for field in Configuration._fields[1:]:
+        model = CATEGORIES[field][0]
+        pks = {getattr(item, field) for item in configurations}
+        objects[field] = model.objects.in_bulk(pks)
+    return [
+        item._replace(**{
+            field: objects[field][getattr(item, field)]
+            for field in Configuration._fields[1:]
+        })
+        for item in configurations
+    ]
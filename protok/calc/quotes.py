@@ -0,0 +1,53 @@
+"""Расчет цены комплектации для конфигуратора"""
+from . import matching, pricing
+from .models import Section
+
+COMPONENT_TITLES = {
+    'substation': 'КТП',
+    'transformer': 'Трансформатор',
+    'hv_device': 'Устройство ВН',
+    'lv_device': 'Устройство НН',
+}
+
+
+def build_quote(transformer, hv_device, type_station=None):
+    """Подбирает самую дешевую комплектацию и раскладывает ее цену
+
+    transformer и hv_device - cleaned_data форм TransformerForm и
+    HighVoltageDeviceForm. Мощность трансформатора округляется вверх до
+    ближайшей среди трансформаторов напряжения устройства ВН. Возвращает
+    словарь, пригодный для JSON, или None, если комплектация не найдена.
+    """
+    if not matching.hv_devices.match(**hv_device):
+        return None
+    transformer = dict(transformer, voltage=hv_device['voltage'])
+    found = matching.transformers.nearest(**transformer)
+    if found is None:
+        return None
+    requirements = {
+        'transformer': dict(transformer, power=found[0]),
+        'hv_device': hv_device,
+    }
+    if type_station:
+        requirements['substation'] = {'type_station': type_station}
+    configurations = pricing.cheapest_configurations(requirements, limit=1)
+    if not configurations:
+        return None
+    configuration = pricing.resolve(configurations)[0]
+
+    items = []
+    for category, title in COMPONENT_TITLES.items():
+        product = getattr(configuration, category)
+        items.append({'category': category, 'title': title, 'id': product.pk,
+                      'name': product.name, 'price': product.price})
+    sections = Section.objects.filter(
+        lv_device=configuration.lv_device
+    ).select_related('fider').order_by('pk')
+    for section in sections:
+        items.append({
+            'category': 'section', 'title': 'Секция', 'id': section.pk,
+            'name': section.fider.name if section.fider else '',
+            'denomination': section.denomination, 'count': section.count,
+            'price': section.price,
+        })
+    return {'items': items, 'total': configuration.total}
@@ -0,0 +1,158 @@
+"""Сводки продаж для отчетов
+
+Продажа - подтвержденный заказ: его снимок цен не меняется вслед за
+каталогом. Каждый заказ вносит в SalesSummary за месяц своего
+создания строки по разрезам: всего, мощность трансформатора, тип
+подстанции (объем - число заказов, выручка - полная стоимость) и
+производители компонентов и фидеров секций (объем - число единиц,
+выручка - их стоимость по снимку).
+
+Сигналы заказа (calc.signals) применяют разницу вкладов до и после
+изменения, поэтому отчет читает только сводку и не зависит от числа
+заказов. Разрезы (мощность, тип подстанции, производители)
+запоминаются в заказе при подтверждении (OrderQuerySet.take_dimensions),
+поэтому изменение и удаление оборудования не меняют вклад уже
+подтвержденного заказа. Изменения заказов в обход сигналов (update,
+bulk_create) требуют пересборки командой rebuild_sales_summary, а
+заказы, подтвержденные через update, - еще и вызова take_dimensions.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import (
+    ORDER_COMPONENTS, SALES_DIMENSION_FIELDS, Order, OrderSection, SalesSummary,
+)
+
+Dimensions = SalesSummary.Dimensions
+
+BATCH_SIZE = 1000
+
+
+def _key(value):
+    return '' if value is None else str(value)
+
+
+class Contributions(defaultdict):
+    """(разрез, месяц, значение) -> [объем, выручка]"""
+
+    def __init__(self):
+        super().__init__(lambda: [0, 0.0])
+
+    def add(self, dimension, month, key, volume, revenue):
+        totals = self[dimension, month, _key(key)]
+        totals[0] += volume or 0
+        totals[1] += revenue or 0
+
+    def __sub__(self, other):
+        result = Contributions()
+        for row, (volume, revenue) in self.items():
+            result.add(*row, volume, revenue)
+        for row, (volume, revenue) in other.items():
+            result.add(*row, -volume, -revenue)
+        return result
+
+    def __neg__(self):
+        return Contributions() - self
+
+
+def order_contributions(order_pk):
+    """Вклад заказа в сводку; у неподтвержденного заказа вклада нет"""
+    row = Order.objects.filter(pk=order_pk, confirmed=True).values(
+        'create_date', 'total_price', *SALES_DIMENSION_FIELDS,
+        *(f'{component}_price' for component in ORDER_COMPONENTS),
+    ).first()
+    result = Contributions()
+    if row is None:
+        return result
+    month = row['create_date'].replace(day=1)
+    total = row['total_price']
+    result.add(Dimensions.TOTAL, month, '', 1, total)
+    result.add(Dimensions.POWER, month, row['transformer_power'], 1, total)
+    result.add(Dimensions.TYPE_STATION, month, row['type_station'], 1, total)
+    for component in ORDER_COMPONENTS:
+        if row[f'{component}_manufacturer'] is not None:
+            result.add(Dimensions.MANUFACTURER, month, row[f'{component}_manufacturer'],
+                       1, row[f'{component}_price'])
+    lines = OrderSection.objects.filter(order=order_pk).values('manufacturer').annotate(
+        volume=Sum('count'), revenue=Sum('price')
+    ).order_by()
+    for line in lines:
+        result.add(Dimensions.MANUFACTURER, month, line['manufacturer'],
+                   line['volume'], line['revenue'])
+    return result
+
+
+def apply(contributions):
+    """Прибавляет вклады к строкам сводки, создавая недостающие"""
+    for (dimension, month, key), (volume, revenue) in contributions.items():
+        if not volume and not revenue:
+            continue
+        row = SalesSummary.objects.filter(dimension=dimension, month=month, key=key)
+        changes = {'volume': F('volume') + volume, 'revenue': F('revenue') + revenue}
+        if row.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                SalesSummary.objects.create(dimension=dimension, month=month, key=key,
+                                            volume=volume, revenue=revenue)
+        except IntegrityError:
+            # Строку одновременно создал другой запрос
+            row.update(**changes)
+
+
+def aggregate():
+    """Вклады всех подтвержденных заказов, посчитанные GROUP BY"""
+    result = Contributions()
+    orders = Order.objects.filter(confirmed=True).annotate(
+        month=TruncMonth('create_date')
+    ).order_by()
+    for dimension, key in ((Dimensions.TOTAL, None),
+                           (Dimensions.POWER, 'transformer_power'),
+                           (Dimensions.TYPE_STATION, 'type_station')):
+        groups = orders.values('month', **({'group': F(key)} if key else {})).annotate(
+            volume=Count('pk'), revenue=Sum('total_price')
+        )
+        for group in groups.iterator():
+            result.add(dimension, group['month'], group.get('group'),
+                       group['volume'], group['revenue'])
+    for component in ORDER_COMPONENTS:
+        groups = orders.filter(**{f'{component}_manufacturer__isnull': False}).values(
+            'month', group=F(f'{component}_manufacturer')
+        ).annotate(volume=Count('pk'), revenue=Sum(f'{component}_price'))
+        for group in groups.iterator():
+            result.add(Dimensions.MANUFACTURER, group['month'], group['group'],
+                       group['volume'], group['revenue'])
+    lines = OrderSection.objects.filter(order__confirmed=True).annotate(
+        month=TruncMonth('order__create_date')
+    ).values('month', group=F('manufacturer')).annotate(
+        volume=Sum('count'), revenue=Sum('price')
+    ).order_by()
+    for group in lines.iterator():
+        result.add(Dimensions.MANUFACTURER, group['month'], group['group'],
+                   group['volume'], group['revenue'])
+    return result
+
+
+def rebuild():
+    """Пересобирает сводку по всем заказам, возвращает число строк"""
+    rows = [
+        SalesSummary(dimension=dimension, month=month, key=key, volume=volume, revenue=revenue)
+        for (dimension, month, key), (volume, revenue) in aggregate().items()
+    ]
+    with transaction.atomic():
+        SalesSummary.objects.all().delete()
+        SalesSummary.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def report(dimension, since=None, until=None):
+    """Строки сводки разреза за месяцы с since по until включительно"""
+    rows = SalesSummary.objects.filter(dimension=dimension, volume__gt=0)
+    if since is not None:
+        rows = rows.filter(month__gte=since)
+    if until is not None:
+        rows = rows.filter(month__lte=until)
+    return rows.order_by('month', 'key').values('month', 'key', 'volume', 'revenue')
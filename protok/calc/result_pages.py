@@ -0,0 +1,66 @@
+"""Кеш страницы заказа (results)
+
+Отрисованная страница кладется в кеш под номером заказа вместе с
+версией каталога, при которой она отрисована, поэтому повторный
+просмотр - одно обращение к кешу за страницей и версией.
+
+Страница показывает данные заказа и клиента, они сбрасываются
+сигналами post_save/post_delete Order и Client (calc.signals).
+Стоимость открытого заказа меняется вслед за ценами оборудования и
+секций устройств НН; все такие изменения меняют версию каталога, и
+страницы открытых заказов с прежней версией перерисовываются. Снимок
+цен подтвержденного заказа не меняется, его страница от версии
+каталога не зависит.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from . import catalog
+
+
+def page_key(order_pk):
+    return f'calc:results:{order_pk}'
+
+
+async def cached_page(order_pk):
+    """HTML страницы из кеша или None, если ее нужно перерисовать"""
+    key = page_key(order_pk)
+    values = await cache.aget_many([key, catalog.VERSION_KEY])
+    page = values.get(key)
+    if page is None:
+        return None
+    if page['version'] is not None and page['version'] != values.get(catalog.VERSION_KEY):
+        return None
+    return page['html']
+
+
+def render_page(order):
+    # Страница общая для всех посетителей, поэтому рисуется без запроса
+    return render_to_string('calc/results.html', {'order': order, 'client': order.client})
+
+
+async def store_page(order, html, version):
+    """Сохраняет страницу, отрисованную при версии каталога version
+
+    Версию нужно получить до загрузки заказа: тогда страница по данным,
+    измененным позже, не будет сохранена с новой версией.
+    """
+    page = {'version': None if order.confirmed else version, 'html': html}
+    await cache.aset(page_key(order.pk), page,
+                     getattr(settings, 'RESULTS_CACHE_TIMEOUT', 24 * 60 * 60))
+
+
+def invalidate(order_pks):
+    """Сбрасывает страницы заказов
+
+    Страницы удаляются сразу и еще раз после фиксации транзакции:
+    страница, отрисованная между этими моментами по старым данным, не
+    переживет фиксацию.
+    """
+    keys = [page_key(pk) for pk in order_pks]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
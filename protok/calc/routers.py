@@ -0,0 +1,37 @@
+from django.db import connections
+
+# Модели каталога, которые можно читать с реплики
+CATALOG_MODELS = {
+    'calc.comlextransformersubstation', 'calc.transformer',
+    'calc.highvoltagedevice', 'calc.lowvoltagedevice', 'calc.fiders',
+    'calc.section',
+}
+
+
+class CatalogReplicaRouter:
+    """Направляет чтение каталога на базу replica, если она настроена
+
+    Заказы, клиенты и любая запись остаются на default. Внутри
+    транзакции каталог тоже читается с default, чтобы видеть только что
+    сделанные изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        if ('replica' in connections.settings
+                and model._meta.label_lower in CATALOG_MODELS
+                and not connections['default'].in_atomic_block):
+            return 'replica'
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {'default', 'replica'}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'replica':
+            return False
+        return None
@@ -0,0 +1,88 @@
+"""Предкомпилированная схема конфигуратора
+
+Структура форм (поля, подписи, варианты выбора, диапазоны) собирается
+один раз и вместе с отрисованным HTML-фрагментом кладется в кеш.
+Фрагмент перестраивается только при изменении каталога (версия
+каталога), определений форм (отпечаток схемы) или собранной статики
+(хеш манифеста: фрагмент ссылается на файлы с хешем в имени), поэтому
+страница конфигуратора обходится одним обращением к кешу.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Max, Min
+from django.template.loader import render_to_string
+
+from . import assets, catalog
+from .forms import TransformerForm, HighVoltageDeviceForm
+from .models import Transformer
+
+FRAGMENT_KEY = 'calc:configurator'
+
+# (категория, заголовок, форма, ограничения числовых полей)
+FORMS = (
+    ('transformer', 'Трансформатор', TransformerForm,
+     {'power': {'min_value': 20, 'max_value': 630}}),
+    ('hv_device', 'ВН', HighVoltageDeviceForm,
+     {'voltage': {'min_value': 0, 'max_value': 10000}}),
+)
+
+_static_schema = None
+
+
+def static_schema():
+    """Схема, зависящая только от определений форм (одна на процесс)"""
+    global _static_schema
+    if _static_schema is None:
+        schema = []
+        for category, name, form_class, limits in FORMS:
+            fields = []
+            for field_name, field in form_class.base_fields.items():
+                item = {'name': field_name, 'label': str(field.label)}
+                choices = getattr(field, 'choices', None)
+                if choices:
+                    item['choices'] = [[value, str(label)] for value, label in choices]
+                else:
+                    item['min_value'] = getattr(field, 'min_value', None)
+                    item['max_value'] = getattr(field, 'max_value', None)
+                    item.update(limits.get(field_name, {}))
+                fields.append(item)
+            schema.append({'category': category, 'name': name, 'fields': fields})
+        fingerprint = hashlib.sha1(json.dumps(schema, sort_keys=True).encode())
+        _static_schema = (schema, fingerprint.hexdigest())
+    return _static_schema
+
+
+def compile_schema():
+    """Полная схема: диапазон мощности сужается до имеющегося в каталоге"""
+    schema, _ = static_schema()
+    schema = json.loads(json.dumps(schema))
+    power = Transformer.objects.aggregate(min_value=Min('power'), max_value=Max('power'))
+    for form in schema:
+        for field in form['fields']:
+            if form['category'] == 'transformer' and field['name'] == 'power':
+                field.update({key: value for key, value in power.items()
+                              if value is not None})
+    return schema
+
+
+def configurator_fragment():
+    """HTML-фрагмент конфигуратора из кеша, при необходимости перестроенный"""
+    _, fingerprint = static_schema()
+    manifest = assets.manifest_version()
+    values = cache.get_many([FRAGMENT_KEY, catalog.VERSION_KEY])
+    fragment = values.get(FRAGMENT_KEY)
+    version = values.get(catalog.VERSION_KEY)
+    if (fragment is not None and version is not None
+            and fragment['version'] == version
+            and fragment['fingerprint'] == fingerprint
+            and fragment['manifest'] == manifest):
+        return fragment['html']
+
+    version = catalog.catalog_version()
+    schema = compile_schema()
+    html = render_to_string('calc/configurator.html', {'schema': schema})
+    cache.set(FRAGMENT_KEY, {'version': version, 'fingerprint': fingerprint,
+                             'manifest': manifest, 'html': html}, None)
+    return html
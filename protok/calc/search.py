@@ -0,0 +1,286 @@
+"""Нечеткий поиск оборудования каталога по наименованию и производителю
+
+Текст приводится к латинице (ТМГ-400 и TMG 400 дают одно и то же
+«tmg 400»), разбивается на слова, цифры отделяются от букв, и каждое
+слово раскладывается на триграммы, как в pg_trgm. Запись находится,
+если в ней есть не меньше SEARCH_THRESHOLD триграмм запроса, поэтому
+опечатка в одной-двух буквах не мешает поиску.
+
+Индекс хранится в массивах NumPy: списки записей по каждой триграмме
+(postings) лежат подряд в одном массиве, и число общих с запросом
+триграмм для всех записей считается одним bincount. Как и индексы
+calc.matching, он строится один раз на процесс, изменения отдельных
+записей приходят из сигналов (calc.signals), а изменения в обход
+сигналов обнаруживаются по версии каталога. Измененные записи
+хранятся отдельно от массивов и сливаются с ними, когда их становится
+больше MERGE_LIMIT.
+"""
+import math
+import re
+from collections import namedtuple
+from threading import RLock
+
+import numpy as np
+from django.conf import settings
+
+from .catalog import catalog_version
+from .models import (
+    ComlexTransformerSubstation, Transformer, HighVoltageDevice,
+    LowVoltageDevice, Fiders,
+)
+
+MODELS = (ComlexTransformerSubstation, Transformer, HighVoltageDevice,
+          LowVoltageDevice, Fiders)
+
+# Сколько измененных записей держать вне массивов индекса
+MERGE_LIMIT = 1000
+# Вес длины текста в порядке результатов: из одинаково похожих записей
+# выше более короткая (ТМГ-400 выше ТМГ-4000 по запросу «ТМГ 400»)
+LENGTH_WEIGHT = 1e-7
+
+TRANSLITERATION = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+SEPARATORS = re.compile(r'[^a-z0-9]+|(?<=[a-z])(?=[0-9])|(?<=[0-9])(?=[a-z])')
+
+# Символ -> код: пробел, латинские буквы, цифры
+ALPHABET = ' abcdefghijklmnopqrstuvwxyz0123456789'
+TRIGRAMS = len(ALPHABET) ** 3
+_CODES = np.zeros(256, dtype=np.int32)
+_CODES[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(len(ALPHABET))
+
+Entry = namedtuple('Entry', 'model pk name manufacturer price')
+Match = namedtuple('Match', 'entry score')
+
+
+def normalize(text):
+    """Текст в латинице в нижнем регистре, слова через пробел"""
+    text = text.lower().translate(TRANSLITERATION)
+    return ' '.join(word for word in SEPARATORS.split(text) if word)
+
+
+def _padded(text):
+    # Каждое слово дополняется двумя пробелами слева и одним справа
+    return ''.join(f'  {word} ' for word in normalize(text).split())
+
+
+def _trigram_ids(padded, starts):
+    """Коды триграмм строки padded и номера строк, к которым они относятся
+
+    starts - начала строк, если в padded склеено несколько строк.
+    """
+    codes = _CODES[np.frombuffer(padded.encode('ascii'), dtype=np.uint8)]
+    if len(codes) < 3:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    ids = (codes[:-2] * len(ALPHABET) + codes[1:-1]) * len(ALPHABET) + codes[2:]
+    # Триграммы на стыке слов кончаются двумя пробелами
+    valid = (codes[1:-1] != 0) | (codes[2:] != 0)
+    rows = np.searchsorted(starts, np.arange(len(ids)), side='right') - 1
+    return ids[valid].astype(np.int64), rows[valid]
+
+
+def trigrams(text):
+    """Множество кодов триграмм текста"""
+    return set(_trigram_ids(_padded(text), np.zeros(1, dtype=np.int64))[0].tolist())
+
+
+def _document(entry):
+    return f'{entry.name} {entry.manufacturer}'
+
+
+class SearchIndex:
+    """Триграммный индекс записей моделей MODELS"""
+
+    def __init__(self, models):
+        self.models = tuple(models)
+        self._model_codes = {model: code for code, model in enumerate(self.models)}
+        self._lock = RLock()
+        self._entries = None
+        self._version = None
+
+    def _build(self, version):
+        entries = {}
+        for model in self.models:
+            queryset = model.objects.values_list('pk', 'name', 'manufacturer', 'price')
+            for pk, name, manufacturer, price in queryset.iterator():
+                entries[model, pk] = Entry(model, pk, name, manufacturer, price)
+        self._entries = entries
+        self._compile()
+        self._version = version
+
+    def _compile(self):
+        """Раскладывает все записи в массивы, сбрасывая список изменений"""
+        # Записи одной модели лежат подряд, и поиск по модели просматривает
+        # только ее часть массивов
+        keys = sorted(self._entries, key=lambda key: self._model_codes[key[0]])
+        texts = [_padded(_document(self._entries[key])) for key in keys]
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        ids, rows = _trigram_ids(''.join(texts), starts)
+        # Каждая триграмма учитывается в записи один раз
+        pairs = np.unique(rows * TRIGRAMS + ids)
+        rows, ids = np.divmod(pairs, TRIGRAMS)
+        # Для триграмм, которые есть больше чем в половине записей
+        # (например, в общем для всех производителе), хранится список
+        # записей без них: так ни один список не длиннее половины индекса
+        dense = np.bincount(ids, minlength=TRIGRAMS) * 2 > len(keys)
+        sparse = ~dense[ids]
+        parts_rows, parts_ids = [rows[sparse]], [ids[sparse]]
+        for code in np.flatnonzero(dense).tolist():
+            member = np.zeros(len(keys), dtype=bool)
+            member[rows[ids == code]] = True
+            missing = np.flatnonzero(~member)
+            parts_rows.append(missing)
+            parts_ids.append(np.full(len(missing), code))
+        lists_rows, lists_ids = np.concatenate(parts_rows), np.concatenate(parts_ids)
+        order = np.argsort(lists_ids, kind='stable')
+        self._keys = keys
+        self._positions = {key: position for position, key in enumerate(keys)}
+        self._postings = lists_rows[order].astype(np.intp)
+        self._offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(lists_ids, minlength=TRIGRAMS)))
+        )
+        self._dense = dense
+        self._sizes = np.bincount(rows, minlength=len(keys))
+        self._lengths = lengths
+        bounds = np.searchsorted([self._model_codes[model] for model, _ in keys],
+                                 np.arange(len(self.models) + 1))
+        self._ranges = dict(zip(self.models, zip(bounds[:-1].tolist(), bounds[1:].tolist())))
+        self._removed = []
+        self._changed = {}
+
+    def _ensure(self):
+        version = catalog_version()
+        if self._entries is None or self._version != version:
+            with self._lock:
+                if self._entries is None or self._version != version:
+                    self._build(version)
+
+    def _advance(self, previous_version, version):
+        """Переводит индекс на новую версию, если он видел предыдущую"""
+        if self._entries is None:
+            return False
+        if self._version != previous_version:
+            self.invalidate()
+            return False
+        self._version = version
+        return True
+
+    def update(self, instance, previous_version, version):
+        """Учитывает изменение записи каталога
+
+        Изменения записей моделей, которых нет в индексе, только
+        переводят его на новую версию каталога.
+        """
+        with self._lock:
+            if not self._advance(previous_version, version):
+                return
+            model = type(instance)
+            if model not in self._model_codes:
+                return
+            key = model, instance.pk
+            self._discard(key)
+            entry = Entry(model, instance.pk, instance.name, instance.manufacturer,
+                          instance.price)
+            self._entries[key] = entry
+            text = _document(entry)
+            self._changed[key] = trigrams(text), len(_padded(text))
+            if len(self._changed) > MERGE_LIMIT:
+                self._compile()
+
+    def remove(self, model, pk, previous_version, version):
+        """Удаляет запись каталога из индекса
+
+        Как и update, для других моделей только меняет версию индекса.
+        """
+        with self._lock:
+            if self._advance(previous_version, version):
+                self._discard((model, pk))
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        self._changed.pop(key, None)
+        position = self._positions.get(key)
+        if position is not None:
+            self._removed.append(position)
+
+    def invalidate(self):
+        """Сбрасывает индекс; он будет перестроен при следующем запросе"""
+        with self._lock:
+            self._entries = None
+            self._version = None
+
+    def search(self, query, models=None, limit=20, threshold=None):
+        """Записи, похожие на query, начиная с самых похожих
+
+        models ограничивает поиск моделями из этого списка. Похожесть -
+        доля триграмм запроса, найденных в записи; при равной доле выше
+        записи, в которых меньше лишних триграмм.
+        """
+        wanted = trigrams(query)
+        if not wanted or limit <= 0:
+            return []
+        if threshold is None:
+            threshold = getattr(settings, 'SEARCH_THRESHOLD', 0.6)
+        required = max(math.ceil(len(wanted) * threshold - 1e-9), 1)
+        with self._lock:
+            self._ensure()
+            size = len(self._keys)
+            if models is None:
+                models, ranges = self.models, [(0, size)]
+            else:
+                models = [model for model in models if model in self._ranges]
+                ranges = [self._ranges[model] for model in models]
+            present, absent = [], []
+            for code in wanted:
+                postings = self._postings[self._offsets[code]:self._offsets[code + 1]]
+                (absent if self._dense[code] else present).append(postings)
+            counts = np.bincount(np.concatenate(present or [np.empty(0, np.intp)]),
+                                 minlength=size)
+            if absent:
+                counts += len(absent) - np.bincount(np.concatenate(absent), minlength=size)
+            if self._removed:
+                counts[self._removed] = 0
+            positions = np.concatenate([np.flatnonzero(counts[start:stop] >= required) + start
+                                        for start, stop in ranges] or [np.empty(0, np.intp)])
+            common = counts[positions]
+            if len(positions) > limit:
+                # Порядок определяется прежде всего числом общих триграмм,
+                # поэтому ранжируются только записи с наибольшими числами,
+                # которых хватает на limit результатов
+                cutoff = common.max()
+                kept = common >= cutoff
+                while np.count_nonzero(kept) < limit:
+                    cutoff -= 1
+                    kept = common >= cutoff
+                positions, common = positions[kept], common[kept]
+            # Число общих триграмм, затем доля общих среди всех триграмм
+            # записи и запроса (сходство Жаккара), затем длина текста
+            ranks = (common + common / (len(wanted) + self._sizes[positions] - common)
+                     - self._lengths[positions] * LENGTH_WEIGHT)
+            if len(positions) > limit:
+                best = np.argpartition(-ranks, limit - 1)[:limit]
+                positions, common, ranks = positions[best], common[best], ranks[best]
+            candidates = [
+                (rank, shared, self._keys[position]) for rank, shared, position
+                in zip(ranks.tolist(), common.tolist(), positions.tolist())
+            ]
+            for key, (document, length) in self._changed.items():
+                if key[0] not in models:
+                    continue
+                shared = len(wanted & document)
+                if shared >= required:
+                    rank = (shared + shared / len(wanted | document)
+                            - length * LENGTH_WEIGHT)
+                    candidates.append((rank, shared, key))
+            candidates.sort(key=lambda candidate: -candidate[0])
+            return [Match(self._entries[key], shared / len(wanted))
+                    for _, shared, key in candidates[:limit]]
+
+
+products = SearchIndex(MODELS)
+
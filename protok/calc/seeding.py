@@ -0,0 +1,486 @@
+"""Заполнение базы тестовыми данными для тестов и нагрузочных замеров
+
+seed() создает небольшой набор данных для тестов. generate() (команда
+generate_data) создает наборы масштаба продакшена: до сотен тысяч
+единиц каталога и десятков миллионов заказов. Значения выбираются
+векторно генератором NumPy партиями по batch_size записей, поэтому
+память не зависит от объема данных, а снимок цен заказов считается при
+создании, без Order.objects.refresh_prices().
+"""
+import contextlib
+import datetime
+import random
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import reports
+from .catalog import bump_catalog_version
+from .models import (
+    ArresterAvailabilityHighVoltage, ArresterAvailabilityLowVoltage, Client,
+    ComlexTransformerSubstation, ConnectionTypes, Fiders, HighVoltageDevice, InputOutputType,
+    LowVoltageDevice, Order, OrderSection, Section, Transformer,
+)
+
+BATCH_SIZE = 1000
+
+
+def seed(products=100, orders=1000, seed=0):
+    """Создает products единиц каждой категории каталога и orders заказов
+
+    Каждое устройство НН получает от 1 до 6 секций с фидерами, каждый
+    заказ - полный набор компонентов и снимок цен. Данные
+    детерминированы seed.
+    """
+    rng = random.Random(seed)
+    substations = ComlexTransformerSubstation.objects.bulk_create((
+        ComlexTransformerSubstation(
+            name=f'КТП-{index}', manufacturer=f'Завод {index % 20}',
+            price=rng.uniform(2e5, 2e6), documentation='documentation/substations/ktp.pdf',
+            type_station=rng.choice(ComlexTransformerSubstation.ComlexTransformerSubstationType.values),
+        )
+        for index in range(products)
+    ), batch_size=BATCH_SIZE)
+    transformers = Transformer.objects.bulk_create((
+        Transformer(
+            name=f'ТМГ-{index}', manufacturer=f'Завод {index % 20}',
+            price=rng.uniform(1e5, 1e6), documentation='documentation/transformers/t.pdf',
+            transformer_type=rng.choice(Transformer.TransformerTypes.values),
+            connection_scheme=rng.choice(Transformer.ConnectionSchemes.values),
+            power=rng.choice([25, 40, 63, 100, 160, 250, 400, 630]),
+            voltage=rng.choice([6, 10]), count=1,
+        )
+        for index in range(products)
+    ), batch_size=BATCH_SIZE)
+    hv_devices = HighVoltageDevice.objects.bulk_create((
+        HighVoltageDevice(
+            name=f'УВН-{index}', manufacturer=f'Завод {index % 20}',
+            price=rng.uniform(5e4, 5e5), documentation='documentation/hv_devices/hv.pdf',
+            voltage=rng.choice([6, 10]),
+            input_type=rng.choice(InputOutputType.values),
+            equipment_type=rng.choice(HighVoltageDevice.EquipmentTypes.values),
+        )
+        for index in range(products)
+    ), batch_size=BATCH_SIZE)
+    lv_devices = LowVoltageDevice.objects.bulk_create((
+        LowVoltageDevice(
+            name=f'РУНН-{index}', manufacturer=f'Завод {index % 20}',
+            price=rng.uniform(5e4, 5e5), documentation='documentation/ll_devices/lv.pdf',
+            voltage=400, input_device=rng.choice(LowVoltageDevice.InputDeviceTypes.values),
+            input_denomination=rng.choice([100, 160, 250, 400, 630, 1000]),
+        )
+        for index in range(products)
+    ), batch_size=BATCH_SIZE)
+    fiders = Fiders.objects.bulk_create((
+        Fiders(
+            name=f'Фидер-{index}', manufacturer=f'Завод {index % 20}',
+            price=rng.uniform(5e3, 5e4), documentation='documentation/fiders/f.pdf',
+            amperage=rng.choice([16, 25, 40, 63, 100, 160, 250]),
+        )
+        for index in range(products)
+    ), batch_size=BATCH_SIZE)
+    Section.objects.bulk_create((
+        Section(lv_device=lv_device, fider=rng.choice(fiders),
+                denomination=rng.choice([16, 25, 40, 63, 100, 160, 250]),
+                count=rng.randint(1, 8))
+        for lv_device in lv_devices
+        for _ in range(rng.randint(1, 6))
+    ), batch_size=BATCH_SIZE)
+    bump_catalog_version()
+    clients = Client.objects.bulk_create((
+        Client(full_name=f'Клиент {index}', organization=f'ООО «Заказчик {index}»',
+               email=f'client{index}@example.com', phone_number='+79131234567')
+        for index in range(max(orders // 5, 1))
+    ), batch_size=BATCH_SIZE)
+    Order.objects.bulk_create((
+        Order(client=rng.choice(clients), substation=rng.choice(substations),
+              transformer=rng.choice(transformers), hv_device=rng.choice(hv_devices),
+              lv_device=rng.choice(lv_devices), documentation='orders/order.pdf')
+        for _ in range(orders)
+    ), batch_size=BATCH_SIZE)
+    # bulk_create обходит Order.save, снимок цен снимается отдельно
+    Order.objects.refresh_prices()
+
+
+# Стандартные ряды номиналов и их доли в каталоге
+TRANSFORMER_POWERS = (25, 40, 63, 100, 160, 250, 400, 630)
+TRANSFORMER_POWER_WEIGHTS = (0.03, 0.05, 0.1, 0.16, 0.2, 0.2, 0.16, 0.1)
+HV_VOLTAGES = (6, 10)
+HV_VOLTAGE_WEIGHTS = (0.3, 0.7)
+LV_VOLTAGE = 400
+INPUT_DENOMINATIONS = (100, 160, 250, 400, 630, 1000, 1250)
+LINE_DENOMINATIONS = (16, 25, 40, 63, 100, 160, 250)
+FIDER_AMPERAGES = (16, 25, 40, 63, 100, 160, 250, 400)
+
+MANUFACTURERS = 50
+SURNAMES = ('Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Соколов',
+            'Лебедев', 'Козлов', 'Новиков', 'Морозов', 'Волков')
+NAMES = ('Александр', 'Алексей', 'Андрей', 'Дмитрий', 'Евгений', 'Иван', 'Михаил',
+         'Николай', 'Сергей', 'Юрий')
+PATRONYMICS = ('Александрович', 'Викторович', 'Иванович', 'Петрович', 'Сергеевич')
+ORGANIZATIONS = ('Энергосеть', 'Стройэнерго', 'Агрохолдинг', 'Водоканал', 'Теплосеть',
+                 'Промсервис', 'Горэлектросеть', 'Нефтесервис')
+
+DOCUMENTATION_NAME = 'generated.pdf'
+
+# Компоненты заказа в снимке цен
+ORDER_CATEGORIES = ('substation', 'transformer', 'hv_device', 'lv_device')
+
+# Поля каталога, по которым заказ попадает в разрезы сводки продаж:
+# поле заказа -> (категория, поле записи каталога)
+ORDER_DIMENSIONS = {
+    'transformer_power': ('transformer', 'power'),
+    'type_station': ('substation', 'type_station'),
+    **{f'{name}_manufacturer': (name, 'manufacturer') for name in ORDER_CATEGORIES},
+}
+
+
+def _dummy_pdf(title):
+    """Одностраничный PDF с заголовком title (латиницей)"""
+    text = f'BT /F1 24 Tf 72 760 Td ({title}) Tj ET'.encode('ascii')
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+        b'/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(text), text),
+    ]
+    content = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(content))
+        content += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(content)
+    content += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    content += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    content += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+        len(objects) + 1, xref
+    )
+    return content
+
+
+def documentation_file(model):
+    """Общий для всех записей модели файл документации
+
+    Файл создается в хранилище, если его еще нет.
+    """
+    field = model._meta.get_field('documentation')
+    name = f'{field.upload_to.strip("/")}/{DOCUMENTATION_NAME}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(_dummy_pdf(model.__name__)))
+    return name
+
+
+@contextlib.contextmanager
+def _explicit_create_date():
+    # Даты заказов распределены по периоду, а auto_now_add заменил бы их
+    # текущей датой
+    field = Order._meta.get_field('create_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield range(start, min(start + batch_size, total))
+
+
+def _objects(model, columns, **common):
+    """Экземпляры model по столбцам {поле: список значений}"""
+    names = list(columns)
+    return [model(**common, **dict(zip(names, values))) for values in zip(*columns.values())]
+
+
+def _prices(rng, median, size, sigma=0.25):
+    return np.round(median * rng.lognormal(0, sigma, size), 2)
+
+
+def _choice(rng, values, size, weights=None):
+    return rng.choice(values, size, p=weights).tolist()
+
+
+def _chance(rng, probability, size):
+    return (rng.random(size) < probability).tolist()
+
+
+def _substation_columns(rng, indexes):
+    size = len(indexes)
+    return {
+        'name': [f'КТП-{index + 1}' for index in indexes],
+        'type_station': _choice(
+            rng, ComlexTransformerSubstation.ComlexTransformerSubstationType.values, size
+        ),
+        'price': _prices(rng, 8e5, size).tolist(),
+    }
+
+
+def _transformer_columns(rng, indexes):
+    size = len(indexes)
+    types = _choice(rng, Transformer.TransformerTypes.values, size)
+    powers = rng.choice(TRANSFORMER_POWERS, size, p=TRANSFORMER_POWER_WEIGHTS)
+    voltages = _choice(rng, HV_VOLTAGES, size, HV_VOLTAGE_WEIGHTS)
+    prefixes = {Transformer.TransformerTypes.DRY.value: 'ТСЛ'}
+    return {
+        'name': [f'{prefixes.get(kind, kind)}-{power}/{voltage}-{index + 1}'
+                 for index, kind, power, voltage in zip(indexes, types, powers.tolist(), voltages)],
+        'transformer_type': types,
+        'connection_scheme': _choice(rng, Transformer.ConnectionSchemes.values, size),
+        'power': powers.tolist(),
+        'voltage': voltages,
+        # Двухтрансформаторные подстанции встречаются реже
+        'count': np.where(rng.random(size) < 0.15, 2, 1).tolist(),
+        # Цена растет медленнее мощности
+        'price': np.round(1.2e4 * powers ** 0.75 * rng.lognormal(0, 0.15, size), 2).tolist(),
+    }
+
+
+def _hv_device_columns(rng, indexes):
+    size = len(indexes)
+    voltages = _choice(rng, HV_VOLTAGES, size, HV_VOLTAGE_WEIGHTS)
+    return {
+        'name': [f'УВН-{voltage}-{index + 1}' for index, voltage in zip(indexes, voltages)],
+        'voltage': voltages,
+        'input_type': _choice(rng, InputOutputType.values, size),
+        'arrester': _choice(rng, ArresterAvailabilityHighVoltage.values, size),
+        'equipment_type': _choice(rng, HighVoltageDevice.EquipmentTypes.values, size),
+        'registration': _chance(rng, 0.7, size),
+        'connection_type': _choice(rng, ConnectionTypes.values, size),
+        'price': _prices(rng, 2e5, size).tolist(),
+    }
+
+
+def _lv_device_columns(rng, indexes):
+    size = len(indexes)
+    denominations = rng.choice(INPUT_DENOMINATIONS, size)
+    return {
+        'name': [f'РУНН-{denomination}-{index + 1}'
+                 for index, denomination in zip(indexes, denominations.tolist())],
+        'voltage': [LV_VOLTAGE] * size,
+        'input_denomination': denominations.tolist(),
+        'input_device': _choice(rng, LowVoltageDevice.InputDeviceTypes.values, size),
+        'input_type': _choice(rng, InputOutputType.values, size),
+        'arrester': _choice(rng, ArresterAvailabilityLowVoltage.values, size),
+        'registration': _chance(rng, 0.7, size),
+        'connection_type': _choice(rng, ConnectionTypes.values, size),
+        'price': np.round(250 * denominations * rng.lognormal(0, 0.2, size), 2).tolist(),
+    }
+
+
+def _fider_columns(rng, indexes):
+    size = len(indexes)
+    amperages = rng.choice(FIDER_AMPERAGES, size)
+    return {
+        'name': [f'Фидер-{amperage}-{index + 1}'
+                 for index, amperage in zip(indexes, amperages.tolist())],
+        'amperage': amperages.tolist(),
+        'price': np.round(120 * amperages ** 0.8 * rng.lognormal(0, 0.2, size), 2).tolist(),
+    }
+
+
+CATALOG_COLUMNS = (
+    ('substation', ComlexTransformerSubstation, _substation_columns),
+    ('transformer', Transformer, _transformer_columns),
+    ('hv_device', HighVoltageDevice, _hv_device_columns),
+    ('lv_device', LowVoltageDevice, _lv_device_columns),
+    ('fider', Fiders, _fider_columns),
+)
+
+
+def _catalog(rng, model, columns, products, batch_size):
+    """Создает products записей категории
+
+    Возвращает столбцы созданных записей {поле: массив}: pk, price,
+    voltage (по нему в заказ подбирается совместимое устройство ВН) и
+    поля, которые заказ запоминает для сводки продаж (ORDER_DIMENSIONS).
+    """
+    documentation = documentation_file(model)
+    # Несколько крупных производителей выпускают большую часть каталога
+    weights = 1 / np.arange(1, MANUFACTURERS + 1)
+    kept = {'price', 'voltage'} | {field for _, field in ORDER_DIMENSIONS.values()}
+    created = {'pk': [], 'price': []}
+    for indexes in _batches(products, batch_size):
+        batch = columns(rng, indexes)
+        batch['manufacturer'] = [
+            f'Завод {number + 1}'
+            for number in rng.choice(MANUFACTURERS, len(indexes), p=weights / weights.sum())
+        ]
+        objects = model.objects.bulk_create(_objects(model, batch, documentation=documentation),
+                                            batch_size=batch_size)
+        created['pk'].extend(item.pk for item in objects)
+        for field in kept & set(batch):
+            created.setdefault(field, []).extend(batch[field])
+    types = {'pk': np.int64, 'price': np.float64}
+    return {field: np.array(values, dtype=types.get(field, object))
+            for field, values in created.items()}
+
+
+class _Sections:
+    """Секции устройств НН по порядку устройств
+
+    Секции устройства с номером device - строки
+    rows[offsets[device]:offsets[device + 1]] вида (pk фидера,
+    наименование фидера, производитель фидера, ток линии, число линий,
+    стоимость линии).
+    """
+
+    def __init__(self, offsets, rows):
+        self.offsets = offsets
+        self.rows = rows
+        self.totals = np.array([
+            sum(count * unit_price for *_, count, unit_price in self.lines(device))
+            for device in range(len(offsets) - 1)
+        ])
+
+    def lines(self, device):
+        return self.rows[self.offsets[device]:self.offsets[device + 1]]
+
+
+def _sections(rng, lv_devices, batch_size):
+    """Создает от 1 до 6 секций на устройство НН
+
+    Ток линии не больше номинала вводного устройства, фидер выбирается
+    среди рассчитанных на ток линии.
+    """
+    input_denominations = dict(LowVoltageDevice.objects.values_list('pk', 'input_denomination'))
+    limits = np.array([input_denominations[pk] for pk in lv_devices.tolist()], dtype=np.int64)
+    fiders = list(Fiders.objects.order_by('amperage', 'price', 'pk').values_list(
+        'pk', 'name', 'manufacturer', 'amperage', 'price'
+    ))
+    amperages = np.array([amperage for *_, amperage, _ in fiders], dtype=np.float64)
+
+    sizes = rng.integers(1, 7, size=len(lv_devices))
+    devices = np.repeat(np.arange(len(lv_devices)), sizes)
+    allowed = np.searchsorted(LINE_DENOMINATIONS, limits[devices], side='right')
+    lines = np.array(LINE_DENOMINATIONS)[(rng.random(len(devices)) * allowed).astype(np.int64)]
+    counts = rng.integers(1, 9, size=len(devices))
+    first = np.searchsorted(amperages, lines, side='left')
+    chosen = first + (rng.random(len(devices)) * (len(fiders) - first)).astype(np.int64)
+
+    rows = []
+    for line, count, index in zip(lines.tolist(), counts.tolist(), chosen.tolist()):
+        if index < len(fiders):
+            pk, name, manufacturer, _, price = fiders[index]
+            rows.append((pk, name, manufacturer, line, count, price))
+        else:
+            rows.append((None, '', None, line, count, 0))
+    for indexes in _batches(len(rows), batch_size):
+        Section.objects.bulk_create((
+            Section(lv_device_id=lv_devices[devices[index]], fider_id=rows[index][0],
+                    denomination=rows[index][3], count=rows[index][4])
+            for index in indexes
+        ), batch_size=batch_size)
+    return _Sections(np.concatenate(([0], np.cumsum(sizes))).tolist(), rows)
+
+
+def _clients(rng, clients, batch_size):
+    pks = []
+    for indexes in _batches(clients, batch_size):
+        size = len(indexes)
+        surnames, names, patronymics, organizations = (
+            rng.integers(len(values), size=size).tolist()
+            for values in (SURNAMES, NAMES, PATRONYMICS, ORGANIZATIONS)
+        )
+        columns = {
+            'full_name': [f'{SURNAMES[surname]} {NAMES[name]} {PATRONYMICS[patronymic]}'
+                          for surname, name, patronymic in zip(surnames, names, patronymics)],
+            'organization': [f'ООО «{ORGANIZATIONS[organization]} {index + 1}»'
+                             for index, organization in zip(indexes, organizations)],
+            'email': [f'client{index + 1}@example.com' for index in indexes],
+            'phone_number': [f'+79{number:09d}'
+                             for number in rng.integers(10 ** 9, size=size).tolist()],
+        }
+        created = Client.objects.bulk_create(_objects(Client, columns), batch_size=batch_size)
+        pks.extend(item.pk for item in created)
+    return np.array(pks, dtype=np.int64)
+
+
+def _orders(rng, orders, clients, catalog, sections, days, confirmed, batch_size):
+    """Создает заказы со снимком цен по порядку дат, выдает размеры партий"""
+    documentation = documentation_file(Order)
+    start_date = datetime.date.today() - datetime.timedelta(days=days)
+    # Устройство ВН совместимо с трансформатором того же напряжения;
+    # если таких в каталоге нет, подходит любое
+    hv_voltages = catalog['hv_device']['voltage']
+    compatible = {}
+    for voltage in HV_VOLTAGES:
+        candidates = np.flatnonzero(hv_voltages == voltage)
+        compatible[voltage] = candidates if len(candidates) else np.arange(len(hv_voltages))
+    for indexes in _batches(orders, batch_size):
+        size = len(indexes)
+        chosen = {name: rng.integers(len(products['pk']), size=size)
+                  for name, products in catalog.items() if name != 'hv_device'}
+        transformer_voltages = catalog['transformer']['voltage'][chosen['transformer']]
+        chosen['hv_device'] = np.empty(size, dtype=np.int64)
+        for voltage, candidates in compatible.items():
+            matching = transformer_voltages == voltage
+            chosen['hv_device'][matching] = candidates[
+                rng.integers(len(candidates), size=int(matching.sum()))
+            ]
+        lv_devices = chosen['lv_device'].tolist()
+        columns = {
+            # Постоянные клиенты заказывают чаще
+            'client_id': clients[(rng.random(size) ** 2 * len(clients)).astype(np.int64)].tolist(),
+            'create_date': [start_date + datetime.timedelta(days=index * days // orders)
+                            for index in indexes],
+            'confirmed': _chance(rng, confirmed, size),
+            'sections_price': sections.totals[lv_devices].tolist(),
+        }
+        total = sections.totals[lv_devices]
+        for name, products in catalog.items():
+            columns[f'{name}_id'] = products['pk'][chosen[name]].tolist()
+            columns[f'{name}_price'] = products['price'][chosen[name]].tolist()
+            total = total + products['price'][chosen[name]]
+        columns['total_price'] = total.tolist()
+        # Разрезы сводки продаж запоминаются при подтверждении (Order.save)
+        for field, (name, source) in ORDER_DIMENSIONS.items():
+            columns[field] = np.where(columns['confirmed'], catalog[name][source][chosen[name]],
+                                      None).tolist()
+        objects = _objects(Order, columns, documentation=documentation)
+        with transaction.atomic():
+            with _explicit_create_date():
+                Order.objects.bulk_create(objects, batch_size=batch_size)
+            OrderSection.objects.bulk_create((
+                OrderSection(order_id=order.pk, fider_id=fider, name=name,
+                             manufacturer=manufacturer if order.confirmed else None,
+                             denomination=denomination, count=count,
+                             unit_price=unit_price, price=count * unit_price)
+                for order, device in zip(objects, lv_devices)
+                for fider, name, manufacturer, denomination, count, unit_price
+                in sections.lines(device)
+            ), batch_size=batch_size)
+        yield size
+
+
+def generate(products=1000, orders=100000, seed=0, days=730, confirmed=0.6,
+             batch_size=5000):
+    """Создает products единиц каждой категории каталога и orders заказов
+
+    Выдает пары (название модели, сколько создано) по мере создания.
+    Заказы распределены по days дням до сегодняшнего, доля confirmed из
+    них подтверждена. Данные определяются seed; таблицы должны быть
+    пустыми.
+    """
+    rng = np.random.default_rng(seed)
+    catalog = {}
+    for name, model, columns in CATALOG_COLUMNS:
+        catalog[name] = _catalog(rng, model, columns, products, batch_size)
+        yield model._meta.verbose_name_plural, products
+    # Фидеры попадают в заказы только через секции
+    del catalog['fider']
+    sections = _sections(rng, catalog['lv_device']['pk'], batch_size)
+    yield Section._meta.verbose_name_plural, len(sections.rows)
+    # Каталог создан в обход сигналов
+    bump_catalog_version()
+    clients = _clients(rng, max(orders // 5, 1), batch_size)
+    yield Client._meta.verbose_name_plural, len(clients)
+    created = 0
+    for size in _orders(rng, orders, clients, catalog, sections, days, confirmed, batch_size):
+        created += size
+        yield Order._meta.verbose_name_plural, created
+    reports.rebuild()
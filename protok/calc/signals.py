@@ -0,0 +1,158 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from . import catalog, matching, reports, result_pages, search
+from .models import (
+    ORDER_COMPONENTS, Client, Fiders, LowVoltageDevice, Order, OrderSection, Section,
+)
+
+
+def _advance_indexes(sender, previous_version, version):
+    # Изменение другой модели не трогает записи индекса, но версия
+    # каталога сменилась: без перевода индекс перестроился бы целиком
+    for model, index in matching.INDEXES.items():
+        if model is not sender:
+            index.advance(previous_version, version)
+
+
+def catalog_saved(sender, instance, **kwargs):
+    previous_version = catalog.catalog_version()
+    version = catalog.bump_catalog_version()
+    index = matching.INDEXES.get(sender)
+    if index is not None:
+        index.update(instance, previous_version, version)
+    _advance_indexes(sender, previous_version, version)
+    search.products.update(instance, previous_version, version)
+
+
+def catalog_deleted(sender, instance, **kwargs):
+    previous_version = catalog.catalog_version()
+    version = catalog.bump_catalog_version()
+    index = matching.INDEXES.get(sender)
+    if index is not None:
+        index.remove(instance.pk, previous_version, version)
+    _advance_indexes(sender, previous_version, version)
+    search.products.remove(sender, instance.pk, previous_version, version)
+
+
+# Снимок цен открытых заказов (Order). Заказы находятся по внешним
+# ключам на компоненты и фидеры, которые проиндексированы.
+
+COMPONENT_BY_MODEL = {model: component for component, model in ORDER_COMPONENTS.items()}
+
+
+def component_saved(sender, instance, **kwargs):
+    component = COMPONENT_BY_MODEL[sender]
+    Order.objects.open().filter(**{component: instance.pk}).set_component_price(
+        component, instance.price
+    )
+
+
+def component_deleting(sender, instance, **kwargs):
+    # После удаления ссылка в заказе обнулится (SET_NULL) и заказы уже
+    # не найти, поэтому цена обнуляется до удаления
+    component = COMPONENT_BY_MODEL[sender]
+    orders = Order.objects.open().filter(**{component: instance.pk})
+    if sender is LowVoltageDevice:
+        OrderSection.objects.filter(order__in=orders).delete()
+        orders.refresh_sections_price()
+    orders.set_component_price(component, 0)
+
+
+def _fider_price_changed(fider, price):
+    lines = OrderSection.objects.filter(
+        fider=fider, order__confirmed=False
+    ).exclude(unit_price=price)
+    orders = set(lines.values_list('order', flat=True))
+    if orders:
+        lines.update(unit_price=price, price=F('count') * price)
+        Order.objects.filter(pk__in=orders).refresh_sections_price()
+
+
+def fider_saved(sender, instance, **kwargs):
+    _fider_price_changed(instance.pk, instance.price)
+
+
+def fider_deleting(sender, instance, **kwargs):
+    _fider_price_changed(instance.pk, 0)
+
+
+_state = threading.local()
+
+
+@contextmanager
+def sections_refresh_suspended():
+    """Отключает пересчет заказов на каждую секцию при массовых изменениях
+
+    Вызывающий код сам пересчитывает затронутые заказы.
+    """
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = False
+
+
+def section_changed(sender, instance, **kwargs):
+    if getattr(_state, 'suspended', False):
+        return
+    Order.objects.open().filter(lv_device=instance.lv_device_id).refresh_prices()
+
+
+# Страницы заказов (calc.result_pages). Изменения каталога сбрасывают
+# страницы открытых заказов через версию каталога.
+
+def order_changed(sender, instance, **kwargs):
+    result_pages.invalidate([instance.pk])
+
+
+def client_changed(sender, instance, **kwargs):
+    result_pages.invalidate(Order.objects.filter(client=instance.pk).values_list('pk', flat=True))
+
+
+# Сводка продаж (calc.reports): разница вклада заказа до и после
+# изменения. Заказ, который не был и не стал подтвержденным, в сводку
+# не входит, и его сохранение не читает базу.
+
+def order_saving(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_state', None)
+    # Первый элемент - confirmed при загрузке (None, если поле отложено)
+    was_confirmed = instance.pk is not None and (loaded is None or loaded[0] is not False)
+    instance._sales_before = (reports.order_contributions(instance.pk) if was_confirmed
+                              else reports.Contributions())
+
+
+def order_saved(sender, instance, **kwargs):
+    before = instance.__dict__.pop('_sales_before', reports.Contributions())
+    after = (reports.order_contributions(instance.pk) if instance.confirmed
+             else reports.Contributions())
+    if before or after:
+        reports.apply(after - before)
+
+
+def order_deleting(sender, instance, **kwargs):
+    if instance.confirmed:
+        reports.apply(-reports.order_contributions(instance.pk))
+
+
+# Приемники подключаются к конкретным моделям: приемник без sender
+# отключил бы быстрое удаление (без выборки объектов) для всех моделей
+for model in catalog.CATALOG_MODELS:
+    post_save.connect(catalog_saved, sender=model)
+    post_delete.connect(catalog_deleted, sender=model)
+for model in ORDER_COMPONENTS.values():
+    post_save.connect(component_saved, sender=model)
+    pre_delete.connect(component_deleting, sender=model)
+post_save.connect(fider_saved, sender=Fiders)
+pre_delete.connect(fider_deleting, sender=Fiders)
+post_save.connect(section_changed, sender=Section)
+post_delete.connect(section_changed, sender=Section)
+post_save.connect(order_changed, sender=Order)
+post_delete.connect(order_changed, sender=Order)
+post_save.connect(client_changed, sender=Client)
+pre_save.connect(order_saving, sender=Order)
+post_save.connect(order_saved, sender=Order)
+pre_delete.connect(order_deleting, sender=Order)
@@ -0,0 +1,163 @@
+"""Подбор оборудования КТП по нагрузке секций НН
+
+Секция - count линий с номинальным током denomination. Ток нагрузки
+стороны НН - сумма токов всех линий, умноженная на коэффициент
+одновременности SIZING_DEMAND_FACTOR, мощность нагрузки S = √3·U·I при
+напряжении стороны НН U. Подбираются:
+
+* трансформатор с наименьшей суммарной мощностью power·count, которой
+  хватает на нагрузку при допустимой загрузке SIZING_LOAD_FACTOR;
+* устройство НН с наименьшим номиналом вводного устройства не меньше
+  тока нагрузки;
+* для каждой секции - фидер с наименьшим током не меньше тока линии.
+
+Из равных по мощности (номиналу, току) вариантов выбирается самый
+дешевый. Как и в calc.pricing, каталог загружается в массивы NumPy один
+раз на версию каталога и хранится в общем снимке calc.snapshots, а
+подбор для всех секций и кандидатов - это несколько векторных операций
+без запросов к базе.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+
+from . import snapshots
+from .models import Fiders, LowVoltageDevice, Transformer
+from .pricing import _dtype, _mask
+
+# Номинальное напряжение стороны НН, В
+LV_VOLTAGE = 400
+
+# Категория -> (модель, поле подбора, поля, доступные для фильтрации)
+CATEGORIES = {
+    'transformer': (Transformer, 'power', ('power', 'count', 'voltage', 'transformer_type',
+                                           'connection_scheme')),
+    'lv_device': (LowVoltageDevice, 'input_denomination', (
+        'input_denomination', 'voltage', 'input_type', 'arrester', 'input_device',
+        'registration', 'connection_type',
+    )),
+    'fider': (Fiders, 'amperage', ('amperage',)),
+}
+
+Load = namedtuple('Load', 'current power')
+Sizing = namedtuple('Sizing', 'load transformer lv_device fiders')
+
+
+def _rating(name, array):
+    """Значение, по которому подбирается запись категории"""
+    if name == 'transformer':
+        return array['power'] * array['count']
+    return array[CATEGORIES[name][1]]
+
+
+def load_category(name):
+    """Категория в структурированном массиве по возрастанию номинала и цены"""
+    model, _, fields = CATEGORIES[name]
+    # Стоимость секций к устройству НН не прибавляется: фидеры
+    # подбираются отдельно, поэтому total совпадает с price
+    rows = model.objects.order_by().values_list('pk', 'price', 'price', *fields)
+    array = np.array(list(rows), dtype=_dtype(model, fields))
+    return array[np.lexsort((array['price'], _rating(name, array)))]
+
+
+def load_catalog():
+    """Загружает все категории каталога"""
+    return {name: load_category(name) for name in CATEGORIES}
+
+
+def current_catalog():
+    """Каталог текущей версии из общего снимка (calc.snapshots)"""
+    return snapshots.catalog.get('sizing', load_catalog)
+
+
+def _columns(sections, width):
+    array = np.array(list(sections), dtype=np.float64).reshape(-1, width)
+    return array.T
+
+
+def section_load(denominations, counts, voltage=LV_VOLTAGE):
+    """Ток (А) и мощность (кВА) нагрузки секций"""
+    factor = getattr(settings, 'SIZING_DEMAND_FACTOR', 1.0)
+    current = float(np.dot(denominations, counts)) * factor
+    return Load(current, math.sqrt(3) * voltage * current / 1000)
+
+
+def _first(array, name, requirements, minimum):
+    """pk самой дешевой записи с наименьшим номиналом не меньше minimum"""
+    found = _mask(array, requirements) & (_rating(name, array) >= minimum)
+    if not found.any():
+        return None
+    return int(array['pk'][np.argmax(found)])
+
+
+def size(sections, voltage=LV_VOLTAGE, requirements=None, catalog=None):
+    """Подбирает трансформатор, устройство НН и фидеры секций
+
+    sections - пары (номинальный ток линии, число линий), voltage -
+    напряжение стороны НН. requirements ограничивает кандидатов, как в
+    pricing.cheapest_configurations: {категория: {поиск: значение}} для
+    категорий CATEGORIES. Возвращает Sizing с pk записей; None - ничего
+    не подошло.
+    """
+    if catalog is None:
+        catalog = current_catalog()
+    requirements = requirements or {}
+    unknown = set(requirements) - set(CATEGORIES)
+    if unknown:
+        raise ValueError(f'Неизвестная категория {unknown.pop()}')
+    denominations, counts = _columns(sections, 2)
+    load = section_load(denominations, counts, voltage)
+
+    transformers = catalog['transformer']
+    transformer = _first(transformers, 'transformer', requirements.get('transformer', {}),
+                         load.power / getattr(settings, 'SIZING_LOAD_FACTOR', 1.0))
+    lv_devices = catalog['lv_device']
+    lv_device = _first(lv_devices, 'lv_device',
+                       {'voltage': voltage, **requirements.get('lv_device', {})}, load.current)
+
+    # Фидеры отсортированы по току и цене: первый с током не меньше тока
+    # линии - самый дешевый из наименьших подходящих
+    fiders = catalog['fider']
+    fiders = fiders[_mask(fiders, requirements.get('fider', {}))]
+    positions = np.searchsorted(fiders['amperage'], denominations, side='left')
+    # Позиция за концом массива - подходящего фидера нет
+    pks = np.append(fiders['pk'], -1)[positions]
+    return Sizing(load, transformer, lv_device, [pk if pk >= 0 else None for pk in pks.tolist()])
+
+
+def check(sections, transformer=None, lv_device=None, voltage=None):
+    """Замечания к комплектации; пустой список - нагрузка покрыта
+
+    sections - тройки (номинальный ток линии, число линий, ток фидера
+    или None). Напряжение стороны НН по умолчанию берется из устройства НН.
+    """
+    if voltage is None:
+        voltage = lv_device.voltage if lv_device is not None else LV_VOLTAGE
+    rows = [(denomination, count, np.nan if amperage is None else amperage)
+            for denomination, count, amperage in sections]
+    denominations, counts, amperages = _columns(rows, 3)
+    load = section_load(denominations, counts, voltage)
+    problems = []
+    for number in np.flatnonzero(np.isnan(amperages)).tolist():
+        problems.append(f'Секция {number + 1}: не выбран фидер')
+    for number in np.flatnonzero(amperages < denominations).tolist():
+        problems.append(f'Секция {number + 1}: ток фидера {amperages[number]:g} А '
+                        f'меньше тока линии {denominations[number]:g} А')
+    if lv_device is not None and lv_device.input_denomination < load.current:
+        problems.append(f'Номинал вводного устройства {lv_device.input_denomination} А '
+                        f'меньше тока нагрузки {load.current:.0f} А')
+    if transformer is not None:
+        rated = transformer.power * transformer.count
+        if rated * getattr(settings, 'SIZING_LOAD_FACTOR', 1.0) < load.power:
+            problems.append(f'Мощности трансформатора {rated} кВА не хватает '
+                            f'на нагрузку {load.power:.0f} кВА')
+    return problems
+
+
+def check_order(order):
+    """Замечания к комплектации заказа по секциям его снимка"""
+    sections = order.sections.order_by('pk').values_list('denomination', 'count',
+                                                         'fider__amperage')
+    return check(sections, order.transformer, order.lv_device)
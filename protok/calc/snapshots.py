@@ -0,0 +1,142 @@
+"""Снимки каталога в файлах, общих для всех процессов сервера
+
+Массивы NumPy, вычисленные по каталогу (calc.pricing, calc.sizing),
+сохраняются в CATALOG_SNAPSHOT_ROOT/<версия каталога>/<имя снимка>/ по
+файлу .npy на массив и открываются через np.load(mmap_mode='r'). Все
+процессы читают одни и те же страницы кеша ОС, поэтому память процесса
+не растет вместе с каталогом, а новый процесс открывает готовый снимок
+вместо запросов к базе.
+
+Снимок записывается во временный каталог и переименовывается в
+окончательный одной операцией: процессы видят его либо целиком, либо
+никак. После смены версии каталога процессы открывают снимок новой
+версии при следующем обращении. На диске хранятся снимки
+CATALOG_SNAPSHOT_KEEP последних версий, в процессе открыто не больше
+CATALOG_SNAPSHOT_ENTRIES снимков текущей версии (давно не
+использованные закрываются). CATALOG_SNAPSHOT_ROOT = None хранит
+массивы в памяти процесса.
+
+Версия каталога хранится в кеше Django (calc.catalog), поэтому
+процессы видят одни и те же снимки, только если кеш у них общий
+(настройка CACHES боевых профилей).
+"""
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import RLock
+
+import numpy as np
+from django.conf import settings
+
+from .catalog import catalog_version
+
+logger = logging.getLogger(__name__)
+
+TEMPORARY_PREFIX = '.tmp-'
+
+
+def snapshot_root():
+    root = getattr(settings, 'CATALOG_SNAPSHOT_ROOT', settings.BASE_DIR / 'snapshots')
+    return Path(root) if root else None
+
+
+class SnapshotCache:
+    """Снимки массивов каталога, открытые в этом процессе"""
+
+    def __init__(self):
+        self._lock = RLock()
+        self._entries = OrderedDict()
+
+    def get(self, name, build):
+        """Массивы снимка name для текущей версии каталога
+
+        build() возвращает словарь {имя массива: массив} и вызывается,
+        только если снимка этой версии еще нет ни в процессе, ни на диске.
+        """
+        version = catalog_version()
+        key = version, name
+        with self._lock:
+            arrays = self._entries.get(key)
+            if arrays is not None:
+                self._entries.move_to_end(key)
+                return arrays
+        arrays = self._open(version, name, build)
+        with self._lock:
+            # Снимки прежних версий больше не понадобятся
+            for stale in [stale for stale in self._entries if stale[0] != version]:
+                del self._entries[stale]
+            self._entries[key] = arrays
+            self._entries.move_to_end(key)
+            while len(self._entries) > getattr(settings, 'CATALOG_SNAPSHOT_ENTRIES', 8):
+                self._entries.popitem(last=False)
+        return arrays
+
+    def clear(self):
+        """Закрывает открытые снимки; файлы на диске остаются"""
+        with self._lock:
+            self._entries.clear()
+
+    def _open(self, version, name, build):
+        root = snapshot_root()
+        if root is None:
+            return build()
+        path = root / str(version) / name
+        arrays = None
+        if not path.is_dir():
+            arrays = build()
+            try:
+                publish(root, path, arrays)
+            except OSError as error:
+                logger.warning('Снимок каталога %s не сохранен: %s', path, error)
+                return arrays
+            prune(root, version)
+        try:
+            mapped = {
+                file.stem: np.load(file, mmap_mode='r', allow_pickle=False)
+                for file in sorted(path.glob('*.npy'))
+            }
+        except OSError:
+            mapped = {}
+        if mapped:
+            return mapped
+        # Снимок удалил prune другого процесса, которому эта версия уже
+        # кажется устаревшей: массивы остаются в памяти процесса
+        logger.warning('Снимок каталога %s удален до открытия', path)
+        return arrays if arrays is not None else build()
+
+
+def publish(root, path, arrays):
+    """Атомарно записывает массивы снимка в каталог path"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = Path(tempfile.mkdtemp(prefix=TEMPORARY_PREFIX, dir=root))
+    try:
+        for key, array in arrays.items():
+            np.save(temporary / f'{key}.npy', np.ascontiguousarray(array), allow_pickle=False)
+        try:
+            os.rename(temporary, path)
+        except OSError:
+            # Тот же снимок раньше записал другой процесс
+            if not path.is_dir():
+                raise
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+
+def prune(root, version):
+    """Удаляет снимки всех версий, кроме CATALOG_SNAPSHOT_KEEP последних
+
+    Процессы, которые еще читают удаленный снимок, не замечают удаления:
+    открытый файл остается доступен до закрытия.
+    """
+    keep = getattr(settings, 'CATALOG_SNAPSHOT_KEEP', 2)
+    versions = sorted((int(path.name) for path in root.iterdir()
+                       if path.is_dir() and path.name.isdigit()), reverse=True)
+    for stale in versions[keep:]:
+        if stale != version:
+            shutil.rmtree(root / str(stale), ignore_errors=True)
+
+
+catalog = SnapshotCache()
@@ -1,4 +1,12 @@
+import mimetypes
+import os
+
 from django import template
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from calc import assets
 
 
 register = template.Library()
@@ -7,3 +15,71 @@ register = template.Library()
 @register.filter(name='get')
 def get(d, k):
     return getattr(d, k) if hasattr(d, k) else None
+
+
+@register.simple_tag
+def vendor_asset(name):
+    """<link> или <script> файла VENDOR: локальная копия, если она собрана, иначе CDN"""
+    path = assets.vendor_path(name)
+    if assets.available(path):
+        url, attrs = static(path), ''
+    else:
+        url, integrity = assets.VENDOR[name]
+        attrs = format_html(' integrity="{}" crossorigin="anonymous"', integrity)
+    if name.endswith('.css'):
+        return format_html('<link href="{}" rel="stylesheet"{}>', url, attrs)
+    return format_html('<script src="{}"{}></script>', url, attrs)
+
+
+def _variants(name, extension=None):
+    """Пары (адрес, ширина) собранных уменьшенных копий изображения"""
+    return [
+        (static(assets.variant_name(name, width, extension)), width)
+        for width in assets.IMAGES.get(name, ())
+        if width and assets.available(assets.variant_name(name, width, extension))
+    ]
+
+
+def _srcset(variants):
+    return ', '.join(f'{url} {width}w' for url, width in variants)
+
+
+@register.simple_tag
+def picture(name, width, height, alt='', **attrs):
+    """<picture> с вариантами WebP и уменьшенными копиями изображения
+
+    Без собранных вариантов (build_assets) выводится исходное изображение.
+    """
+    extra = flatatt({key.replace('_', '-'): value for key, value in attrs.items()})
+    variants = _variants(name)
+    if variants:
+        img = format_html(
+            '<img src="{}" srcset="{}" sizes="{}px" width="{}" height="{}" alt="{}" '
+            'loading="lazy" decoding="async"{}>',
+            variants[0][0], _srcset(variants), width, width, height, alt, extra,
+        )
+    else:
+        img = format_html(
+            '<img src="{}" width="{}" height="{}" alt="{}" loading="lazy" decoding="async"{}>',
+            static(name), width, height, alt, extra,
+        )
+    webp = _variants(name, '.webp')
+    if not webp:
+        return img
+    return format_html('<picture><source type="image/webp" srcset="{}" sizes="{}px">{}</picture>',
+                       _srcset(webp), width, img)
+
+
+@register.simple_tag
+def background(name):
+    """CSS фона страницы с вариантом WebP для браузеров, которые его поддерживают"""
+    style = format_html('background: url({}) center / cover;', static(name))
+    webp = assets.variant_name(name, None, '.webp')
+    if not assets.available(webp):
+        return style
+    _, extension = os.path.splitext(name)
+    original_type = mimetypes.types_map.get(extension, 'image/png')
+    return format_html(
+        "{} background-image: image-set(url({}) type('image/webp'), url({}) type('{}'));",
+        style, static(webp), static(name), original_type,
+    )
@@ -1,3 +1,1653 @@
-from django.test import TestCase
+import datetime
+import gzip
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.http import FileResponse
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.utils import formats, timezone
+
+from . import (
+    admin, assets, benchmark, bundles, catalog, changelist, instrumentation, matching, offers,
+    outbox, pricelists, pricing, reports, schema, search, seeding, sizing, snapshots,
+)
+from .forms import ClientForm
+from .models import (
+    Client, ComlexTransformerSubstation, Fiders, HighVoltageDevice, LowVoltageDevice, Order,
+    OrderQuerySet, OutgoingEmail, SalesSummary, Section, Transformer, UploadSession,
+)
+
+
+class QueryPlanTests(TestCase):
+    """Запросы подбора по большому каталогу должны использовать индексы"""
+
+    CATALOG_SIZE = 20000
+    CLIENTS = 2000
+    ORDERS = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        Transformer.objects.bulk_create(
+            Transformer(
+                name=f'ТМГ-{index}', manufacturer=f'Завод {index % 50}',
+                price=rng.uniform(1e5, 1e6), documentation='documentation/t.pdf',
+                transformer_type=rng.choice(Transformer.TransformerTypes.values),
+                connection_scheme=rng.choice(Transformer.ConnectionSchemes.values),
+                power=rng.randint(20, 630), voltage=rng.choice([6, 10]), count=1,
+            )
+            for index in range(cls.CATALOG_SIZE)
+        )
+        HighVoltageDevice.objects.bulk_create(
+            HighVoltageDevice(
+                name=f'ВН-{index}', manufacturer=f'Завод {index % 50}',
+                price=rng.uniform(1e4, 1e5), documentation='documentation/hv.pdf',
+                voltage=rng.randint(1, 100) * 100,
+                equipment_type=rng.choice(HighVoltageDevice.EquipmentTypes.values),
+                input_type=rng.choice([0, 1]),
+            )
+            for index in range(cls.CATALOG_SIZE)
+        )
+        LowVoltageDevice.objects.bulk_create(
+            LowVoltageDevice(
+                name=f'НН-{index}', manufacturer=f'Завод {index % 50}',
+                price=rng.uniform(1e4, 1e5), documentation='documentation/lv.pdf',
+                voltage=rng.randint(1, 100) * 10,
+                input_device=rng.choice(LowVoltageDevice.InputDeviceTypes.values),
+                input_denomination=rng.choice([100, 160, 250, 400, 630, 1000]),
+            )
+            for index in range(cls.CATALOG_SIZE)
+        )
+        clients = Client.objects.bulk_create(
+            Client(full_name=f'Клиент {index}', organization=f'ООО {index}',
+                   email=f'client{index}@example.com', phone_number='+79131234567')
+            for index in range(cls.CLIENTS)
+        )
+        Order.objects.bulk_create(
+            Order(client=rng.choice(clients), documentation='orders/o.pdf')
+            for _ in range(cls.ORDERS)
+        )
+        # create_date заполняется auto_now_add, разносим заказы по датам
+        start = datetime.date(2020, 1, 1)
+        step = cls.ORDERS // 500
+        first = Order.objects.order_by('pk').values_list('pk', flat=True)[0]
+        for day in range(500):
+            Order.objects.filter(
+                pk__gte=first + day * step, pk__lt=first + (day + 1) * step
+            ).update(create_date=start + datetime.timedelta(days=day))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_transformer_match(self):
+        self.assertUsesIndex(
+            Transformer.objects.filter(
+                transformer_type='ТМГ', connection_scheme='Д/У', power__gte=400
+            ).order_by('power', 'price'),
+            'calc_transformer_match_idx',
+        )
+
+    def test_hv_device_match(self):
+        self.assertUsesIndex(
+            HighVoltageDevice.objects.filter(voltage=1000, equipment_type=0, input_type=1),
+            'calc_hv_device_match_idx',
+        )
+
+    def test_lv_device_match(self):
+        self.assertUsesIndex(
+            LowVoltageDevice.objects.filter(voltage=400, input_device=1),
+            'calc_lv_device_match_idx',
+        )
+
+    def test_orders_by_date(self):
+        self.assertUsesIndex(
+            Order.objects.filter(create_date=datetime.date(2020, 3, 1)),
+            'calc_order_create_date_idx',
+        )
+
+    def test_client_by_email(self):
+        # На SQLite индекс ограничения уникальности получает служебное имя
+        plan = Client.objects.filter(email_key='client42@example.com').explain()
+        self.assertRegex(plan, 'calc_client_contact_key|sqlite_autoindex_calc_client')
+
+    def test_client_search(self):
+        # Поиск админки по началу наименования и e-mail идет по индексам
+        plan = Client.objects.filter(**admin._prefix_lookups('organization_key', 'ООО 4')).explain()
+        self.assertRegex(plan, r'INDEX calc_client_organization_key_\w+ \(organization_key>\? '
+                               r'AND organization_key<\?\)')
+        plan = Order.objects.filter(**admin._prefix_lookups('client__organization_key',
+                                                            'ООО 4')).explain()
+        self.assertIn('calc_client_organization_key', plan)
+        plan = Client.objects.filter(**admin._prefix_lookups('email_key', 'client4')).explain()
+        self.assertRegex(plan, r'(calc_client_contact_key|sqlite_autoindex_calc_client_\d+) '
+                               r'\(email_key>\? AND email_key<\?\)')
+
+    def test_client_history(self):
+        self.assertUsesIndex(
+            Order.objects.filter(client=Client.objects.first()).order_by('-create_date', '-id'),
+            'calc_order_client_date_idx',
+        )
+
+
+class QueryBudgetMixin:
+    """Число SQL-запросов каждого представления не выше бюджета
+
+    Тесты запускаются на двух размерах данных, поэтому N+1 запросов
+    сразу выходит за бюджет.
+    """
+    PRODUCTS = None
+    ORDERS = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(cls.PRODUCTS, cls.ORDERS)
+        cls.order_pk = Order.objects.order_by('-pk').values_list('pk', flat=True)[0]
+
+    def test_query_budgets(self):
+        for scenario in benchmark.scenarios(self.order_pk):
+            with self.subTest(scenario.name):
+                client = benchmark.make_client(scenario)
+                benchmark.request(client, scenario)  # прогрев кешей
+                response, queries = benchmark.request(client, scenario)
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(queries, benchmark.QUERY_BUDGETS[scenario.name])
+
+
+# Отрисовка предложения в фоне не относится к тесту и не должна
+# обращаться к тестовой базе из потоков пула
+@override_settings(OFFER_PREPARE=False)
+class SmallCatalogQueryBudgetTests(QueryBudgetMixin, TestCase):
+    PRODUCTS = 10
+    ORDERS = 50
+
+
+@override_settings(OFFER_PREPARE=False)
+class LargeCatalogQueryBudgetTests(QueryBudgetMixin, TestCase):
+    PRODUCTS = 300
+    ORDERS = 3000
+
+
+@override_settings(OFFER_PREPARE=False)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        for histogram in instrumentation.HISTOGRAMS:
+            histogram.clear()
+
+    def test_server_timing(self):
+        response = self.client.get('/')
+        header = response['Server-Timing']
+        self.assertIn('sql;desc=', header)
+        self.assertIn('tpl;desc="calc/form.html"', header)
+        self.assertIn('total;dur=', header)
+
+    def test_upload_timing(self):
+        upload = SimpleUploadedFile('drawings.pdf', b'0' * 1000)
+        response = self.client.post('/get_contact/', {'documentation': upload})
+        self.assertIn('upload;desc="1000 bytes"', response['Server-Timing'])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics(self):
+        self.client.get('/')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(
+            response, 'protok_request_duration_seconds_count{view="index",method="GET"} 1'
+        )
+        self.assertContains(
+            response, 'protok_template_render_seconds_bucket{template="calc/form.html",le="+Inf"} 1'
+        )
+
+
+class PriceListTests(TestCase):
+    TRANSFORMERS = (
+        'name;manufacturer;price;documentation;transformer_type;connection_scheme;power;voltage;count\n'
+        'ТМГ-100;Завод;100000;documentation/t.pdf;ТМГ;Д/У;100;10;1\n'
+        'ТМГ-160;Завод;150000;documentation/t.pdf;Масляный;Д/У;160;10;1\n'
+        'ТМГ-1000;Завод;900000;documentation/t.pdf;ТМГ;Д/У;1000;10;1\n'
+        'ТМГ-250;Завод;-1;documentation/t.pdf;ТМГ;Д/У;250;10;1\n'
+    )
+
+    def import_csv(self, model, text):
+        file = io.BytesIO(text.encode())
+        return pricelists.import_file(model, file, 'price.csv', batch_size=2)
+
+    def test_transformers_upsert(self):
+        result = self.import_csv(Transformer, self.TRANSFORMERS)
+        self.assertEqual(result.imported, 2)
+        self.assertEqual([number for number, message in result.errors], [4, 5])
+        self.assertEqual(Transformer.objects.get(name='ТМГ-160').transformer_type, 'ТМ')
+
+        result = self.import_csv(Transformer, self.TRANSFORMERS.replace('150000', '155000'))
+        self.assertEqual(Transformer.objects.count(), 2)
+        self.assertEqual(Transformer.objects.get(name='ТМГ-160').price, 155000)
+
+    def test_missing_columns(self):
+        with self.assertRaises(pricelists.PriceListError):
+            self.import_csv(Transformer, 'name;price\nТМГ-100;100000\n')
+
+    def test_sections_replace(self):
+        lv_device = LowVoltageDevice.objects.create(
+            name='РУНН-1', manufacturer='Завод', price=1000, voltage=400,
+            documentation='documentation/lv.pdf',
+        )
+        fider = Fiders.objects.create(name='Ф-1', manufacturer='Завод', price=10,
+                                      amperage=100, documentation='documentation/f.pdf')
+        Section.objects.create(lv_device=lv_device, fider=fider, denomination=16, count=1)
+        result = self.import_csv(Section, (
+            'lv_device_manufacturer,lv_device_name,fider_manufacturer,fider_name,denomination,count\n'
+            'Завод,РУНН-1,Завод,Ф-1,25,2\n'
+            'Завод,РУНН-1,Завод,Ф-1,40,3\n'
+            'Завод,РУНН-1,,,63,4\n'
+            'Завод,РУНН-2,Завод,Ф-1,63,4\n'
+        ))
+        self.assertEqual(result.imported, 3)
+        self.assertEqual([number for number, message in result.errors], [5])
+        self.assertEqual(
+            sorted(lv_device.section_set.values_list('denomination', flat=True)), [25, 40, 63]
+        )
+
+    def test_orders_refreshed_once_by_product_key(self):
+        self.import_csv(Transformer, self.TRANSFORMERS)
+        other = Transformer.objects.create(
+            name='ТМГ-100', manufacturer='Другой завод', price=50000, power=100, voltage=10,
+            count=1, documentation='documentation/t.pdf',
+        )
+        client = Client.objects.create(full_name='Клиент', organization='ООО', email='c@example.com',
+                                       phone_number='+79131234567')
+        orders = {
+            transformer.manufacturer: Order.objects.create(
+                client=client, transformer=transformer, documentation='orders/o.pdf'
+            )
+            for transformer in (Transformer.objects.get(manufacturer='Завод', name='ТМГ-100'),
+                                other)
+        }
+        # Снимок, расходящийся с каталогом, показывает, какие заказы обновлены
+        Order.objects.update(transformer_price=1)
+        with mock.patch.object(OrderQuerySet, 'refresh_prices', autospec=True,
+                               side_effect=OrderQuerySet.refresh_prices) as refresh:
+            self.import_csv(Transformer, self.TRANSFORMERS.replace('100000', '110000'))
+        refresh.assert_called_once()
+        orders['Завод'].refresh_from_db()
+        orders['Другой завод'].refresh_from_db()
+        self.assertEqual(orders['Завод'].transformer_price, 110000)
+        self.assertEqual(orders['Другой завод'].transformer_price, 1)
+
+    def test_plain_price_list(self):
+        self.import_csv(Transformer, self.TRANSFORMERS)
+        # Без колонок нового товара обновляются только имеющиеся
+        result = self.import_csv(Transformer, (
+            'manufacturer;name;price\n'
+            'Завод;ТМГ-100;120000\n'
+            'Завод;ТМГ-400;300000\n'
+        ))
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([number for number, message in result.errors], [3])
+        self.assertEqual(Transformer.objects.count(), 2)
+        transformer = Transformer.objects.get(name='ТМГ-100')
+        self.assertEqual(transformer.price, 120000)
+        self.assertEqual(transformer.power, 100)
+        self.assertEqual(transformer.documentation.name, 'documentation/t.pdf')
+
+    def test_export_roundtrip(self):
+        self.import_csv(Transformer, self.TRANSFORMERS)
+        exported = b''.join(pricelists.stream_csv(Transformer)).decode('utf-8-sig')
+        Transformer.objects.all().delete()
+        result = self.import_csv(Transformer, exported)
+        self.assertEqual((result.imported, result.errors), (2, []))
+
+
+class OfferTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.offer_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(OFFER_ROOT=cls.offer_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.offer_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=2, orders=1)
+        cls.order = Order.objects.get()
+
+    def setUp(self):
+        shutil.rmtree(os.path.join(self.offer_root, str(self.order.pk)), ignore_errors=True)
+        offers._failures.clear()
+
+    def wait(self):
+        future = offers._pending.get(self.order.pk)
+        if future is not None:
+            future.exception(timeout=30)
+            # Обработчик завершения выполняется уже после пробуждения ожидающих
+            while offers._pending.get(self.order.pk) is future:
+                time.sleep(0.01)
+
+    def fetch(self):
+        response = self.client.get(f'/results/{self.order.pk}/offer.pdf')
+        if response.status_code == 202:
+            self.wait()
+        return response
+
+    def test_rendered_in_background_and_reused(self):
+        self.assertEqual(self.fetch().status_code, 202)
+        response = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
+        response = self.client.get(f'/results/{self.order.pk}/offer.pdf',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_prepared_in_advance(self):
+        with mock.patch.object(offers, '_submit') as submit:
+            with override_settings(OFFER_PREPARE=False):
+                self.assertIsNone(offers.prepare(self.order.pk))
+            submit.assert_not_called()
+            offers.prepare(self.order.pk)
+        submit.assert_called_once_with(self.order.pk, None, offers._prepare, self.order.pk)
+
+    def test_regenerated_after_price_change(self):
+        self.fetch()
+        first = set(os.listdir(os.path.join(self.offer_root, str(self.order.pk))))
+        transformer = self.order.transformer
+        transformer.price = 1
+        transformer.save()
+        self.assertEqual(self.fetch().status_code, 202)
+        self.assertEqual(self.fetch().status_code, 200)
+        second = set(os.listdir(os.path.join(self.offer_root, str(self.order.pk))))
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first, second)
+
+    def test_failure_logged_and_not_rescheduled(self):
+        with mock.patch.object(offers, 'render_offer', side_effect=RuntimeError('нет шрифта')), \
+                self.assertLogs('calc.offers', 'ERROR') as logs:
+            self.assertEqual(self.fetch().status_code, 202)
+            self.assertIn('RuntimeError: нет шрифта', logs.output[0])
+            with mock.patch.object(offers, 'schedule') as schedule:
+                response = self.client.get(f'/results/{self.order.pk}/offer.pdf')
+            self.assertEqual(response.status_code, 500)
+            schedule.assert_not_called()
+        # По истечении паузы отрисовка ставится снова
+        with override_settings(OFFER_RETRY_SECONDS=0):
+            self.assertEqual(self.fetch().status_code, 202)
+        self.assertEqual(self.fetch().status_code, 200)
+
+
+class DocumentationBundleTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.bundle_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root,
+                                                DOCUMENTATION_BUNDLE_ROOT=cls.bundle_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        shutil.rmtree(cls.bundle_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=2, orders=1)
+        cls.order = Order.objects.get()
+        cls.contents = {}
+        for folder, document in cls.order.documentation_files():
+            path = os.path.join(cls.media_root, document.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            content = f'{document.name}\n'.encode() * 1000
+            with open(path, 'wb') as file:
+                file.write(content)
+            cls.contents[document.name] = content
+
+    def fetch(self, **headers):
+        return self.client.get(f'/results/{self.order.pk}/documentation.zip', headers=headers)
+
+    def test_archive_cached_and_not_modified(self):
+        first = self.fetch()
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.streaming)
+        data = b''.join(first.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            members = {name: archive.read(name) for name in archive.namelist()}
+        expected = [arcname for arcname, _, _ in bundles.bundle_entries(self.order)]
+        self.assertEqual(sorted(members), sorted(expected))
+        self.assertEqual(len(expected), len(set(expected)))
+        for arcname, document, _ in bundles.bundle_entries(self.order):
+            self.assertEqual(members[arcname], self.contents[document.name])
+        self.assertEqual(os.listdir(self.bundle_root), [first['ETag'].strip('"') + '.zip'])
+
+        # Повторная выдача отдает сохраненный архив с тем же содержимым
+        second = self.fetch()
+        self.assertEqual(second.status_code, 200)
+        self.assertIsInstance(second, FileResponse)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(b''.join(second.streaming_content), data)
+
+        response = self.fetch(if_none_match=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(UPLOAD_MAX_CHUNK_SIZE=1024, OFFER_PREPARE=False)
+class UploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.upload_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root,
+                                                UPLOAD_BUFFER_ROOT=cls.upload_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        shutil.rmtree(cls.upload_root, ignore_errors=True)
+
+    data = bytes(range(256)) * 6
+
+    def start(self, sha256=''):
+        response = self.client.post('/uploads/', {'filename': 'drawings.pdf',
+                                                  'size': len(self.data), 'sha256': sha256})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, offset, chunk, digest=None):
+        digest = digest or hashlib.sha256(chunk).hexdigest()
+        return self.client.put(f'/uploads/{upload_id}/', chunk,
+                               content_type='application/octet-stream',
+                               headers={'Upload-Offset': str(offset), 'X-Chunk-SHA256': digest})
+
+    def upload(self, **kwargs):
+        upload_id = self.start(**kwargs)
+        self.assertEqual(self.put(upload_id, 0, self.data[:1024]).status_code, 200)
+        response = self.put(upload_id, 1024, self.data[1024:])
+        return upload_id, response
+
+    def test_offset_mismatch(self):
+        upload_id = self.start()
+        response = self.put(upload_id, 10, self.data[10:20])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_chunk_checksum(self):
+        upload_id = self.start()
+        response = self.put(upload_id, 0, self.data[:100], digest='0' * 64)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertEqual(os.path.getsize(os.path.join(self.upload_root, f'{upload_id}.part')), 0)
+
+    def test_chunk_too_large(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, self.data[:1025]).status_code, 413)
+
+    def test_resume(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, self.data[:500]).json()['offset'], 500)
+        # После обрыва клиент узнает смещение и продолжает с него
+        state = self.client.get(f'/uploads/{upload_id}/').json()
+        self.assertEqual((state['offset'], state['completed']), (500, False))
+        self.assertEqual(self.put(upload_id, 0, self.data[:500]).status_code, 409)
+        self.put(upload_id, 500, self.data[500:1500])
+        state = self.put(upload_id, 1500, self.data[1500:]).json()
+        self.assertEqual((state['offset'], state['completed']), (len(self.data), True))
+        with open(os.path.join(self.upload_root, f'{upload_id}.part'), 'rb') as buffer:
+            self.assertEqual(buffer.read(), self.data)
+
+    def test_file_checksum(self):
+        upload_id, response = self.upload(sha256='0' * 64)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual((response.json()['offset'], response.json()['completed']), (0, False))
+        upload_id, response = self.upload(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertTrue(response.json()['completed'])
+
+    def submit(self, upload_id):
+        form = dict(benchmark._order_form(), documentation='', upload=upload_id)
+        return self.client.post('/get_contact/', form)
+
+    def test_attach(self):
+        upload_id, _ = self.upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.submit(upload_id)
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get()
+        with order.documentation.open('rb') as document:
+            self.assertEqual(document.read(), self.data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(self.upload_root), [])
+
+    def test_attach_rolled_back(self):
+        upload_id, _ = self.upload()
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch.object(outbox, 'enqueue_order_email', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.submit(upload_id)
+        self.assertFalse(Order.objects.exists())
+        # Загрузка осталась и годится для повторной отправки
+        self.assertTrue(UploadSession.objects.filter(pk=upload_id, completed=True).exists())
+        self.assertTrue(os.path.exists(os.path.join(self.upload_root, f'{upload_id}.part')))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.submit(upload_id).status_code, 302)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class RejectingBackend(locmem.EmailBackend):
+    """Почтовый сервер, отклоняющий письма на адреса из rejected"""
+
+    rejected = set()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.rejected:
+                raise ConnectionResetError('соединение разорвано')
+        return super().send_messages(messages)
+
+
+class UnavailableBackend(locmem.EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('сервер недоступен')
+
+
+@override_settings(OUTBOX_RETRY_DELAY=60, OUTBOX_MAX_RETRY_DELAY=3600, OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def enqueue(self, *recipients):
+        return [OutgoingEmail.objects.create(subject='Тема', body='Текст', recipient=recipient,
+                                             attach_documentation=False)
+                for recipient in recipients]
+
+    def test_sent(self):
+        email, = self.enqueue('a@example.com')
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com']])
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.Statuses.SENT, 1))
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    def test_retry_with_backoff_then_failed(self):
+        bad, good = self.enqueue('bad@example.com', 'good@example.com')
+        backend = RejectingBackend()
+        with mock.patch.object(RejectingBackend, 'rejected', {'bad@example.com'}):
+            for attempt, delay in [(1, 60), (2, 120)]:
+                before = timezone.now()
+                self.assertEqual(outbox.drain(connection=backend), (int(attempt == 1), 1))
+                bad.refresh_from_db()
+                self.assertEqual((bad.status, bad.attempts), (OutgoingEmail.Statuses.PENDING,
+                                                              attempt))
+                self.assertIn('ConnectionResetError', bad.last_error)
+                self.assertGreaterEqual(bad.next_attempt, before + datetime.timedelta(seconds=delay))
+                # До конца паузы письмо не отправляется
+                self.assertEqual(outbox.drain(connection=backend), (0, 0))
+                OutgoingEmail.objects.filter(pk=bad.pk).update(next_attempt=timezone.now())
+            self.assertEqual(outbox.drain(connection=backend), (0, 1))
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutgoingEmail.Statuses.FAILED, 3))
+        self.assertEqual([message.to for message in mail.outbox], [['good@example.com']])
+        OutgoingEmail.objects.filter(pk=bad.pk).update(next_attempt=timezone.now())
+        self.assertEqual(outbox.drain(connection=backend), (0, 0))
+
+    def test_server_unavailable(self):
+        emails = self.enqueue('a@example.com', 'b@example.com')
+        self.assertEqual(outbox.drain(connection=UnavailableBackend()), (0, 2))
+        for email in emails:
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutgoingEmail.Statuses.PENDING, 1))
+            self.assertIn('ConnectionRefusedError', email.last_error)
+            self.assertGreater(email.next_attempt, timezone.now())
+        self.assertEqual(mail.outbox, [])
+
+    def test_rest_of_batch_released_when_reconnect_fails(self):
+        bad, rest = self.enqueue('bad@example.com', 'rest@example.com')
+        backend = RejectingBackend()
+        with mock.patch.object(RejectingBackend, 'rejected', {'bad@example.com'}), \
+                mock.patch.object(backend, 'open', side_effect=[None, OSError('нет сети')]):
+            self.assertEqual(outbox.drain(connection=backend), (0, 1))
+        bad.refresh_from_db()
+        rest.refresh_from_db()
+        self.assertEqual(bad.attempts, 1)
+        self.assertEqual((rest.attempts, rest.last_error), (0, ''))
+        self.assertLessEqual(rest.next_attempt, timezone.now())
+        self.assertEqual(outbox.drain(), (1, 0))
+
+    def test_loop_survives_errors(self):
+        self.enqueue('a@example.com')
+        with mock.patch.object(outbox, 'drain', side_effect=[OSError('нет базы'), (1, 0), (0, 0),
+                                                             KeyboardInterrupt]), \
+                mock.patch('time.sleep') as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('send_outbox', '--loop', stdout=io.StringIO(),
+                             stderr=io.StringIO())
+        self.assertEqual(sleep.call_count, 2)
+
+
+class PriceSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=3, orders=0)
+        cls.transformer = Transformer.objects.first()
+        cls.lv_device = LowVoltageDevice.objects.first()
+        cls.client_ = Client.objects.first()
+
+    def create_order(self, **kwargs):
+        return Order.objects.create(client=self.client_, transformer=self.transformer,
+                                    lv_device=self.lv_device, documentation='orders/o.pdf',
+                                    **kwargs)
+
+    def expected_total(self):
+        sections = sum(section.price for section in self.lv_device.section_set.all())
+        return self.transformer.price + self.lv_device.price + sections
+
+    def test_snapshot_on_create(self):
+        order = self.create_order()
+        self.assertEqual(order.transformer_price, self.transformer.price)
+        self.assertEqual(order.sections.count(), self.lv_device.section_set.count())
+        self.assertAlmostEqual(order.total_price, self.expected_total())
+
+    def test_snapshot_when_created_confirmed(self):
+        order = self.create_order(confirmed=True)
+        order.refresh_from_db()
+        self.assertTrue(order.confirmed)
+        self.assertEqual(order.transformer_price, self.transformer.price)
+        self.assertEqual(order.sections.count(), self.lv_device.section_set.count())
+        self.assertAlmostEqual(order.total_price, self.expected_total())
+        total = SalesSummary.objects.get(dimension=SalesSummary.Dimensions.TOTAL)
+        self.assertEqual(total.volume, 1)
+        self.assertAlmostEqual(total.revenue, self.expected_total())
+
+    def test_confirm_with_new_component(self):
+        # Так сохраняет заказ форма администратора
+        order = self.create_order()
+        self.transformer = Transformer.objects.exclude(pk=self.transformer.pk).first()
+        order.transformer = self.transformer
+        order.confirmed = True
+        order.save()
+        order.refresh_from_db()
+        self.assertTrue(order.confirmed)
+        self.assertEqual(order.transformer_price, self.transformer.price)
+        self.assertAlmostEqual(order.total_price, self.expected_total())
+        total = SalesSummary.objects.get(dimension=SalesSummary.Dimensions.TOTAL)
+        self.assertAlmostEqual(total.revenue, self.expected_total())
+
+    def test_price_change_updates_open_orders_only(self):
+        open_order = self.create_order()
+        confirmed = self.create_order()
+        confirmed.confirmed = True
+        confirmed.save()
+        old_total = confirmed.total_price
+
+        self.transformer.price += 1000
+        self.transformer.save()
+        open_order.refresh_from_db()
+        confirmed.refresh_from_db()
+        self.assertEqual(open_order.transformer_price, self.transformer.price)
+        self.assertAlmostEqual(open_order.total_price, self.expected_total())
+        self.assertEqual(confirmed.total_price, old_total)
+
+    def test_fider_and_section_changes(self):
+        order = self.create_order()
+        section = self.lv_device.section_set.select_related('fider').first()
+        section.fider.price += 100
+        section.fider.save()
+        order.refresh_from_db()
+        self.assertAlmostEqual(order.total_price, self.expected_total())
+
+        Section.objects.create(lv_device=self.lv_device, fider=section.fider,
+                               denomination=10, count=2)
+        order.refresh_from_db()
+        self.assertEqual(order.sections.count(), self.lv_device.section_set.count())
+        self.assertAlmostEqual(order.total_price, self.expected_total())
+
+    def test_component_deleted(self):
+        order = self.create_order()
+        self.lv_device.delete()
+        order.refresh_from_db()
+        self.assertEqual((order.lv_device_price, order.sections_price), (0, 0))
+        self.assertEqual(order.total_price, self.transformer.price)
+        self.assertFalse(order.sections.exists())
+
+
+@override_settings(OFFER_PREPARE=False)
+class AsyncViewTests(TestCase):
+    """Асинхронные представления не должны обращаться к ORM синхронно"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    async def test_order_submission(self):
+        response = await self.async_client.get('/contacts/')
+        self.assertEqual(response.status_code, 200)
+        form = dict(benchmark._order_form(), full_name='Асинхронный клиент')
+        response = await self.async_client.post('/get_contact/', form)
+        self.assertEqual(response.status_code, 302)
+        order = await Order.objects.select_related('client').aget(
+            client__full_name='Асинхронный клиент'
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, order.documentation.name)))
+        response = await self.async_client.get(response['Location'])
+        self.assertContains(response, 'Асинхронный клиент')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'calc_test_cache',
+    }})
+    def test_results_with_database_cache(self):
+        # Кеш в базе данных из асинхронного кода доступен только через aget
+        call_command('createcachetable', verbosity=0)
+        seeding.seed(products=2, orders=1)
+        order = Order.objects.get()
+        for _ in range(2):
+            response = self.client.get(f'/results/{order.pk}/')
+            self.assertContains(response, order.client.full_name)
+
+
+class AdminChangeListTests(TestCase):
+    """Списки админки листаются по ключу и не считают всю таблицу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=10, orders=120)
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def page(self, query='', model='order'):
+        response = self.client.get(f'/admin/calc/{model}/' + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_keyset_pages(self):
+        pks = list(Order.objects.order_by('-pk').values_list('pk', flat=True))
+        first = self.page()
+        self.assertTrue(first.keyset)
+        self.assertEqual([order.pk for order in first.result_list], pks[:50])
+        self.assertEqual(first.result_count, len(pks))
+        second = self.page(first.next_url)
+        self.assertEqual([order.pk for order in second.result_list], pks[50:100])
+        self.assertTrue(second.has_previous)
+        back = self.page(second.previous_url)
+        self.assertEqual([order.pk for order in back.result_list], pks[:50])
+        last = self.page(self.page(second.next_url).first_url)
+        self.assertEqual(last.result_list, first.result_list)
+
+    def test_keyset_by_date(self):
+        expected = list(Order.objects.order_by('create_date', 'pk').values_list('pk', flat=True))
+        index = list(self.page().list_display).index('create_date')
+        first = self.page(f'?o={index}')
+        second = self.page(first.next_url)
+        self.assertEqual([order.pk for order in first.result_list + second.result_list],
+                         expected[:100])
+
+    def test_search(self):
+        order = Order.objects.select_related('client').first()
+        self.assertEqual(self.page(f'?q={order.pk}').result_list, [order])
+        found = self.page('?q=' + order.client.organization).result_list
+        self.assertIn(order, found)
+        self.assertTrue(all(item.client.organization.startswith(order.client.organization)
+                            for item in found))
+        # Регистр не важен: поиск идет по organization_key
+        order.client.organization = 'Acme Energy'
+        order.client.save()
+        self.assertEqual({item.pk for item in self.page('?q=ACME en').result_list},
+                         set(order.client.order_set.values_list('pk', flat=True)))
+        self.assertEqual(self.page('?q=energy').result_list, [])
+        # Клиенты ищутся по началу наименования или e-mail
+        self.assertEqual(list(self.page('?q=acme', 'client').result_list), [order.client])
+        self.assertEqual(list(self.page(f'?q={order.client.email.upper()}', 'client').result_list),
+                         [order.client])
+
+    @mock.patch.object(changelist, 'COUNT_LIMIT', 100)
+    def test_estimated_count(self):
+        cl = self.page()
+        self.assertEqual(cl.paginator.count_display(), f'около {Order.objects.latest("pk").pk}')
+        cl = self.page('?confirmed__exact=0')
+        self.assertEqual(cl.paginator.count_display(), 'более 100')
+
+    def test_autocomplete(self):
+        transformer = Transformer.objects.first()
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'calc', 'model_name': 'order', 'field_name': 'transformer',
+            'term': transformer.name,
+        })
+        self.assertIn(str(transformer.pk), [item['id'] for item in response.json()['results']])
+
+
+class AssetTests(TestCase):
+    """Сборка статики build_assets и ее отдача"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(
+            STATIC_ROOT=os.path.join(cls.root, 'static'),
+            ASSET_BUILD_ROOT=os.path.join(cls.root, 'build'),
+        ))
+        super().setUpClass()
+        call_command('build_assets', stdout=io.StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        assets.available.cache_clear()
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def setUp(self):
+        assets.available.cache_clear()
+
+    def test_hashed_variants(self):
+        webp = staticfiles_storage.stored_name('calc/вопрос.300w.webp')
+        self.assertRegex(webp, r'^calc/вопрос\.300w\.[0-9a-f]{12}\.webp$')
+        response = self.client.get('/')
+        self.assertContains(response, f'/static/{webp} 300w')
+        self.assertContains(response, "type('image/webp')")
+
+    def test_precompressed(self):
+        name = staticfiles_storage.stored_name('admin/css/base.css')
+        response = self.client.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(content, staticfiles_storage.open(name).read())
+
+    def test_unhashed_and_missing(self):
+        response = self.client.get('/static/admin/css/base.css')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_vendor_fallback(self):
+        html = Template("{% load calc_extras %}{% vendor_asset 'bootstrap.min.css' %}").render(
+            Context()
+        )
+        if assets.available(assets.vendor_path('bootstrap.min.css')):
+            self.assertIn('/static/calc/vendor/bootstrap.min.', html)
+        else:
+            self.assertIn(assets.VENDOR['bootstrap.min.css'][1], html)
+
+
+class SearchTests(TestCase):
+    """Нечеткий поиск по каталогу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=30, orders=1)
+        cls.transformer = Transformer.objects.create(
+            name='ТМГ-400/10', manufacturer='Электрощит', price=1,
+            documentation='documentation/transformers/t.pdf', power=400, voltage=10, count=1,
+        )
+
+    def setUp(self):
+        # Откат транзакции теста не доходит до индекса
+        search.products.invalidate()
+
+    def test_normalize(self):
+        self.assertEqual(search.normalize('ТМГ-400'), 'tmg 400')
+        self.assertEqual(search.normalize('TMG400'), 'tmg 400')
+        self.assertEqual(search.trigrams('ТМГ 400'), search.trigrams('tmg-400'))
+
+    def test_typos_and_latin(self):
+        for query in ('TMG 400', 'тмг400', 'Електрощит', 'elektroshchit'):
+            found = search.products.search(query, limit=5)
+            self.assertEqual(found[0].entry.pk, self.transformer.pk, query)
+        self.assertEqual(search.products.search('ТМГ-400/10 Электрощит')[0].score, 1)
+        self.assertEqual(search.products.search('TMG 400', models=[Fiders]), [])
+
+    def test_incremental_update(self):
+        search.products.search('TMG')
+        self.transformer.name = 'ТСЗ-630'
+        self.transformer.save()
+        with self.assertNumQueries(0):
+            found = search.products.search('TSZ 630', models=[Transformer])
+        self.assertEqual(found[0].entry.name, 'ТСЗ-630')
+        self.assertNotIn(self.transformer.pk, [match.entry.pk for match in
+                                               search.products.search('Электрощит ТМГ-400/10')
+                                               if match.score == 1])
+        with mock.patch.object(search, 'MERGE_LIMIT', 0):
+            Fiders.objects.first().save()
+        self.assertEqual(search.products.search('TSZ 630')[0].entry.pk, self.transformer.pk)
+        self.transformer.delete()
+        with self.assertNumQueries(0):
+            found = search.products.search('TSZ 630', models=[Transformer])
+        self.assertNotIn(self.transformer.pk, [match.entry.pk for match in found])
+
+    def test_endpoint(self):
+        response = self.client.get('/api/search/', {'q': 'tmg 400', 'category': 'transformer'})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['results'][0]
+        self.assertEqual((result['id'], result['name']), (self.transformer.pk, 'ТМГ-400/10'))
+        response = self.client.get('/api/search/', {'q': 'tmg 400'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/search/', {'category': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/').json(), {'results': []})
+
+    def test_admin(self):
+        self.client.force_login(
+            get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        )
+        response = self.client.get('/admin/calc/transformer/', {'q': 'тмг 400 електрощит'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.transformer])
+
+
+class ResultPageCacheTests(TestCase):
+    """Страница заказа берется из кеша и сбрасывается при изменениях"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=2, orders=1)
+        cls.order = Order.objects.select_related('client').get()
+
+    def get(self):
+        response = self.client.get(f'/results/{self.order.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_cached(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.assertContains(self.get(), self.order.client.full_name)
+
+    def test_order_and_client_changes(self):
+        self.get()
+        client = self.order.client
+        client.full_name = 'Новое имя'
+        client.save()
+        self.assertContains(self.get(), 'Новое имя')
+        self.order.transformer = Transformer.objects.exclude(pk=self.order.transformer_id).first()
+        self.order.save()
+        self.assertContains(self.get(), formats.localize(self.order.total_price))
+        self.order.delete()
+        self.assertEqual(self.client.get(f'/results/{self.order.pk}/').status_code, 404)
+
+    def test_catalog_changes(self):
+        self.get()
+        transformer = self.order.transformer
+        transformer.price += 1000
+        transformer.save()
+        self.order.refresh_from_db()
+        self.assertContains(self.get(), formats.localize(self.order.total_price))
+        self.order.confirmed = True
+        self.order.save()
+        self.get()
+        transformer.save()
+        with self.assertNumQueries(0):
+            self.get()
+
+
+@override_settings(OFFER_PREPARE=False)
+class ClientHistoryTests(TestCase):
+    """Повторные заказы клиента и история его заказов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=2, orders=0)
+        cls.staff = get_user_model().objects.create_user('staff', is_staff=True)
+
+    def test_resolve(self):
+        first = ClientForm({'full_name': 'Иванов', 'organization': 'ООО «А»',
+                            'email': 'Ivanov@Example.com', 'phone_number': '+7 913 123-45-67'})
+        self.assertTrue(first.is_valid(), first.errors)
+        client = first.save()
+        again = ClientForm({'full_name': 'Иванов И. И.', 'organization': 'ООО «А»',
+                            'email': 'ivanov@example.com ', 'phone_number': '+79131234567'})
+        self.assertTrue(again.is_valid(), again.errors)
+        # Данные найденного клиента не перезаписываются
+        with self.assertNumQueries(1):
+            self.assertEqual(again.save(), client)
+        client.refresh_from_db()
+        self.assertEqual((client.full_name, client.email), ('Иванов', 'Ivanov@Example.com'))
+        other = Client.objects.resolve('ivanov@example.com', '+79137654321',
+                                       full_name='Иванов', organization='ООО «Б»')
+        self.assertNotEqual(other, client)
+
+    def test_submit_keeps_known_client(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        client = Client.objects.first()
+        known = (client.full_name, client.organization)
+        form = dict(benchmark._order_form(), full_name='Петров', organization='ООО «Чужое»',
+                    email=client.email.upper(), phone_number=str(client.phone_number))
+        response = self.client.post('/get_contact/', form)
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get()
+        self.assertEqual(order.client, client)
+        client.refresh_from_db()
+        self.assertEqual((client.full_name, client.organization), known)
+        self.assertEqual((order.full_name, order.organization), ('Петров', 'ООО «Чужое»'))
+        self.assertContains(self.client.get(response['Location']), 'Имя заказчика: Петров')
+        self.assertEqual(offers.offer_content(order)['client']['organization'], 'ООО «Чужое»')
+
+    def test_history_pages(self):
+        client = Client.objects.first()
+        Order.objects.bulk_create(Order(client=client, documentation='orders/o.pdf')
+                                  for _ in range(7))
+        Order.objects.filter(client=client, pk__lt=Order.objects.latest('pk').pk - 2).update(
+            create_date=datetime.date(2020, 1, 1)
+        )
+        expected = list(Order.objects.filter(client=client).order_by(
+            '-create_date', '-id').values_list('pk', flat=True))
+        self.client.force_login(self.staff)
+        url, pages = f'/api/clients/{client.pk}/orders/?limit=3', []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([order['id'] for order in data['orders']])
+            url = data['next']
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(data['client']['email'], client.email)
+        self.assertIn('total_price', data['orders'][0])
+
+    def test_history_access(self):
+        url = f'/api/clients/{Client.objects.first().pk}/orders/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/clients/0/orders/').status_code, 404)
+
+
+class SalesSummaryTests(TestCase):
+    """Сводка продаж обновляется при изменении заказов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=5, orders=30)
+
+    def summary(self):
+        return {(row.dimension, row.month, row.key): (row.volume, round(row.revenue, 2))
+                for row in SalesSummary.objects.filter(volume__gt=0)}
+
+    def rebuilt(self):
+        return {row: (volume, round(revenue, 2))
+                for row, (volume, revenue) in reports.aggregate().items() if volume}
+
+    def test_incremental_matches_rebuild(self):
+        orders = list(Order.objects.order_by('pk')[:10])
+        for order in orders:
+            order.confirmed = True
+            order.save()
+        self.assertEqual(self.summary(), self.rebuilt())
+        total = SalesSummary.objects.get(dimension='total')
+        self.assertEqual(total.volume, 10)
+        orders[0].transformer = Transformer.objects.exclude(pk=orders[0].transformer_id).first()
+        orders[0].save()
+        orders[1].confirmed = False
+        orders[1].save()
+        orders[2].delete()
+        self.assertEqual(self.summary(), self.rebuilt())
+        self.assertEqual(SalesSummary.objects.get(dimension='total').volume, 8)
+
+    def test_confirm_with_new_component(self):
+        order = Order.objects.order_by('pk').first()
+        transformer = Transformer.objects.exclude(power=order.transformer.power).first()
+        order.transformer = transformer
+        order.confirmed = True
+        order.save()
+        order.refresh_from_db()
+        self.assertEqual(order.transformer_power, transformer.power)
+        self.assertEqual(order.transformer_manufacturer, transformer.manufacturer)
+        self.assertEqual(SalesSummary.objects.get(dimension='power').key, str(transformer.power))
+        self.assertEqual(self.summary(), self.rebuilt())
+
+    def test_catalog_changes_after_confirmation(self):
+        order = Order.objects.filter(sections__fider__isnull=False).first()
+        order.confirmed = True
+        order.save()
+        confirmed = self.summary()
+        transformer = order.transformer
+        transformer.power += 1
+        transformer.manufacturer = 'Другой завод'
+        transformer.save()
+        substation = order.substation
+        substation.type_station = next(
+            value for value in ComlexTransformerSubstation.ComlexTransformerSubstationType.values
+            if value != substation.type_station
+        )
+        substation.save()
+        fider = order.sections.exclude(fider=None).first().fider
+        fider.manufacturer = 'Другой завод'
+        fider.save()
+        order.refresh_from_db()
+        order.comment = 'После смены каталога'
+        order.save()
+        self.assertEqual(self.summary(), confirmed)
+        self.assertEqual(self.rebuilt(), confirmed)
+        # Удаление оборудования (SET_NULL) тоже не меняет вклад
+        transformer.delete()
+        fider.delete()
+        self.assertEqual(self.rebuilt(), confirmed)
+        order.refresh_from_db()
+        order.confirmed = False
+        order.save()
+        self.assertEqual(self.summary(), {})
+
+    def test_open_orders_skip_summary(self):
+        order = Order.objects.first()
+        with self.assertNumQueries(1):
+            order.comment = 'Без подтверждения'
+            order.save(update_fields=['comment'])
+        self.assertFalse(SalesSummary.objects.exists())
+
+    def test_rebuild_command_and_report(self):
+        confirmed = Order.objects.filter(pk__in=Order.objects.order_by('pk')[:5].values('pk'))
+        confirmed.update(confirmed=True)
+        confirmed.take_dimensions()
+        out = io.StringIO()
+        call_command('rebuild_sales_summary', stdout=out)
+        self.assertEqual(self.summary(), self.rebuilt())
+        staff = get_user_model().objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        month = Order.objects.first().create_date.strftime('%Y-%m')
+        data = self.client.get('/api/reports/sales/',
+                               {'dimension': 'type_station', 'since': month}).json()
+        self.assertEqual(sum(row['volume'] for row in data['rows']), 5)
+        self.assertTrue(all(row['label'].startswith('КТП') for row in data['rows']))
+        revenue = sum(row['revenue'] for row in self.client.get(
+            '/api/reports/sales/', {'dimension': 'manufacturer'}).json()['rows'])
+        self.assertAlmostEqual(revenue, sum(Order.objects.filter(confirmed=True).values_list(
+            'total_price', flat=True)), places=2)
+        self.assertEqual(self.client.get('/api/reports/sales/', {'since': '2026'}).status_code,
+                         400)
+
+
+class SizingTests(TestCase):
+    """Подбор трансформатора, устройства НН и фидеров по нагрузке секций"""
+
+    @classmethod
+    def setUpTestData(cls):
+        def transformer(name, power, price, count=1):
+            return Transformer.objects.create(
+                name=name, manufacturer='Завод', price=price, power=power, voltage=10,
+                count=count, documentation='documentation/transformers/t.pdf',
+            )
+
+        def fider(name, amperage, price):
+            return Fiders.objects.create(name=name, manufacturer='Завод', price=price,
+                                         amperage=amperage, documentation='documentation/f.pdf')
+
+        cls.t100 = transformer('ТМГ-100', 100, 10)
+        transformer('ТМГ-250', 250, 20)
+        cls.t250 = transformer('ТМГ-250 эконом', 250, 15)
+        transformer('2ТМГ-160', 160, 30, count=2)
+        cls.t400 = transformer('ТМГ-400', 400, 40)
+        cls.lv = {
+            denomination: LowVoltageDevice.objects.create(
+                name=f'РУНН-{denomination}', manufacturer='Завод', price=denomination,
+                voltage=400, input_denomination=denomination,
+                documentation='documentation/ll_devices/lv.pdf',
+            )
+            for denomination in (250, 400, 630)
+        }
+        cls.f25 = fider('Фидер-25', 25, 100)
+        fider('Фидер-63', 63, 300)
+        cls.f63 = fider('Фидер-63 эконом', 63, 200)
+        cls.f100 = fider('Фидер-100', 100, 400)
+
+    def test_size(self):
+        result = sizing.size([(63, 2), (25, 4)])
+        self.assertEqual(result.load.current, 226)
+        self.assertAlmostEqual(result.load.power, 3 ** 0.5 * 400 * 226 / 1000)
+        self.assertEqual(result.transformer, self.t250.pk)
+        self.assertEqual(result.lv_device, self.lv[250].pk)
+        self.assertEqual(result.fiders, [self.f63.pk, self.f25.pk])
+        # 500 А - 346 кВА: двух трансформаторов по 160 кВА уже не хватает
+        result = sizing.size([(100, 5), (250, 0)])
+        self.assertEqual(result.transformer, self.t400.pk)
+        self.assertEqual(result.lv_device, self.lv[630].pk)
+        self.assertEqual(result.fiders, [self.f100.pk, None])
+        self.assertIsNone(sizing.size([(100, 10)]).transformer)
+        self.assertIsNone(sizing.size([(16, 1)], voltage=230).lv_device)
+        result = sizing.size([(16, 1)], requirements={'transformer': {'power__gte': 250}})
+        self.assertEqual(result.transformer, self.t250.pk)
+        with self.assertRaises(ValueError):
+            sizing.size([(16, 1)], requirements={'substation': {}})
+
+    @override_settings(SIZING_LOAD_FACTOR=0.5)
+    def test_load_factor(self):
+        # 157 кВА при загрузке 50% - два трансформатора по 160 кВА
+        self.assertEqual(sizing.size([(63, 2), (25, 4)]).transformer,
+                         Transformer.objects.get(name='2ТМГ-160').pk)
+
+    def test_catalog_version(self):
+        sizing.size([(16, 1)])
+        with self.assertNumQueries(0):
+            sizing.size([(16, 1)] * 500)
+        self.t100.power = 630
+        self.t100.save()
+        self.assertEqual(sizing.size([(100, 7)]).transformer, self.t100.pk)
+
+    def test_check(self):
+        sections = [(63, 2, 25), (25, 4, None), (25, 2, 63)]
+        problems = sizing.check(sections, self.t100, self.lv[250])
+        self.assertEqual(len(problems), 4)
+        self.assertTrue(problems[0].startswith('Секция 2'))
+        self.assertTrue(problems[1].startswith('Секция 1'))
+        self.assertEqual(sizing.check(sections[2:], self.t100, self.lv[250]), [])
+
+    def test_api_and_admin(self):
+        data = self.client.get('/api/sizing/', {'denomination': [63, 25], 'count': [2, 4]}).json()
+        self.assertEqual(data['transformer']['id'], self.t250.pk)
+        self.assertEqual(data['lv_device']['input_denomination'], 250)
+        self.assertEqual([section['fider']['id'] for section in data['sections']],
+                         [self.f63.pk, self.f25.pk])
+        self.assertEqual(self.client.get('/api/sizing/', {'denomination': 63}).status_code, 400)
+        order = Order.objects.create(
+            client=Client.objects.create(full_name='Иванов', organization='ООО',
+                                         email='a@example.com', phone_number='+79131234567'),
+            transformer=self.t100, lv_device=self.lv[250], documentation='orders/o.pdf',
+        )
+        order.sections.create(fider=self.f25, denomination=63, count=2)
+        self.assertEqual(len(sizing.check_order(order)), 1)
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+        response = self.client.get(f'/admin/calc/order/{order.pk}/change/')
+        self.assertContains(response, 'Секция 1: ток фидера 25 А')
+
+
+class SnapshotTests(TestCase):
+    """Общие снимки массивов каталога"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(override_settings(CATALOG_SNAPSHOT_ROOT=self.root))
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return {'values': np.arange(10) * self.builds}
+
+    def test_shared_between_processes(self):
+        worker = snapshots.SnapshotCache()
+        arrays = worker.get('test', self.build)
+        self.assertIsInstance(arrays['values'], np.memmap)
+        self.assertIs(worker.get('test', self.build), arrays)
+        # Другой процесс открывает готовый снимок без расчета и запросов
+        with self.assertNumQueries(0):
+            other = snapshots.SnapshotCache().get('test', self.build)
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(other['values'].tolist(), list(range(10)))
+        with self.assertRaises(ValueError):
+            other['values'][0] = 1
+        catalog.bump_catalog_version()
+        self.assertEqual(worker.get('test', self.build)['values'][1], 2)
+        self.assertEqual(self.builds, 2)
+
+    @override_settings(CATALOG_SNAPSHOT_KEEP=1, CATALOG_SNAPSHOT_ENTRIES=1)
+    def test_eviction(self):
+        worker = snapshots.SnapshotCache()
+        first = worker.get('first', self.build)
+        worker.get('second', self.build)
+        self.assertIsNot(worker.get('first', self.build), first)
+        self.assertEqual(self.builds, 2)
+        old = catalog.catalog_version()
+        catalog.bump_catalog_version()
+        worker.get('first', self.build)
+        self.assertEqual(os.listdir(self.root), [str(catalog.catalog_version())])
+        self.assertFalse(os.path.exists(os.path.join(self.root, str(old))))
+
+    def test_pruned_before_open(self):
+        # Снимок удаляет prune другого процесса сразу после записи
+        with mock.patch.object(snapshots, 'prune',
+                               lambda root, version: shutil.rmtree(root / str(version))), \
+                self.assertLogs('calc.snapshots', 'WARNING'):
+            arrays = snapshots.SnapshotCache().get('test', self.build)
+        self.assertEqual(arrays['values'].tolist(), list(range(10)))
+        self.assertEqual(self.builds, 1)
+
+    def test_concurrent_publish(self):
+        path = snapshots.snapshot_root() / 'race' / 'test'
+        snapshots.publish(path.parent.parent, path, {'values': np.arange(3)})
+        snapshots.publish(path.parent.parent, path, {'values': np.arange(5)})
+        self.assertEqual(np.load(path / 'values.npy').tolist(), [0, 1, 2])
+        self.assertEqual(sorted(os.listdir(self.root)), ['race'])
+
+    @override_settings(CATALOG_SNAPSHOT_ROOT=None)
+    def test_disabled(self):
+        arrays = snapshots.SnapshotCache().get('test', self.build)
+        self.assertNotIsInstance(arrays['values'], np.memmap)
+        self.assertEqual(os.listdir(self.root), [])
+
+
+class GenerateDataTests(TestCase):
+    """Синтетические данные команды generate_data"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def generate(self, **options):
+        call_command('generate_data', products=20, orders=300, batch_size=64, seed=1,
+                     stdout=io.StringIO(), **options)
+        return list(Order.objects.order_by('pk').values_list(
+            'create_date', 'confirmed', 'transformer__name', 'total_price', 'client__email'
+        ))
+
+    def test_generate(self):
+        orders = self.generate()
+        self.assertEqual(len(orders), 300)
+        self.assertEqual(Transformer.objects.count(), 20)
+        self.assertEqual(Client.objects.count(), 60)
+        self.assertTrue(all(20 <= power <= 630 for power in
+                            Transformer.objects.values_list('power', flat=True)))
+        # Фидер рассчитан на ток линии, линия - не больше номинала ввода
+        self.assertFalse(Section.objects.filter(fider__amperage__lt=F('denomination')).exists())
+        self.assertFalse(Section.objects.filter(
+            denomination__gt=F('lv_device__input_denomination')).exists())
+        # Устройство ВН рассчитано на напряжение трансформатора
+        self.assertFalse(Order.objects.exclude(
+            hv_device__voltage=F('transformer__voltage')).exists())
+        dates = [order[0] for order in orders]
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreater(dates[-1] - dates[0], datetime.timedelta(days=365))
+        # Снимок цен совпадает с рассчитанным по каталогу
+        Order.objects.all().refresh_prices()
+        for before, after in zip(orders, self.snapshot()):
+            self.assertAlmostEqual(before[3], after, places=6)
+        confirmed = sum(order[1] for order in orders)
+        self.assertEqual(sum(SalesSummary.objects.filter(dimension='total').values_list(
+            'volume', flat=True)), confirmed)
+        lv_device = LowVoltageDevice.objects.first()
+        self.assertTrue(lv_device.documentation.storage.exists(lv_device.documentation.name))
+        self.assertTrue(lv_device.documentation.open().read().startswith(b'%PDF'))
+        with self.assertRaises(CommandError):
+            self.generate()
+
+    def snapshot(self):
+        return Order.objects.order_by('pk').values_list('total_price', flat=True)
+
+    def test_deterministic(self):
+        first = self.generate()
+        Order.objects.all().delete()
+        Client.objects.all().delete()
+        for _, model, _ in seeding.CATALOG_COLUMNS:
+            model.objects.all().delete()
+        self.assertEqual(self.generate(), first)
+
+
+class MatchingTests(TestCase):
+    """Подбор трансформатора и устройства ВН по индексу calc.matching"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.transformers = {
+            (power, price): Transformer.objects.create(
+                name=f'ТМГ-{power}-{price}', manufacturer='Завод', price=price, power=power,
+                voltage=10, count=1, transformer_type='ТМГ', connection_scheme='У/У',
+                documentation='documentation/transformers/t.pdf',
+            )
+            for power, price in ((100, 10), (250, 30), (250, 20), (400, 40))
+        }
+        cls.params = {'transformer_type': 'ТМГ', 'connection_scheme': 'У/У', 'voltage': 10}
+
+    def setUp(self):
+        # Откат транзакции теста не доходит до индекса
+        matching.transformers.invalidate()
+        matching.hv_devices.invalidate()
+
+    def pk(self, power, price):
+        return self.transformers[power, price].pk
+
+    def test_nearest(self):
+        nearest = matching.transformers.nearest
+        self.assertEqual(nearest(**self.params, power=250), (250, self.pk(250, 20)))
+        # Ближайшая большая мощность, самый дешевый вариант
+        self.assertEqual(nearest(**self.params, power=160), (250, self.pk(250, 20)))
+        self.assertEqual(nearest(**self.params, power=20), (100, self.pk(100, 10)))
+        self.assertIsNone(nearest(**self.params, power=630))
+        self.assertIsNone(nearest(**dict(self.params, transformer_type='Сухой'), power=100))
+        # Трансформатор другого напряжения не подходит
+        self.assertIsNone(nearest(**dict(self.params, voltage=6), power=100))
+        with self.assertRaises(ValueError):
+            nearest(power=100)
+
+    def test_match(self):
+        self.assertEqual(matching.transformers.match(**self.params, power=250),
+                         [self.pk(250, 20), self.pk(250, 30)])
+        self.assertEqual(matching.transformers.match(**self.params, power=160), [])
+        device = HighVoltageDevice.objects.create(
+            name='УВН', manufacturer='Завод', price=1, voltage=10,
+            documentation='documentation/hv_devices/hv.pdf',
+        )
+        params = {name: getattr(device, name) for name in matching.hv_devices.key_fields}
+        self.assertEqual(matching.hv_devices.match(**params), [device.pk])
+
+    def test_signals(self):
+        nearest = matching.transformers.nearest
+        nearest(**self.params, power=100)
+        with self.assertNumQueries(0):
+            nearest(**self.params, power=100)
+        cheap = self.transformers[250, 20]
+        cheap.power = 630
+        cheap.save()
+        self.assertEqual(nearest(**self.params, power=160), (250, self.pk(250, 30)))
+        self.assertEqual(nearest(**self.params, power=500), (630, cheap.pk))
+        created = Transformer.objects.create(
+            name='ТМГ-160', manufacturer='Завод', price=5, power=160, voltage=10, count=1,
+            transformer_type='ТМГ', connection_scheme='У/У',
+            documentation='documentation/transformers/t.pdf',
+        )
+        self.assertEqual(nearest(**self.params, power=101), (160, created.pk))
+        created.delete()
+        self.assertEqual(nearest(**self.params, power=101), (250, self.pk(250, 30)))
+        # Изменение в обход сигналов обнаруживается по версии каталога
+        Transformer.objects.filter(pk=self.pk(400, 40)).update(power=300)
+        catalog.bump_catalog_version()
+        self.assertEqual(nearest(**self.params, power=260), (300, self.pk(400, 40)))
+
+    def test_other_models_keep_index(self):
+        hv_params = {'input_type': 1, 'voltage': 10, 'arrester': 2, 'equipment_type': 0,
+                     'connection_type': 0}
+        matching.transformers.nearest(**self.params, power=100)
+        matching.hv_devices.match(**hv_params)
+        # Изменения других моделей каталога не перестраивают индексы
+        Fiders.objects.create(name='Фидер', manufacturer='Завод', price=1, amperage=16,
+                              documentation='documentation/fiders/f.pdf')
+        cheap = self.transformers[100, 10]
+        cheap.price = 5
+        cheap.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(matching.transformers.nearest(**self.params, power=100),
+                             (100, cheap.pk))
+            self.assertEqual(matching.hv_devices.match(**hv_params), [])
+
+
+class QuoteTests(TestCase):
+    """Расчет цены комплектации /api/quote/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        ComlexTransformerSubstation.objects.create(
+            name='КТП', manufacturer='Завод', price=1000,
+            documentation='documentation/substations/ktp.pdf',
+        )
+        cls.transformers = {
+            (power, voltage): Transformer.objects.create(
+                name=f'ТМГ-{power}/{voltage}', manufacturer='Завод', price=power,
+                power=power, voltage=voltage, count=1, transformer_type='ТМГ',
+                connection_scheme='У/У', documentation='documentation/transformers/t.pdf',
+            )
+            for power, voltage in ((100, 6), (250, 10))
+        }
+        cls.hv_device = HighVoltageDevice.objects.create(
+            name='УВН', manufacturer='Завод', price=50, voltage=10,
+            documentation='documentation/hv_devices/hv.pdf',
+        )
+        LowVoltageDevice.objects.create(
+            name='РУНН', manufacturer='Завод', price=200, voltage=400,
+            documentation='documentation/ll_devices/lv.pdf',
+        )
+        cls.params = {'transformer_type': 'ТМГ', 'connection_scheme': 'У/У', 'power': 100,
+                      **{name: getattr(cls.hv_device, name)
+                         for name in matching.hv_devices.key_fields}}
+
+    def setUp(self):
+        # Откат транзакции теста не возвращает версию каталога
+        catalog.bump_catalog_version()
+
+    def test_nearest_compatible_transformer(self):
+        # Трансформатор 100 кВА рассчитан на 6 кВ, устройство ВН - на 10 кВ
+        response = self.client.get('/api/quote/', self.params)
+        self.assertEqual(response.status_code, 200)
+        items = {item['category']: item['id'] for item in response.json()['items']}
+        self.assertEqual(items['transformer'], self.transformers[250, 10].pk)
+        self.assertEqual(items['hv_device'], self.hv_device.pk)
+        self.assertEqual(response.json()['total'], 1000 + 250 + 50 + 200)
+        self.assertEqual(self.client.get('/api/quote/', dict(self.params, power=400)).status_code,
+                         404)
+
+    def test_conditional(self):
+        response = self.client.get('/api/quote/', self.params)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/quote/', self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Другие параметры и изменение каталога дают другой ETag
+        self.assertNotEqual(self.client.get('/api/quote/', dict(self.params, power=250))['ETag'],
+                            etag)
+        self.hv_device.price = 60
+        self.hv_device.save()
+        response = self.client.get('/api/quote/', self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total'], 1000 + 250 + 60 + 200)
+
+
+class ConfiguratorSchemaTests(TestCase):
+    """Кеш HTML-фрагмента конфигуратора calc.schema"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.transformer = Transformer.objects.create(
+            name='ТМГ-400', manufacturer='Завод', price=1, power=400, voltage=10, count=1,
+            transformer_type='ТМГ', connection_scheme='У/У',
+            documentation='documentation/transformers/t.pdf',
+        )
+
+    def setUp(self):
+        cache.delete(schema.FRAGMENT_KEY)
+        catalog.bump_catalog_version()
+
+    def test_cached(self):
+        html = schema.configurator_fragment()
+        self.assertIn('max="400"', html)
+        with self.assertNumQueries(0), \
+                mock.patch.object(schema, 'render_to_string') as render:
+            self.assertEqual(schema.configurator_fragment(), html)
+        render.assert_not_called()
+
+    def test_rebuilt_after_catalog_change(self):
+        schema.configurator_fragment()
+        self.transformer.power = 630
+        self.transformer.save()
+        self.assertIn('max="630"', schema.configurator_fragment())
+
+    def test_rebuilt_after_build_assets(self):
+        html = schema.configurator_fragment()
+        # Новая сборка статики - новые имена файлов в фрагменте
+        with mock.patch.object(assets, 'manifest_version', return_value='rebuilt'), \
+                mock.patch.object(schema, 'render_to_string', return_value='new') as render:
+            self.assertEqual(schema.configurator_fragment(), 'new')
+            self.assertEqual(schema.configurator_fragment(), 'new')
+        render.assert_called_once()
+        self.assertEqual(schema.configurator_fragment(), html)
+
+
+class PricingTests(TestCase):
+    """Двухэтапный отбор комплектаций calc.pricing против полного перебора"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(products=7, orders=0, seed=3)
+
+    def brute_force(self, catalog, requirements):
+        items = {name: [row for row in array if all(
+            row[lookup.partition('__')[0]] >= value if lookup.endswith('__gte')
+            else row[lookup] == value
+            for lookup, value in requirements.get(name, {}).items()
+        )] for name, array in catalog.items()}
+        totals = {}
+        for substation in items['substation']:
+            for transformer in items['transformer']:
+                for hv_device in items['hv_device']:
+                    if transformer['voltage'] != hv_device['voltage']:
+                        continue
+                    for lv_device in items['lv_device']:
+                        key = tuple(int(row['pk']) for row in
+                                    (substation, transformer, hv_device, lv_device))
+                        totals[key] = float(substation['total'] + transformer['total']
+                                            + hv_device['total'] + lv_device['total'])
+        return totals
+
+    def test_matches_brute_force(self):
+        catalog = pricing.load_catalog()
+        for requirements in ({}, {'transformer': {'power__gte': 160}},
+                             {'hv_device': {'voltage': 6}}):
+            totals = self.brute_force(catalog, requirements)
+            for limit in (1, 5, 40):
+                found = pricing.cheapest_configurations(requirements, limit, catalog=catalog)
+                expected = sorted(totals.values())[:limit]
+                self.assertEqual(len(found), len(expected))
+                for configuration, total in zip(found, expected):
+                    self.assertAlmostEqual(configuration.total, total, places=6)
+                    key = (configuration.substation, configuration.transformer,
+                           configuration.hv_device, configuration.lv_device)
+                    self.assertAlmostEqual(totals[key], configuration.total, places=6)
+                self.assertEqual(len(set(found)), len(found))
+
+    def test_empty(self):
+        catalog = pricing.load_catalog()
+        self.assertEqual(pricing.cheapest_configurations(
+            {'transformer': {'power__gte': 10000}}, catalog=catalog), [])
+        self.assertEqual(pricing.cheapest_configurations(limit=0, catalog=catalog), [])
+        with self.assertRaises(ValueError):
+            pricing.cheapest_configurations({'fider': {}}, catalog=catalog)
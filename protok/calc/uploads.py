@@ -0,0 +1,163 @@
+"""Загрузка файлов по частям с возможностью продолжения
+
+Клиент создает сессию (имя, размер и, по желанию, SHA-256 всего
+файла), затем отправляет части запросами PUT с заголовками
+Upload-Offset и X-Chunk-SHA256. Каждая часть сначала пишется во
+временный файл и проверяется, и только затем дописывается в буфер
+сессии, поэтому память на запрос не зависит от размера части.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Ошибка загрузки части файла"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_root():
+    return Path(getattr(settings, 'UPLOAD_BUFFER_ROOT', settings.BASE_DIR / 'uploads'))
+
+
+def max_file_size():
+    return getattr(settings, 'UPLOAD_MAX_FILE_SIZE', 2 * 1024 ** 3)
+
+
+def max_chunk_size():
+    return getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 ** 2)
+
+
+def buffer_path(session):
+    return upload_root() / f'{session.pk}.part'
+
+
+def start(filename, size, sha256=''):
+    """Создает сессию загрузки и пустой буфер на диске"""
+    if not 0 < size <= max_file_size():
+        raise UploadError('Недопустимый размер файла')
+    session = UploadSession.objects.create(
+        filename=os.path.basename(filename)[:254], size=size, sha256=sha256.lower()
+    )
+    upload_root().mkdir(parents=True, exist_ok=True)
+    buffer_path(session).touch()
+    return session
+
+
+def _file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(COPY_BUFFER_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def write_chunk(session, offset, stream, length, digest):
+    """Дописывает часть файла в буфер сессии, возвращает новое смещение
+
+    offset должен совпадать с текущим смещением сессии (иначе ошибка
+    409 - клиент должен запросить смещение и продолжить с него),
+    digest - SHA-256 содержимого части в шестнадцатеричном виде.
+    """
+    if session.completed:
+        raise UploadError('Загрузка уже завершена', status=409)
+    if offset != session.offset:
+        raise UploadError('Смещение не совпадает с сервером', status=409)
+    if not 0 < length <= min(max_chunk_size(), session.size - offset):
+        raise UploadError('Недопустимый размер части', status=413)
+
+    path = buffer_path(session)
+    chunk_path = path.with_name(f'{path.name}.{uuid.uuid4().hex}')
+    sha = hashlib.sha256()
+    received = 0
+    try:
+        with open(chunk_path, 'wb') as chunk:
+            while received < length:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - received))
+                if not data:
+                    break
+                sha.update(data)
+                chunk.write(data)
+                received += len(data)
+        if received != length:
+            raise UploadError('Часть получена не полностью')
+        if sha.hexdigest() != digest.lower():
+            raise UploadError('Контрольная сумма части не совпадает', status=422)
+
+        # Захватываем смещение условным UPDATE: из параллельных запросов
+        # с одинаковым смещением в буфер запишет только один.
+        new_offset = offset + length
+        claimed = UploadSession.objects.filter(
+            pk=session.pk, offset=offset, completed=False
+        ).update(offset=new_offset)
+        if not claimed:
+            raise UploadError('Смещение не совпадает с сервером', status=409)
+        try:
+            with open(path, 'r+b') as target, open(chunk_path, 'rb') as chunk:
+                target.seek(offset)
+                shutil.copyfileobj(chunk, target, COPY_BUFFER_SIZE)
+                target.truncate()
+        except OSError:
+            UploadSession.objects.filter(pk=session.pk).update(offset=offset)
+            raise
+    finally:
+        chunk_path.unlink(missing_ok=True)
+
+    session.offset = new_offset
+    if new_offset == session.size:
+        _complete(session)
+    return new_offset
+
+
+def _complete(session):
+    path = buffer_path(session)
+    if session.sha256 and _file_digest(path) != session.sha256:
+        UploadSession.objects.filter(pk=session.pk).update(offset=0)
+        session.offset = 0
+        with open(path, 'r+b') as target:
+            target.truncate(0)
+        raise UploadError('Контрольная сумма файла не совпадает, загрузка начата заново',
+                          status=422)
+    session.completed = True
+    session.save(update_fields=['completed'])
+
+
+def attach(session, field_file):
+    """Сохраняет собранный файл в поле модели и удаляет сессию
+
+    Сессия удаляется в текущей транзакции, а буфер - только после ее
+    фиксации: если сохранение заказа откатится, загрузку можно
+    использовать повторно.
+    """
+    path = buffer_path(session)
+    with transaction.atomic(savepoint=False):
+        with open(path, 'rb') as source:
+            field_file.save(session.filename, File(source), save=False)
+        session.delete()
+        transaction.on_commit(lambda: path.unlink(missing_ok=True))
+
+
+def purge_stale(max_age=timedelta(days=1)):
+    """Удаляет незавершенные и неиспользованные загрузки старше max_age"""
+    stale = UploadSession.objects.filter(created__lt=timezone.now() - max_age)
+    count = 0
+    for session in stale.iterator():
+        buffer_path(session).unlink(missing_ok=True)
+        session.delete()
+        count += 1
+    return count
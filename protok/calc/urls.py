@@ -4,6 +4,17 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('contacts/', views.contacts, name='contacts'),
+    path('api/quote/', views.quote, name='quote'),
+    path('api/search/', views.product_search, name='product_search'),
+    path('api/sizing/', views.load_sizing, name='load_sizing'),
     path('get_contact/', views.get_contact, name='get_contact'),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
     path('results/<int:pk_order>/', views.results, name='result'),
+    path('metrics', views.metrics, name='metrics'),
+    path('api/clients/<int:pk_client>/orders/', views.client_orders, name='client_orders'),
+    path('api/reports/sales/', views.sales_report, name='sales_report'),
+    path('results/<int:pk_order>/offer.pdf', views.order_offer, name='order_offer'),
+    path('results/<int:pk_order>/documentation.zip', views.documentation_bundle,
+         name='documentation_bundle'),
 ]
@@ -1,65 +1,417 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import datetime
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse,
+)
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from django.utils.cache import get_conditional_response, patch_cache_control
 from .forms import TransformerForm, HighVoltageDeviceForm, ClientForm, OrderForm
-from django.core.mail import send_mail, EmailMessage, get_connection
 from django.views.decorators.csrf import csrf_protect
-from .models import Order
-
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from .models import (
+    Client, ComlexTransformerSubstation, Fiders, LowVoltageDevice, Order, SalesSummary, Transformer,
+    UploadSession,
+)
+from . import (
+    bundles, catalog, changelist, instrumentation, offers, outbox, quotes, reports, result_pages,
+    schema, search, sizing, uploads,
+)
 
-def setname(obj, name):
-    obj.name = name
-    return obj
 
 def index(request):
-    forms = []
-    forms.append(setname(TransformerForm(), 'Трансформатор'))
-    forms[0].fields['power'].min_value = 20
-    forms[0].fields['power'].max_value = 630
-    forms.append(setname(HighVoltageDeviceForm(), 'ВН'))
-    forms[1].fields['voltage'].max_value = 10000
-    return render(request, 'calc/form.html', {'forms': forms, 'display_element': forms})
+    return render(request, 'calc/form.html', {'configurator': schema.configurator_fragment()})
+
+
+def _save_order(client, order):
+    with transaction.atomic():
+        order.instance.client = client.save()
+        # Данные известного клиента не перезаписываются, указанные в форме
+        # остаются в заказе
+        order.instance.full_name = client.cleaned_data['full_name']
+        order.instance.organization = client.cleaned_data['organization']
+        order = order.save()
+        # Письмо отправит команда send_outbox
+        outbox.enqueue_order_email(order)
+        transaction.on_commit(lambda: offers.prepare(order.pk))
+    return order
 
 
 @csrf_protect
-def get_contact(request):
+async def get_contact(request):
+    # Под ASGI поток занят только на время запросов к базе и записи
+    # файла, а не на все время обработки заказа
     if request.method == 'POST':
         client = ClientForm(request.POST)
         order = OrderForm(request.POST, request.FILES)
-        print(request.__dict__)
-        if client.is_valid():
-            print('Ohh')
-        else:
-            print(client.errors.as_data())
-        if order.is_valid():
-            print('Fuck')
-        else:
-            print(order.errors.as_data())
-        if not client.is_valid() or not order.is_valid():
+        # Поле upload проверяется запросом к базе
+        order_valid = await sync_to_async(order.is_valid)()
+        if not client.is_valid() or not order_valid:
             return render(request, 'calc/contacts.html', {'client': client, 'order': order})
-    return redirect(f'/result/{None}/', permanent=True)
+        document = order.cleaned_data.get('documentation')
+        if document:
+            # Запись в хранилище идет в пуле потоков, параллельно с
+            # другими запросами
+            await sync_to_async(order.instance.documentation.save, thread_sensitive=False)(
+                document.name, document, save=False
+            )
+        order = await sync_to_async(_save_order)(client, order)
+        return redirect('result', pk_order=order.pk)
+    return redirect('contacts')
+
+
+@require_GET
+def quote(request):
+    # ETag зависит только от версии каталога и параметров запроса, поэтому
+    # повторный расчет проверяется без обращения к базе данных
+    params = sorted(request.GET.lists())
+    etag = hashlib.sha1(repr((catalog.catalog_version(), params)).encode()).hexdigest()
+    etag = f'"{etag}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        transformer = TransformerForm(request.GET)
+        hv_device = HighVoltageDeviceForm(request.GET)
+        if not transformer.is_valid() or not hv_device.is_valid():
+            errors = dict(transformer.errors, **hv_device.errors)
+            return JsonResponse({'errors': errors}, status=400)
+        result = quotes.build_quote(transformer.cleaned_data, hv_device.cleaned_data,
+                                    request.GET.get('type_station'))
+        if result is None:
+            response = JsonResponse({'error': 'Подходящая комплектация не найдена'},
+                                    status=404)
+        else:
+            response = JsonResponse(result)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True,
+                        max_age=getattr(settings, 'QUOTE_CACHE_MAX_AGE', 60))
+    return response
+
+
+# Наибольшее число результатов поиска и длина запроса
+SEARCH_MAX_LIMIT = 50
+SEARCH_MAX_LENGTH = 200
 
 
-def contacts(request):
+@require_GET
+def product_search(request):
+    # Как и расчет цены, ответ зависит только от версии каталога и
+    # параметров запроса
+    params = sorted(request.GET.lists())
+    etag = hashlib.sha1(repr((catalog.catalog_version(), params)).encode()).hexdigest()
+    etag = f'"{etag}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = _product_search(request)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True,
+                        max_age=getattr(settings, 'SEARCH_CACHE_MAX_AGE', 60))
+    return response
+
+
+def _product_search(request):
+    models = {model._meta.model_name: model for model in search.MODELS}
+    category = request.GET.get('category')
+    if category and category not in models:
+        return JsonResponse({'errors': {'category': [f'Допустимые значения: {", ".join(models)}']}},
+                            status=400)
+    try:
+        limit = min(int(request.GET.get('limit', 20)), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'errors': {'limit': ['Введите целое число.']}}, status=400)
+    query = request.GET.get('q', '')[:SEARCH_MAX_LENGTH]
+    found = search.products.search(query, models=[models[category]] if category else None,
+                                   limit=limit)
+    return JsonResponse({'results': [
+        {'category': match.entry.model._meta.model_name, 'id': match.entry.pk,
+         'name': match.entry.name, 'manufacturer': match.entry.manufacturer,
+         'price': match.entry.price, 'score': round(match.score, 3)}
+        for match in found
+    ]})
+
+
+# Наибольшее число секций в запросе подбора
+SIZING_MAX_SECTIONS = 1000
+
+
+@require_GET
+def load_sizing(request):
+    # Подбор зависит только от версии каталога и параметров запроса
+    params = sorted(request.GET.lists())
+    etag = hashlib.sha1(repr((catalog.catalog_version(), params)).encode()).hexdigest()
+    etag = f'"{etag}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = _load_sizing(request)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True,
+                        max_age=getattr(settings, 'QUOTE_CACHE_MAX_AGE', 60))
+    return response
+
+
+def _load_sizing(request):
+    # Секции передаются парами denomination=<ток линии>&count=<число линий>
+    try:
+        denominations = [int(value) for value in request.GET.getlist('denomination')]
+        counts = [int(value) for value in request.GET.getlist('count')]
+        voltage = int(request.GET.get('voltage', sizing.LV_VOLTAGE))
+    except ValueError:
+        return JsonResponse({'error': 'Параметры должны быть целыми числами'}, status=400)
+    if len(denominations) != len(counts) or not denominations:
+        return JsonResponse({'error': 'Для каждой секции укажите denomination и count'},
+                            status=400)
+    if len(denominations) > SIZING_MAX_SECTIONS:
+        return JsonResponse({'error': f'Не больше {SIZING_MAX_SECTIONS} секций'}, status=400)
+    if min(denominations + counts) < 0 or voltage <= 0:
+        return JsonResponse({'error': 'Параметры не могут быть отрицательными'}, status=400)
+    transformer = {name: request.GET[name] for name in ('transformer_type', 'connection_scheme')
+                   if request.GET.get(name)}
+    sections = list(zip(denominations, counts))
+    result = sizing.size(sections, voltage, {'transformer': transformer})
+    fiders = Fiders.objects.in_bulk({pk for pk in result.fiders if pk is not None})
+    transformer = Transformer.objects.filter(pk=result.transformer).first()
+    lv_device = LowVoltageDevice.objects.filter(pk=result.lv_device).first()
+    return JsonResponse({
+        'current': round(result.load.current, 1),
+        'power': round(result.load.power, 1),
+        'transformer': transformer and {
+            'id': transformer.pk, 'name': transformer.name, 'power': transformer.power,
+            'count': transformer.count, 'price': transformer.price,
+        },
+        'lv_device': lv_device and {
+            'id': lv_device.pk, 'name': lv_device.name,
+            'input_denomination': lv_device.input_denomination, 'price': lv_device.price,
+        },
+        'sections': [
+            {'denomination': denomination, 'count': count, 'fider': fider and {
+                'id': fider.pk, 'name': fider.name, 'amperage': fider.amperage,
+                'price': fider.price,
+            }}
+            for (denomination, count), fider in zip(
+                sections, (fiders.get(pk) for pk in result.fiders)
+            )
+        ],
+    })
+
+
+async def contacts(request):
     client = ClientForm()
     order = OrderForm()
     return render(request, 'calc/contacts.html', {'client': client, 'order': order})
 
 
-def results(request, pk_order):
-    order = get_object_or_404(Order, pk=pk_order)
-    return render(request, 'calc/results.html', {'order': order, 'client': order.client})
+async def results(request, pk_order):
+    html = await result_pages.cached_page(pk_order)
+    if html is None:
+        version = await catalog.acatalog_version()
+        order = await aget_object_or_404(
+            Order.objects.select_related('client'), pk=pk_order
+        )
+        html = result_pages.render_page(order)
+        await result_pages.store_page(order, html, version)
+    return HttpResponse(html)
+
 
+def documentation_bundle(request, pk_order):
+    order = get_object_or_404(
+        Order.objects.select_related('substation', 'transformer', 'hv_device', 'lv_device'),
+        pk=pk_order
+    )
+    entries = bundles.bundle_entries(order)
+    key = bundles.bundle_key(entries)
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        filename = f'order_{order.pk}_documentation.zip'
+        path = bundles.cached_bundle(key)
+        if path is not None:
+            response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
+        else:
+            response = StreamingHttpResponse(
+                bundles.stream_bundle(entries, key), content_type='application/zip'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-def send_email(order_id):
-    order = Order.objects.get(pk=order_id)
-    # email.attach([order.path for order in order.documentation_assembling()])
-    with get_connection() as connection:
-        email = EmailMessage(  # C8.fnjAnL7iAACw
-            'Hello',
-            'From your mom gay',
-            "a4dmindjango@yandex.ru",
-            [order.client.email],
-            [],
-            connection=connection
-        )
-        print(f'Почта ={order.client.email}')
-        email.send()
+
+def order_offer(request, pk_order):
+    order = get_object_or_404(
+        Order.objects.select_related(
+            'client', 'substation', 'transformer', 'hv_device', 'lv_device'
+        ),
+        pk=pk_order
+    )
+    content = offers.offer_content(order)
+    key = offers.offer_key(content)
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        path = offers.stored_offer(order.pk, key)
+        if path is None:
+            if offers.failed(order.pk, key):
+                response = render(request, 'calc/offer_failed.html', {'order': order},
+                                  status=500)
+                patch_cache_control(response, no_store=True)
+                return response
+            # PDF рисуется в фоне, страница ожидания обновляется сама
+            offers.schedule(order.pk, key, content)
+            response = render(request, 'calc/offer_pending.html', {'order': order},
+                              status=202)
+            response['Retry-After'] = '2'
+            patch_cache_control(response, no_store=True)
+            return response
+        response = FileResponse(open(path, 'rb'), as_attachment=True,
+                                filename=f'order_{order.pk}_offer.pdf')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _upload_state(session):
+    return {'id': str(session.pk), 'offset': session.offset,
+            'size': session.size, 'completed': session.completed}
+
+
+@require_POST
+def upload_start(request):
+    try:
+        size = int(request.POST.get('size', ''))
+        session = uploads.start(request.POST.get('filename', ''), size,
+                                request.POST.get('sha256', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Не указан размер файла'}, status=400)
+    except uploads.UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse(_upload_state(session), status=201)
+
+
+@require_http_methods(['GET', 'HEAD', 'PUT'])
+def upload_chunk(request, upload_id):
+    session = get_object_or_404(UploadSession, pk=upload_id)
+    if request.method == 'PUT':
+        started = time.perf_counter()
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+            uploads.write_chunk(
+                session,
+                offset=int(request.headers.get('Upload-Offset', -1)),
+                stream=request,
+                length=length,
+                digest=request.headers.get('X-Chunk-SHA256', ''),
+            )
+            instrumentation.record_upload(length, time.perf_counter() - started)
+        except ValueError:
+            return JsonResponse({'error': 'Некорректные заголовки'}, status=400)
+        except uploads.UploadError as error:
+            session.refresh_from_db()
+            return JsonResponse(dict(_upload_state(session), error=str(error)),
+                                status=error.status)
+    return JsonResponse(_upload_state(session))
+
+
+# История заказов клиента: новые заказы первыми, страница продолжается
+# после заказа из параметра after (<дата>_<номер>)
+HISTORY_ORDERING = (('create_date', True), ('id', True))
+HISTORY_FIELDS = ('id', 'create_date', 'confirmed', 'substation_price', 'transformer_price',
+                  'hv_device_price', 'lv_device_price', 'sections_price', 'total_price')
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def _history_cursor(value):
+    date, _, pk = value.rpartition('_')
+    return {'create_date': datetime.date.fromisoformat(date), 'id': int(pk)}
+
+
+@require_GET
+def client_orders(request, pk_client):
+    # Данные клиентов видны только сотрудникам
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    client = Client.objects.filter(pk=pk_client).values(
+        'id', 'full_name', 'organization', 'email', 'phone_number'
+    ).first()
+    if client is None:
+        return JsonResponse({'error': 'Клиент не найден'}, status=404)
+    try:
+        limit = int(request.GET.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'errors': {'limit': ['Введите целое число.']}}, status=400)
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    # Сортировка совпадает с индексом (client, create_date, id), поэтому
+    # страница читается из индекса при любом числе заказов клиента
+    orders = Order.objects.filter(client=pk_client).order_by(
+        *(f'-{name}' for name, _ in HISTORY_ORDERING)
+    )
+    after = request.GET.get('after')
+    if after:
+        try:
+            cursor = _history_cursor(after)
+        except ValueError:
+            return JsonResponse({'errors': {'after': ['Неверная позиция.']}}, status=400)
+        orders = orders.filter(changelist.keyset_condition(HISTORY_ORDERING, cursor,
+                                                           forward=True))
+    page = list(orders.values(*HISTORY_FIELDS)[:limit + 1])
+    next_url = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        params = request.GET.copy()
+        params['after'] = f'{last["create_date"].isoformat()}_{last["id"]}'
+        next_url = f'{request.path}?{params.urlencode()}'
+    client['phone_number'] = str(client['phone_number'])
+    return JsonResponse({'client': client, 'orders': page, 'next': next_url})
+
+
+def _month(value):
+    return datetime.date.fromisoformat(f'{value}-01')
+
+
+@require_GET
+def sales_report(request):
+    # Отчет читает только сводку calc.reports, а не заказы
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    dimensions = SalesSummary.Dimensions
+    dimension = request.GET.get('dimension', dimensions.TOTAL)
+    if dimension not in dimensions.values:
+        return JsonResponse({'errors': {'dimension': [
+            f'Допустимые значения: {", ".join(dimensions.values)}'
+        ]}}, status=400)
+    months = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        try:
+            months[name] = _month(value) if value else None
+        except ValueError:
+            return JsonResponse({'errors': {name: ['Укажите месяц в формате ГГГГ-ММ.']}},
+                                status=400)
+    labels = {}
+    if dimension == dimensions.TYPE_STATION:
+        labels = dict(ComlexTransformerSubstation.ComlexTransformerSubstationType.choices)
+    rows = [
+        {'month': row['month'].strftime('%Y-%m'), 'key': row['key'],
+         'label': labels.get(row['key'], row['key']),
+         'volume': row['volume'], 'revenue': row['revenue']}
+        for row in reports.report(dimension, **months)
+    ]
+    return JsonResponse({'dimension': dimension, 'rows': rows})
+
+
+@require_GET
+def metrics(request):
+    # Без METRICS_TOKEN метрики видны только сотрудникам
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(instrumentation.expose(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'protok.settings')
 
+# Оформление заказа, результаты и контакты - асинхронные представления;
+# под ASGI-сервером (например, uvicorn protok.asgi:application) медленные
+# клиенты не занимают рабочие потоки. Замер: manage.py benchmark_asgi
+
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'calc.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +57,7 @@ ROOT_URLCONF = 'protok.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'calc.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,10 +80,12 @@ WSGI_APPLICATION = 'protok.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+SQLITE_PATH = Path(os.environ.get('PROTOK_SQLITE_PATH', BASE_DIR / 'db.sqlite3'))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': SQLITE_PATH,
         # 'ENGINE': 'django.db.backends.postgresql',
         # 'NAME': '',
         # 'USER': '',
@@ -91,6 +95,94 @@ DATABASES = {
     }
 }
 
+# Профиль базы данных: development (по умолчанию), production (SQLite в
+# режиме WAL с постоянными соединениями) или postgresql. В обоих
+# боевых профилях чтение каталога уходит на реплику (calc.routers).
+DATABASE_PROFILE = os.environ.get('PROTOK_DATABASE_PROFILE', 'development')
+
+if DATABASE_PROFILE == 'production':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': 20,
+                # Запись сразу берет блокировку, поэтому параллельные
+                # транзакции ждут busy_timeout, а не падают при попытке
+                # повысить блокировку с чтения до записи
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # Применяются calc.db.configure_sqlite при открытии соединения
+            'PRAGMAS': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 20000,
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -64000,
+                'temp_store': 'MEMORY',
+            },
+        },
+        # Тот же файл только для чтения: в режиме WAL читатели не
+        # блокируют писателей и не ждут их
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'file:{SQLITE_PATH}?mode=ro',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'uri': True, 'timeout': 20},
+            'PRAGMAS': {
+                'busy_timeout': 20000,
+                'mmap_size': 256 * 1024 * 1024,
+                'query_only': 1,
+            },
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+elif DATABASE_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PROTOK_DB_NAME', 'protok'),
+            'USER': os.environ.get('PROTOK_DB_USER', ''),
+            'PASSWORD': os.environ.get('PROTOK_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PROTOK_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('PROTOK_DB_PORT', '5432'),
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+        },
+    }
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        HOST=os.environ.get('PROTOK_DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['calc.routers.CatalogReplicaRouter']
+
+# Кеш должен быть общим для всех процессов сервера: в нем хранится
+# версия каталога (calc.catalog), по которой процессы сбрасывают
+# вычисленные данные и открывают снимки каталога (calc.snapshots). При
+# разработке хватает кеша в памяти процесса. Профилю postgresql нужна
+# таблица кеша: manage.py createcachetable.
+if DATABASE_PROFILE == 'production':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+elif DATABASE_PROFILE == 'postgresql':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'calc_cache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -128,10 +220,44 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
-STATIC_ROOT = 'static'
+STATIC_ROOT = BASE_DIR / 'static'
 
 STATIC_URL = '/static/'
 
+# Статика собирается командой build_assets (calc.assets): имена с хешем
+# содержимого, варианты изображений из ASSET_BUILD_ROOT, сжатые копии
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'calc.assets.AssetStorage'},
+}
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    'calc.assets.BuildFinder',
+]
+ASSET_BUILD_ROOT = BASE_DIR / 'build'
+
+# Первым стоит обработчик, измеряющий прием файлов (calc.instrumentation)
+FILE_UPLOAD_HANDLERS = [
+    'calc.instrumentation.TimingUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Коммерческие предложения в PDF (calc.offers)
+OFFER_ROOT = BASE_DIR / 'offers'
+OFFER_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+OFFER_WORKERS = 2
+OFFER_RETRY_SECONDS = 300
+# Рисовать предложение сразу после оформления заказа
+OFFER_PREPARE = True
+
+# Снимки массивов каталога, общие для процессов сервера (calc.snapshots)
+CATALOG_SNAPSHOT_ROOT = BASE_DIR / 'snapshots'
+
+# Токен Prometheus для /metrics; без него метрики видны только сотрудникам
+METRICS_TOKEN = os.environ.get('PROTOK_METRICS_TOKEN')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -13,10 +13,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+from calc import assets
+
 urlpatterns = [
     path('', include('calc.urls')),
     path('admin/', admin.site.urls),
+    # Собранная статика (build_assets); при DEBUG ее раньше перехватывает
+    # runserver
+    path(settings.STATIC_URL.lstrip('/') + '<path:path>', assets.serve),
 ]